@@ -1,8 +1,162 @@
-import google.generativeai as genai
 import os
+import json
+import hashlib
+import threading
 from dotenv import load_dotenv
+from cache import SQLiteCache, CACHE_DIR
+from generate_abstractions.tools.tools import count_tokens
+from metrics import span, increment
+from context_cache import create_context_cache
+from llm_providers import create_provider, LLM_PROVIDER
+from llm_client import create_client
 
 load_dotenv()
 
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-model = genai.GenerativeModel(model_name="gemini-2.5-flash-preview-04-17")
\ No newline at end of file
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-preview-04-17")
+# Cheap, mechanical calls (JSON fix-ups) go to this model; empty uses MODEL_NAME for everything.
+FAST_MODEL_NAME = os.getenv("LLM_FAST_MODEL") or MODEL_NAME
+
+
+class CachedResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+# Synchronous front of the async client used by the graph nodes: response cache, shared prompt
+# prefixes and model routing live here, retries, deadlines, hedging and rate limits in the client.
+class CachingModel:
+    def __init__(self, client, model_name: str, cache: SQLiteCache = None, bypass: bool = False, context_cache=None,
+                 fast_model_name: str = None):
+        self.client = client
+        self.model_name = model_name
+        self.fast_model_name = fast_model_name or model_name
+        self.cache = cache
+        self.bypass = bypass
+        self.context_cache = context_cache
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def share_prefix(self, prefix: str):
+        if self.context_cache is not None:
+            self.context_cache.share(prefix)
+
+    def release_prefix(self, prefix: str):
+        if self.context_cache is not None:
+            self.context_cache.release(prefix)
+
+    def route(self, fast: bool = False) -> str:
+        return self.fast_model_name if fast else self.model_name
+
+    def target(self, prompt: str, prefix: str = None, model_name: str = None):
+        # A shared prefix registered with the context cache is not sent again; otherwise it goes inline.
+        # Cached prefixes belong to the main model, so routed calls always send theirs in full.
+        if prefix and self.context_cache is not None and model_name in (None, self.model_name):
+            handle = self.context_cache.handle_for(prefix)
+            if handle is not None:
+                return self.context_cache.request_for(handle, prompt)
+        return (prefix or "") + prompt, None
+
+    def cache_key(self, prompt: str, generation_config=None, model_name: str = None) -> str:
+        payload = json.dumps([model_name or self.model_name, prompt, generation_config], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def record_call(self, call: dict, model_name: str, prompt: str, text: str):
+        if call is None:
+            return
+        call['prompt_tokens'] = count_tokens(prompt)
+        call['completion_tokens'] = count_tokens(text)
+        increment("llm_prompt_tokens", call['prompt_tokens'], model=model_name)
+        increment("llm_completion_tokens", call['completion_tokens'], model=model_name)
+
+    def call_model(self, prompt: str, generation_config=None, prefix: str = None, fast: bool = False, deadline: float = None) -> str:
+        model_name = self.route(fast)
+        full_prompt = (prefix or "") + prompt
+        with span("llm_call", model=model_name, mode="generate") as call:
+            sent_prompt, cached_content = self.target(prompt, prefix, model_name)
+            text = self.client.generate_sync(model_name, sent_prompt, count_tokens(full_prompt), generation_config=generation_config,
+                                             cached_content=cached_content, deadline=deadline)
+            self.record_call(call, model_name, full_prompt, text)
+        self.client.charge(count_tokens(text))
+        return text
+
+    def generate_content(self, prompt: str, generation_config=None, prefix: str = None, fast: bool = False, deadline: float = None):
+        # prefix + prompt is the full prompt; prefix is the part shared with other calls.
+        if self.cache is None:
+            return CachedResponse(self.call_model(prompt, generation_config, prefix, fast, deadline))
+
+        key = self.cache_key((prefix or "") + prompt, generation_config, self.route(fast))
+        if not self.bypass:
+            cached = self.cache.get(key)
+            if cached is not None:
+                with self._lock:
+                    self.hits += 1
+                increment("llm_cache_hits", model=self.route(fast))
+                return CachedResponse(cached.decode('utf-8'))
+
+        with self._lock:
+            self.misses += 1
+        text = self.call_model(prompt, generation_config, prefix, fast, deadline)
+        # Bypassed calls still refresh the stored entry so the next cached run sees the fresh output.
+        self.cache.set(key, text.encode('utf-8'))
+        return CachedResponse(text)
+
+    def stream_content(self, prompt: str, generation_config=None, prefix: str = None, deadline: float = None):
+        full_prompt = (prefix or "") + prompt
+        key = self.cache_key(full_prompt, generation_config)
+        if self.cache is not None and not self.bypass:
+            cached = self.cache.get(key)
+            if cached is not None:
+                with self._lock:
+                    self.hits += 1
+                increment("llm_cache_hits", model=self.model_name)
+                yield cached.decode('utf-8')
+                return
+
+        with self._lock:
+            self.misses += 1
+        parts = []
+        with span("llm_call", model=self.model_name, mode="stream") as call:
+            sent_prompt, cached_content = self.target(prompt, prefix)
+            for text in self.client.stream_sync(self.model_name, sent_prompt, count_tokens(full_prompt), generation_config=generation_config,
+                                                cached_content=cached_content, deadline=deadline):
+                parts.append(text)
+                yield text
+            self.record_call(call, self.model_name, full_prompt, "".join(parts))
+        self.client.charge(count_tokens("".join(parts)))
+        if self.cache is not None:
+            self.cache.set(key, "".join(parts).encode('utf-8'))
+
+    def discard(self, prompt: str, generation_config=None, prefix: str = None, fast: bool = False):
+        if self.cache is not None:
+            self.cache.delete(self.cache_key((prefix or "") + prompt, generation_config, self.route(fast)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "budget_wait": self.client.limiter.waited,
+                "client": dict(self.client.stats),
+                "context_cache": self.context_cache.stats() if self.context_cache is not None else None,
+            }
+
+
+def create_response_cache():
+    if os.getenv("LLM_CACHE", "1") == "0":
+        return None
+    max_bytes = int(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+    ttl = float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600 or None
+    return SQLiteCache(os.path.join(CACHE_DIR, "llm_responses.sqlite3"), max_bytes, ttl=ttl)
+
+
+model = CachingModel(
+    create_client(create_provider()),
+    MODEL_NAME,
+    cache=create_response_cache(),
+    bypass=os.getenv("LLM_CACHE_BYPASS", "0") == "1",
+    context_cache=create_context_cache(MODEL_NAME, LLM_PROVIDER),
+    fast_model_name=FAST_MODEL_NAME,
+)
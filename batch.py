@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import time
+import concurrent.futures
+from dotenv import load_dotenv
+from main import stream_workflow
+from checkpoint import latest_checkpoint_commit
+from metrics import write_run_report
+from LLM import model
+from generate_abstractions.tools.github_client import get_http_stats
+from generate_chapters.tools.chapter_writer import repo_output_dir
+
+load_dotenv()
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", "out")
+
+
+def run_repo(token: str, repo: str, output_dir: str, incremental: bool, resume: bool = False) -> dict:
+    report = {"repo": repo, "output_dir": output_dir, "status": "failed", "error": None, "nodes": {}, "chapters": 0}
+    started = time.monotonic()
+    last_node_end = 0.0
+    try:
+        for event in stream_workflow(token, repo, incremental, output_dir, resume and latest_checkpoint_commit(repo) is not None):
+            if event["event"] == "node_completed":
+                report["nodes"][event["node"]] = round(event["elapsed"] - last_node_end, 3)
+                last_node_end = event["elapsed"]
+            elif event["event"] == "chapter_saved":
+                report["chapters"] += 1
+        report["status"] = "ok"
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+        print(f"Batch run failed for {repo}: {report['error']}")
+    report["elapsed"] = round(time.monotonic() - started, 3)
+    return report
+
+def run_batch(repos: list, token: str = None, output_root: str = None, concurrency: int = None, incremental: bool = True, resume: bool = False) -> dict:
+    output_root = output_root or BATCH_OUTPUT_DIR
+    concurrency = concurrency or BATCH_CONCURRENCY
+    token = token or os.getenv("GITHUB_TOKEN")
+    os.makedirs(output_root, exist_ok=True)
+    started = time.monotonic()
+
+    # Repositories share this process's GitHub connection pool, fetch pool and LLM budget.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_repo, token, repo, repo_output_dir(output_root, repo), incremental, resume) for repo in repos]
+        reports = [future.result() for future in futures]
+
+    batch_report = {
+        "elapsed": round(time.monotonic() - started, 3),
+        "succeeded": sum(1 for report in reports if report["status"] == "ok"),
+        "failed": sum(1 for report in reports if report["status"] != "ok"),
+        "llm": model.stats(),
+        "http": get_http_stats(),
+        "repos": reports,
+    }
+    batch_report["metrics"] = write_run_report("batch", output_root)
+    report_path = os.path.join(output_root, "batch_report.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(batch_report, f, indent=2)
+    return batch_report
+
+def read_repo_list(path: str) -> list:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+if __name__ == "__main__":
+    # python batch.py [--resume] repos.txt, or python batch.py [--resume] owner/repo owner/other-repo
+    resume = "--resume" in sys.argv
+    arguments = [argument for argument in sys.argv[1:] if argument != "--resume"]
+    if len(arguments) == 1 and os.path.isfile(arguments[0]):
+        arguments = read_repo_list(arguments[0])
+    if not arguments:
+        raise ValueError("No repositories given. Pass a file with one repository per line or the repositories themselves.")
+    result = run_batch(arguments, resume=resume)
+    print(f"{result['succeeded']} succeeded, {result['failed']} failed in {result['elapsed']}s")
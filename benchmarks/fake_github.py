@@ -0,0 +1,134 @@
+import io
+import json
+import base64
+import hashlib
+import tarfile
+import threading
+import http.server
+from urllib.parse import urlparse, unquote
+
+# Like the real Contents API, larger files come back as metadata without inline content.
+CONTENTS_INLINE_MAX_BYTES = 1024 * 1024
+RAW_MEDIA_TYPE = "application/vnd.github.raw"
+
+
+def blob_sha(data: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+# Local stand-in for the repository, commit, tree, tarball, Contents and Blobs endpoints.
+class FakeGitHub:
+    def __init__(self, port: int = 0):
+        self.repos = {}
+        self.counts = {}
+        self._archives = {}
+        self._lock = threading.Lock()
+        handler = type("Handler", (FakeGitHubHandler,), {"github": self})
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_repository(self, repo: str, files: dict):
+        encoded = {path: content if isinstance(content, bytes) else content.encode('utf-8') for path, content in files.items()}
+        commit_sha = hashlib.sha1(json.dumps(sorted((path, blob_sha(data)) for path, data in encoded.items())).encode('utf-8')).hexdigest()
+        with self._lock:
+            self.repos[repo] = {"files": encoded, "commit_sha": commit_sha}
+            self._archives.pop(repo, None)
+
+    def count(self, kind: str):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def tree(self, repo: str) -> dict:
+        files = self.repos[repo]["files"]
+        directories = {"/".join(path.split("/")[:depth]) for path in files for depth in range(1, path.count("/") + 1)}
+        tree = [{"path": path, "type": "blob", "sha": blob_sha(data), "size": len(data)} for path, data in files.items()]
+        tree += [{"path": directory, "type": "tree", "sha": hashlib.sha1(directory.encode('utf-8')).hexdigest()} for directory in directories]
+        tree.sort(key=lambda item: item["path"])
+        return {"sha": self.repos[repo]["commit_sha"], "tree": tree, "truncated": False}
+
+    def archive(self, repo: str) -> bytes:
+        with self._lock:
+            if repo not in self._archives:
+                buffer = io.BytesIO()
+                prefix = repo.replace("/", "-") + "-" + self.repos[repo]["commit_sha"][:7]
+                with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+                    for path, data in self.repos[repo]["files"].items():
+                        info = tarfile.TarInfo(f"{prefix}/{path}")
+                        info.size = len(data)
+                        archive.addfile(info, io.BytesIO(data))
+                self._archives[repo] = buffer.getvalue()
+            return self._archives[repo]
+
+
+class FakeGitHubHandler(http.server.BaseHTTPRequestHandler):
+    github = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status: int, body: bytes, content_type: str = "application/json"):
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            self.github.count("not_modified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("X-RateLimit-Remaining", "5000")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, value, status: int = 200):
+        self.send_body(status, json.dumps(value).encode('utf-8'))
+
+    def do_GET(self):
+        parts = unquote(urlparse(self.path).path).strip("/").split("/")
+        if len(parts) < 3 or parts[0] != "repos":
+            return self.send_json({"message": "Not Found"}, 404)
+        repo = f"{parts[1]}/{parts[2]}"
+        if repo not in self.github.repos:
+            return self.send_json({"message": "Not Found"}, 404)
+        rest = parts[3:]
+        kind = rest[0] if rest else "repo"
+        self.github.count(kind)
+        data = self.github.repos[repo]
+        if not rest:
+            return self.send_json({"name": parts[2], "full_name": repo, "default_branch": "main"})
+        if kind == "commits":
+            return self.send_json({"sha": data["commit_sha"]})
+        if kind == "git" and len(rest) > 1 and rest[1] == "trees":
+            return self.send_json(self.github.tree(repo))
+        if kind == "tarball":
+            return self.send_body(200, self.github.archive(repo), "application/x-gzip")
+        if kind == "git" and len(rest) > 2 and rest[1] == "blobs":
+            blobs = {blob_sha(content): content for content in data["files"].values()}
+            if rest[2] in blobs:
+                return self.send_file(rest[2], blobs[rest[2]])
+        if kind == "contents":
+            path = "/".join(rest[1:])
+            if path in data["files"]:
+                return self.send_file(path, data["files"][path])
+        return self.send_json({"message": "Not Found"}, 404)
+
+    def send_file(self, path: str, content: bytes):
+        if self.headers.get("Accept") == RAW_MEDIA_TYPE:
+            return self.send_body(200, content, "application/octet-stream")
+        metadata = {"path": path, "type": "file", "sha": blob_sha(content), "size": len(content)}
+        if len(content) > CONTENTS_INLINE_MAX_BYTES:
+            return self.send_json({**metadata, "encoding": "none", "content": ""})
+        return self.send_json({**metadata, "encoding": "base64", "content": base64.b64encode(content).decode('ascii')})
@@ -0,0 +1,152 @@
+import re
+import json
+import time
+import hashlib
+import threading
+from json_repair import extract_json
+
+CHAPTER_PATTERN = re.compile(r'about the concept: "([^"]+)"')
+CONTEXT_FILE_PATTERN = re.compile(r'^=== (.+) ===$', re.MULTILINE)
+REFERENCE_PATTERN = re.compile(r'refer to (?:them|it) as ([^\]]+)\]')
+COMBINE_PATTERN = re.compile(r'Here are the individual abstractions from different chunks:\n([\s\S]*?)\n\nYour task:')
+MAX_CHUNKS = 5
+ABSTRACTIONS_PER_CALL = 4
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+# Deterministic stand-in for the Gemini model: canned JSON for every prompt the workflow sends,
+# a fixed latency per call and a reproducible share of malformed responses.
+class FakeModel:
+    def __init__(self, latency: float = 0.0, malformed_rate: float = 0.0, stream_chunk_size: int = 400, seed: int = 7):
+        self.latency = latency
+        self.malformed_rate = malformed_rate
+        self.stream_chunk_size = stream_chunk_size
+        self.seed = seed
+        self.calls = {}
+        self.malformed = 0
+        self._originals = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}
+            self.malformed = 0
+
+    def total_calls(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def record(self, kind: str):
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+
+    def should_malform(self, prompt: str) -> bool:
+        if not self.malformed_rate:
+            return False
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode('utf-8')).digest()
+        return int.from_bytes(digest[:4], "big") / 2 ** 32 < self.malformed_rate
+
+    def malform(self, text: str, prompt: str) -> str:
+        broken = self.break_json(text, prompt)
+        with self._lock:
+            self.malformed += 1
+            # The workflow sends only the JSON part of a bad response to the fixer.
+            self._originals[extract_json(broken).strip()] = text
+        return broken
+
+    def break_json(self, text: str, prompt: str) -> str:
+        # Cycle through the breakages seen from real models: prose around the value, a
+        # trailing comma, a truncated response and single quotes.
+        variant = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest(), 16) % 4
+        if variant == 0:
+            return f"Sure! Here is the JSON you asked for:\n{text}\nLet me know if you need anything else."
+        if variant == 1:
+            return text.rstrip()[:-1].rstrip() + ",\n" + text.rstrip()[-1]
+        if variant == 2:
+            return text[:max(len(text) * 3 // 4, 1)]
+        return text.replace('"', "'")
+
+    def chunks_response(self, prompt: str) -> str:
+        structure = prompt.split("REAL Project Structure:\n", 1)[-1]
+        chunks = {}
+        path_stack = []
+        for line in structure.splitlines():
+            if not line.strip():
+                continue
+            depth = (len(line) - len(line.lstrip(' '))) // 2
+            name = line.strip()
+            reference = REFERENCE_PATTERN.search(name)
+            if reference:
+                # Collapsed files and folded folders are answered with the reference the structure gives.
+                path_stack[depth:] = [name.split('/', 1)[0]] if name.endswith(']') and '/  [' in name else []
+                path = reference.group(1)
+            else:
+                path_stack[depth:] = [name.rstrip('/')]
+                if name.endswith('/') or name.endswith('.md'):
+                    continue
+                path = "/".join(path_stack)
+            top = path.split('/', 1)[0] if '/' in path else "root"
+            chunks.setdefault(top, []).append(path)
+        # The prompt asks for at most five chunks; extra top-level folders are folded into the last one.
+        names = sorted(chunks)
+        result = {name: chunks[name] for name in names[:MAX_CHUNKS - 1]}
+        if len(names) >= MAX_CHUNKS:
+            result[names[MAX_CHUNKS - 1]] = [path for name in names[MAX_CHUNKS - 1:] for path in chunks[name]]
+        return json.dumps(result)
+
+    def abstractions_response(self, prompt: str) -> str:
+        paths = CONTEXT_FILE_PATTERN.findall(prompt)
+        groups = [paths[i::ABSTRACTIONS_PER_CALL] for i in range(min(ABSTRACTIONS_PER_CALL, len(paths)))]
+        # Every abstractions prompt opens with the same shared instructions; the project line tells them apart.
+        project = prompt.split("For the project", 1)[-1][:200]
+        prefix = hashlib.sha256(project.encode('utf-8')).hexdigest()[:6]
+        abstractions = [{
+            "name": f"Component {prefix}-{i + 1}",
+            "description": f"Groups {len(group)} related files, like a department in a company that owns one job.",
+            "file_paths": group[:8],
+        } for i, group in enumerate(groups)]
+        return "```json\n" + json.dumps(abstractions, indent=2) + "\n```"
+
+    def combine_response(self, prompt: str) -> str:
+        match = COMBINE_PATTERN.search(prompt)
+        abstractions = json.loads(match.group(1)) if match else []
+        return "```json\n" + json.dumps(abstractions[:8], indent=2) + "\n```"
+
+    def chapter_response(self, prompt: str) -> str:
+        match = CHAPTER_PATTERN.search(prompt)
+        name = match.group(1) if match else "Unknown"
+        paragraph = f"The {name} abstraction keeps related work in one place. " * 12
+        markdown = f"# {name}\n\n{paragraph}\n\n```python\nprint('{name}')\n```\n\nIn conclusion, {name} ties these files together."
+        return json.dumps({"markdown_content": markdown, "summary": f"Explains {name} and how its files cooperate."})
+
+    def respond(self, prompt: str) -> tuple[str, str]:
+        if prompt.startswith("You are a JSON fixer"):
+            # Fix-up requests get the original value back, never another malformed one.
+            value = re.search(r'Input:\n([\s\S]*)$', prompt)
+            broken = value.group(1).strip() if value else ""
+            with self._lock:
+                return "fix", self._originals.get(broken, broken)
+        if CHAPTER_PATTERN.search(prompt):
+            return "chapter", self.chapter_response(prompt)
+        if "REAL Project Structure:" in prompt:
+            return "chunks", self.chunks_response(prompt)
+        if "individual abstractions from different chunks" in prompt:
+            return "combine", self.combine_response(prompt)
+        if "Codebase Context:" in prompt:
+            return "abstractions", self.abstractions_response(prompt)
+        raise ValueError(f"Fake model got a prompt it does not recognise: {prompt[:80]!r}")
+
+    def generate_content(self, prompt: str, generation_config=None, stream: bool = False, **kwargs):
+        kind, text = self.respond(prompt)
+        self.record(kind)
+        if kind != "fix" and self.should_malform(prompt):
+            text = self.malform(text, prompt)
+        if self.latency:
+            time.sleep(self.latency)
+        if stream:
+            return [FakeResponse(text[i:i + self.stream_chunk_size]) for i in range(0, len(text), self.stream_chunk_size)]
+        return FakeResponse(text)
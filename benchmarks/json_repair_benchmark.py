@@ -0,0 +1,89 @@
+import os
+import re
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_repair import loads_tolerant
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "json_corpus.json")
+EXPECTATIONS = {
+    "chunks": (dict, ()),
+    "abstractions": (list, ()),
+    "chapter": (dict, ("markdown_content", "summary")),
+}
+
+
+def legacy_sanitize_json_response(response_text: str) -> str:
+    # The extractor the nodes used before json_repair, kept here as the baseline.
+    response_text = response_text.strip()
+    matches = re.findall(r'```(?:json)?\s*([\s\S]*?)```', response_text)
+    if matches:
+        response_text = matches[0].strip()
+    elif response_text.startswith('{') and response_text.endswith('}'):
+        pass
+    else:
+        content_matches = re.findall(r'({[\s\S]*?})', response_text)
+        if content_matches:
+            response_text = content_matches[0].strip()
+    return response_text
+
+def legacy_sanitize_chapter_json_response(response_text: str) -> str:
+    response_text = response_text.strip()
+    start_idx = response_text.find('{')
+    if start_idx == -1:
+        return response_text
+    brace_count = 0
+    for i in range(start_idx, len(response_text)):
+        if response_text[i] == '{':
+            brace_count += 1
+        elif response_text[i] == '}':
+            brace_count -= 1
+            if brace_count == 0:
+                return response_text[start_idx:i + 1]
+    return response_text
+
+def legacy_parse(kind: str, response_text: str):
+    sanitize = legacy_sanitize_chapter_json_response if kind == "chapter" else legacy_sanitize_json_response
+    return json.loads(sanitize(response_text))
+
+def accepted(kind: str, value) -> bool:
+    expected_type, required_keys = EXPECTATIONS[kind]
+    if not isinstance(value, expected_type):
+        return False
+    return all(key in value for key in required_keys)
+
+def run(parse, cases, repeat: int):
+    successes = {}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for case in cases:
+            try:
+                value = parse(case)
+                successes[case["name"]] = accepted(case["kind"], value)
+            except (json.JSONDecodeError, ValueError):
+                successes[case["name"]] = False
+    elapsed = time.perf_counter() - start
+    return successes, elapsed / (repeat * len(cases))
+
+def main():
+    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+        cases = json.load(f)
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    legacy, legacy_time = run(lambda case: legacy_parse(case["kind"], case["response"]), cases, repeat)
+    tolerant, tolerant_time = run(lambda case: loads_tolerant(case["response"], *EXPECTATIONS[case["kind"]]), cases, repeat)
+
+    print(f"{'case':40s} {'legacy':>8s} {'tolerant':>9s}")
+    for case in cases:
+        name = case["name"]
+        print(f"{name:40s} {'ok' if legacy[name] else 'FAIL':>8s} {'ok' if tolerant[name] else 'FAIL':>9s}")
+    print()
+    print(f"parsed locally: legacy {sum(legacy.values())}/{len(cases)}, tolerant {sum(tolerant.values())}/{len(cases)}")
+    print(f"LLM repair round-trips avoided per run of this corpus: {sum(tolerant.values()) - sum(legacy.values())}")
+    print(f"mean time per response: legacy {legacy_time * 1e6:.1f} us, tolerant {tolerant_time * 1e6:.1f} us")
+
+if __name__ == "__main__":
+    main()
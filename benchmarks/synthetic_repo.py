@@ -0,0 +1,79 @@
+import os
+import random
+
+TOP_LEVEL_DIRS = ["src", "lib", "app", "services", "api", "models", "utils", "tests"]
+EXTENSIONS = [".py", ".py", ".js", ".ts", ".md"]
+PYTHON_TEMPLATE = '''import os
+from {module} import {name}Base
+
+
+class {name}({name}Base):
+    """Handles {topic} for request number {n}."""
+
+    def __init__(self, config):
+        self.config = config
+        self.items = []
+
+    def process_{topic}(self, request):
+        values = [value * {n} for value in request.values if value % 3 == 0]
+        self.items.extend(values)
+        return {{"status": 200, "count": len(values)}}
+
+
+def build_{topic}(config):
+    return {name}(config)
+'''
+JS_TEMPLATE = '''import {{ {name}Base }} from "./{module}";
+
+export class {name} extends {name}Base {{
+  constructor(config) {{
+    super(config);
+    this.items = [];
+  }}
+
+  process{name}(request) {{
+    const values = request.values.filter((value) => value % 3 === 0).map((value) => value * {n});
+    this.items.push(...values);
+    return {{ status: 200, count: values.length }};
+  }}
+}}
+
+export function build{name}(config) {{
+  return new {name}(config);
+}}
+'''
+MARKDOWN_TEMPLATE = "# {name}\n\nNotes about {topic} handling, revision {n}.\n"
+TOPICS = ["auth", "billing", "search", "cache", "routing", "storage", "events", "reports", "users", "sessions"]
+
+
+def generate_repository(file_count: int, seed: int = 7) -> dict:
+    # Deterministic for a given size and seed, with directory depth growing with the file count.
+    rng = random.Random(f"{seed}:{file_count}")
+    files = {}
+    files_per_dir = 40
+    while len(files) < file_count:
+        index = len(files)
+        top = TOP_LEVEL_DIRS[index % len(TOP_LEVEL_DIRS)]
+        group = index // (files_per_dir * len(TOP_LEVEL_DIRS))
+        sub_dirs = [f"pkg{group // 25}", f"mod{group % 25}"] if file_count > 2000 else ([f"mod{group}"] if group else [])
+        extension = rng.choice(EXTENSIONS)
+        topic = rng.choice(TOPICS)
+        name = f"{topic.title()}Handler{index}"
+        path = "/".join([top, *sub_dirs, f"{topic}_{index}{extension}"])
+        fields = {"name": name, "topic": topic, "module": f"{topic}_base", "n": rng.randint(1, 10000)}
+        if extension == ".py":
+            content = PYTHON_TEMPLATE.format(**fields)
+        elif extension == ".md":
+            content = MARKDOWN_TEMPLATE.format(**fields)
+        else:
+            content = JS_TEMPLATE.format(**fields)
+        files[path] = content * rng.randint(1, 4)
+    return files
+
+def write_repository(files: dict, root: str) -> str:
+    for path, content in files.items():
+        full_path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+    return root
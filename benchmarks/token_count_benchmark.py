@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_abstractions.tools import tools
+from generate_abstractions.tools.tools import estimate_tokens, count_tokens_batch, count_tokens_per_chunk, get_encoding
+
+
+def synthetic_corpus(file_count: int, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    samples = {
+        "code": "def handle_{n}(request, *args, **kwargs):\n    if not request.user.is_authenticated:\n        return {{'status': 401, 'error': 'unauthorized'}}\n    items = [x ** 2 for x in range({n}) if x % 3 == 0]\n    return {{'status': 200, 'items': items}}\n\n",
+        "minified": "function f{n}(a,b){{return a.map(function(x){{return x*b+{n}}}).filter(Boolean).reduce(function(s,v){{return s+v}},0)}};",
+        "prose": "This module is responsible for loading configuration values and validating them before the service starts number {n}.\n",
+        "non_ascii": "# 設定ファイルを読み込み、値を検証します {n}\nnombre_de_la_función = 'configuración inválida' # ошибка конфигурации\n",
+    }
+    corpus = {}
+    for i in range(file_count):
+        kind = rng.choice(list(samples))
+        corpus[f"{kind}/file_{i}.txt"] = "".join(samples[kind].format(n=rng.randint(1, 10000)) for _ in range(rng.randint(5, 80)))
+    return corpus
+
+def directory_corpus(root: str, limit: int) -> dict:
+    corpus = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.') and d != 'node_modules']
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    corpus[os.path.relpath(path, root)] = f.read()
+            except (UnicodeDecodeError, OSError):
+                continue
+            if len(corpus) >= limit:
+                return corpus
+    return corpus
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the len/4 token heuristic against the tokenizer-backed counter.")
+    parser.add_argument("--path", help="count files under this directory instead of a synthetic corpus")
+    parser.add_argument("--files", type=int, default=2000)
+    args = parser.parse_args()
+
+    corpus = directory_corpus(args.path, args.files) if args.path else synthetic_corpus(args.files)
+    texts = list(corpus.values())
+    total_bytes = sum(len(text.encode('utf-8')) for text in texts)
+    if get_encoding() is None:
+        print("tiktoken encoding unavailable; nothing to compare against.")
+        return
+
+    estimates, heuristic_time = timed(lambda items: [estimate_tokens(text) for text in items], texts)
+    tools._token_counts.clear()
+    exact, cold_time = timed(count_tokens_batch, texts)
+    _, warm_time = timed(count_tokens_batch, texts)
+    _, chunk_time = timed(count_tokens_per_chunk, {"all": corpus})
+
+    by_kind = {}
+    for path, estimate, actual in zip(corpus, estimates, exact):
+        if actual:
+            by_kind.setdefault(path.split('/')[0] if not args.path else os.path.splitext(path)[1] or "(none)", []).append(abs(estimate - actual) / actual)
+
+    megabytes = total_bytes / (1024 * 1024)
+    print(f"files: {len(texts)}  size: {megabytes:.2f} MB  tokens: {sum(exact)}  heuristic: {sum(estimates)}")
+    print(f"total error of heuristic: {abs(sum(estimates) - sum(exact)) / max(sum(exact), 1):.1%}")
+    for kind, errors in sorted(by_kind.items()):
+        print(f"  mean per-file error [{kind}]: {sum(errors) / len(errors):.1%} over {len(errors)} files")
+    print(f"heuristic:        {heuristic_time * 1000:8.1f} ms  ({megabytes / max(heuristic_time, 1e-9):8.1f} MB/s)")
+    print(f"tokenizer (cold): {cold_time * 1000:8.1f} ms  ({megabytes / max(cold_time, 1e-9):8.1f} MB/s)")
+    print(f"tokenizer (warm): {warm_time * 1000:8.1f} ms  ({megabytes / max(warm_time, 1e-9):8.1f} MB/s)")
+    print(f"count_tokens_per_chunk (warm): {chunk_time * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
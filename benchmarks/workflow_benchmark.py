@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+# Everything the workflow reads at import time has to point at the stand-ins before it is imported.
+WORK_DIR = tempfile.mkdtemp(prefix="codedecoded-bench-")
+os.environ["CODEDECODED_CACHE_DIR"] = os.path.join(WORK_DIR, "cache")
+os.environ.setdefault("GEMINI_API_KEY", "offline")
+for name in ("LLM_CACHE", "BLOB_CACHE", "GITHUB_ETAG_CACHE", "CHECKPOINTS"):
+    os.environ.setdefault(name, "0")
+# Shared prompt prefixes go through the in-process stand-in instead of the provider's cache.
+os.environ.setdefault("CONTEXT_CACHE", "local")
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+from synthetic_repo import generate_repository, write_repository
+from fake_github import FakeGitHub
+from fake_llm import FakeModel
+from llm_providers import FakeProvider
+
+github = FakeGitHub().start()
+os.environ["GITHUB_API_URL"] = github.url
+
+import LLM
+import main
+from generate_abstractions.tools.tools import count_tokens_per_chunk, map_chunks_to_files, get_unique_file_paths
+from generate_chapters.tools.tools import map_content_to_abstractions
+from json_repair import extract_json
+from generate_abstractions.tools.github_client import get_http_stats
+
+
+def timed(func, *args, repeat: int = 1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    return result, (time.perf_counter() - start) / repeat
+
+def run_workflow_once(repo: str, fake: FakeModel, trace_memory: bool) -> dict:
+    fake.reset()
+    github.counts.clear()
+    context_before = LLM.model.context_cache.stats() if LLM.model.context_cache is not None else {}
+    client_before = dict(LLM.model.client.stats)
+    http_before = get_http_stats()['requests']
+    stages = {}
+    last = 0.0
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    state = None
+    for event in main.stream_workflow(token="offline", repo=repo, incremental=False, output_dir=os.path.join(WORK_DIR, "out", repo.replace('/', '__'))):
+        if event["event"] == "node_completed":
+            stages[event["node"]] = event["elapsed"] - last
+            last = event["elapsed"]
+        elif event["event"] == "workflow_completed":
+            state = event["state"]
+    total = time.perf_counter() - started
+    context_after = LLM.model.context_cache.stats() if LLM.model.context_cache is not None else {}
+    peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    if trace_memory:
+        tracemalloc.stop()
+    return {
+        "total_seconds": total,
+        "stages": stages,
+        "files_fetched": len(state['file_contents']),
+        "files_per_second": len(state['file_contents']) / total if total else 0.0,
+        "chapters": len(state['summary']),
+        "llm_calls": dict(fake.calls),
+        "malformed_responses": fake.malformed,
+        "github_requests": dict(github.counts),
+        "http_requests": get_http_stats()['requests'] - http_before,
+        "context_cache": {name: value - context_before.get(name, 0) for name, value in context_after.items()},
+        "llm_client": {name: value - client_before[name] for name, value in LLM.model.client.stats.items()},
+        "peak_traced_bytes": peak_memory,
+        "state": state,
+    }
+
+def run_tool_benchmarks(state: dict, repeat: int) -> dict:
+    chunks = state['chunks']
+    file_contents = state['file_contents']
+    chunks_with_contents, map_time = timed(map_chunks_to_files, chunks, file_contents, repeat=repeat)
+    _, unique_time = timed(get_unique_file_paths, chunks, repeat=repeat)
+    _, count_time = timed(count_tokens_per_chunk, chunks_with_contents, repeat=repeat)
+    _, context_time = timed(map_content_to_abstractions, file_contents, state['abstractions'], repeat=repeat)
+    fake = FakeModel()
+    chunk_response = fake.chunks_response("REAL Project Structure:\n" + "\n".join(sorted(file_contents)))
+    chapter_response = "Here you go:\n" + fake.chapter_response('about the concept: "Benchmark"')
+    _, sanitize_time = timed(extract_json, "```json\n" + chunk_response + "\n```", repeat=repeat)
+    _, chapter_sanitize_time = timed(extract_json, chapter_response, repeat=repeat)
+    return {
+        "map_chunks_to_files": map_time,
+        "get_unique_file_paths": unique_time,
+        "count_tokens_per_chunk": count_time,
+        "map_content_to_abstractions": context_time,
+        "extract_json (fenced)": sanitize_time,
+        "extract_json (chapter)": chapter_sanitize_time,
+    }
+
+def print_result(size: int, source: str, result: dict, tool_times: dict):
+    print(f"\n== {size} files ({source}) ==")
+    print(f"total: {result['total_seconds'] * 1000:9.1f} ms   files/s: {result['files_per_second']:9.1f}   chapters: {result['chapters']}")
+    for stage, seconds in result['stages'].items():
+        print(f"  {stage:<28} {seconds * 1000:9.1f} ms")
+    print(f"  llm calls: {result['llm_calls']}  malformed: {result['malformed_responses']}")
+    print(f"  llm client: {result['llm_client']}")
+    print(f"  github requests: {result['github_requests']}")
+    if result['context_cache']:
+        print(f"  shared prefix reused: {result['context_cache']['reused_calls']} calls, {result['context_cache']['reused_tokens']} tokens")
+    if result['peak_traced_bytes'] is not None:
+        print(f"  peak traced memory: {result['peak_traced_bytes'] / (1024 * 1024):.1f} MB")
+    for tool, seconds in tool_times.items():
+        print(f"  {tool:<34} {seconds * 1000:9.3f} ms")
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="Run the full workflow offline against a fake model and a fake GitHub API.")
+    parser.add_argument("--sizes", default="10,100,1000", help="comma-separated synthetic repository sizes (up to 100000)")
+    parser.add_argument("--source", choices=["github", "local"], default="github")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake model call")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of fake model calls that fail with a transient error")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of fake model calls that take --slow-latency longer")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="extra seconds for the slow share of calls")
+    parser.add_argument("--hedge-after", type=float, help="send a duplicate request after this many seconds (overrides LLM_HEDGE_AFTER_SECONDS)")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of model responses returned as broken JSON")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions for the individual tool timings")
+    parser.add_argument("--trace-memory", action="store_true", help="measure peak Python allocations (slows the run down)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    fake = FakeModel(malformed_rate=args.malformed_rate)
+    LLM.model.client.provider = FakeProvider(fake, latency=args.latency, failure_rate=args.failure_rate,
+                                             slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+    if args.hedge_after is not None:
+        LLM.model.client.hedge_after = args.hedge_after
+    results = []
+    try:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            files = generate_repository(size)
+            if args.source == "local":
+                repo = write_repository(files, os.path.join(WORK_DIR, "repos", f"repo-{size}"))
+            else:
+                repo = f"bench/repo-{size}"
+                github.add_repository(repo, files)
+                # Build the tarball up front so its compression is not counted as fetch time.
+                github.archive(repo)
+            result = run_workflow_once(repo, fake, args.trace_memory)
+            tool_times = run_tool_benchmarks(result.pop("state"), args.repeat)
+            print_result(size, args.source, result, tool_times)
+            results.append({"size": size, "source": args.source, **result, "tools": tool_times})
+    finally:
+        github.stop()
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main_benchmark()
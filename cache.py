@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = os.path.expanduser(os.getenv("CODEDECODED_CACHE_DIR", os.path.join("~", ".cache", "codedecoded")))
+
+
+class SQLiteCache:
+    def __init__(self, path: str, max_bytes: int, ttl: float = None):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL, "
+            "created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list) -> dict:
+        found = {}
+        keys = list(keys)
+        now = time.time()
+        oldest = now - self.ttl if self.ttl else 0
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders}) AND created >= ?", batch + [oldest]
+                ).fetchall()
+                found.update({key: bytes(value) for key, value in rows})
+            if found:
+                self._conn.executemany(
+                    "UPDATE entries SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+                )
+        return found
+
+    def has_many(self, keys) -> set:
+        keys = list(keys)
+        oldest = time.time() - self.ttl if self.ttl else 0
+        found = set()
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key FROM entries WHERE key IN ({placeholders}) AND created >= ?", batch + [oldest]
+                ).fetchall()
+                found.update(key for key, in rows)
+        return found
+
+    def set(self, key: str, value: bytes):
+        self.set_many({key: value})
+
+    def set_many(self, items: dict):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access, created) VALUES (?, ?, ?, ?, ?)",
+                [(key, value, len(value), now, now) for key, value in items.items()],
+            )
+            self._conn.execute("COMMIT")
+            self._evict()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _evict(self):
+        if self.ttl:
+            self._conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+        # Drop least recently used entries once the running total exceeds the size bound.
+        self._conn.execute(
+            "DELETE FROM entries WHERE key IN ("
+            "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_access DESC, key) AS running FROM entries) "
+            "WHERE running > ?)",
+            (self.max_bytes,),
+        )
+
+    def total_size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+
+_blob_cache = None
+_blob_cache_lock = threading.Lock()
+
+
+def get_blob_cache():
+    global _blob_cache
+    if os.getenv("BLOB_CACHE", "1") == "0":
+        return None
+    with _blob_cache_lock:
+        if _blob_cache is None:
+            max_bytes = int(os.getenv("BLOB_CACHE_MAX_MB", "512")) * 1024 * 1024
+            _blob_cache = SQLiteCache(os.path.join(CACHE_DIR, "blobs.sqlite3"), max_bytes)
+    return _blob_cache
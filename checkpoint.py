@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from cache import CACHE_DIR, get_blob_cache
+from events import get_event_writer
+from file_store import FileStore, open_file_store
+
+CHECKPOINT_PATH = os.path.join(CACHE_DIR, "checkpoints.sqlite3")
+CHECKPOINTS_ENABLED = os.getenv("CHECKPOINTS", "1") != "0"
+
+_conn = None
+_lock = threading.Lock()
+
+
+def get_connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(CHECKPOINT_PATH), exist_ok=True)
+        _conn = sqlite3.connect(CHECKPOINT_PATH, check_same_thread=False, isolation_level=None, timeout=30)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "repo TEXT NOT NULL, commit_sha TEXT NOT NULL, step TEXT NOT NULL, value BLOB NOT NULL, "
+            "updated REAL NOT NULL, PRIMARY KEY (repo, commit_sha, step))"
+        )
+    return _conn
+
+def save_checkpoint(repo: str, commit_sha: str, step: str, value):
+    if not CHECKPOINTS_ENABLED:
+        return
+    payload = zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+    with _lock:
+        get_connection().execute(
+            "INSERT OR REPLACE INTO checkpoints (repo, commit_sha, step, value, updated) VALUES (?, ?, ?, ?, ?)",
+            (repo, commit_sha, step, payload, time.time()),
+        )
+
+def load_checkpoints(repo: str, commit_sha: str, prefix: str = "") -> dict:
+    if not CHECKPOINTS_ENABLED:
+        return {}
+    with _lock:
+        rows = get_connection().execute(
+            "SELECT step, value FROM checkpoints WHERE repo = ? AND commit_sha = ? AND substr(step, 1, ?) = ?",
+            (repo, commit_sha, len(prefix), prefix),
+        ).fetchall()
+    return {step[len(prefix):]: json.loads(zlib.decompress(value).decode('utf-8')) for step, value in rows}
+
+def latest_checkpoint_commit(repo: str) -> str:
+    if not CHECKPOINTS_ENABLED:
+        return None
+    with _lock:
+        row = get_connection().execute(
+            "SELECT commit_sha FROM checkpoints WHERE repo = ? ORDER BY updated DESC LIMIT 1", (repo,)
+        ).fetchone()
+    return row[0] if row else None
+
+def clear_checkpoints(repo: str, commit_sha: str = None):
+    if not CHECKPOINTS_ENABLED:
+        return
+    with _lock:
+        if commit_sha is None:
+            get_connection().execute("DELETE FROM checkpoints WHERE repo = ?", (repo,))
+        else:
+            get_connection().execute("DELETE FROM checkpoints WHERE repo = ? AND commit_sha = ?", (repo, commit_sha))
+
+def encode_file_contents(file_contents: dict, file_shas: dict) -> dict:
+    if isinstance(file_contents, FileStore):
+        # The contents are already on disk, so the checkpoint only records where.
+        return {"store": file_contents.reference()}
+    # Files already in the blob cache are stored as their blob SHA; only the rest are kept inline.
+    file_shas = file_shas or {}
+    blob_cache = get_blob_cache()
+    cached_shas = blob_cache.has_many({file_shas[path] for path in file_contents if path in file_shas}) if blob_cache else set()
+    references = {path: file_shas[path] for path in file_contents if file_shas.get(path) in cached_shas}
+    inline = {path: content for path, content in file_contents.items() if path not in references}
+    return {"references": references, "inline": inline}
+
+def decode_file_contents(stored: dict) -> dict:
+    if 'store' in stored:
+        return open_file_store(stored['store'])
+    blob_cache = get_blob_cache()
+    references = stored['references']
+    blobs = blob_cache.get_many(set(references.values())) if blob_cache and references else {}
+    if any(sha not in blobs for sha in references.values()):
+        # Evicted since the checkpoint was written: the node has to run again.
+        return None
+    file_contents = {path: blobs[sha].decode('utf-8') for path, sha in references.items()}
+    file_contents.update(stored['inline'])
+    return file_contents
+
+def checkpointed(node_name: str, node):
+    def run_node(state: dict) -> dict:
+        repo = state['repo']
+        if state.get('resume') and state.get('commit_sha'):
+            stored = load_checkpoints(repo, state['commit_sha'], "node:").get(node_name)
+            if stored is not None and 'file_contents' in stored:
+                file_contents = decode_file_contents(stored['file_contents'])
+                stored = None if file_contents is None else {**stored, 'file_contents': file_contents}
+            if stored is not None:
+                get_event_writer()({"event": "node_restored", "node": node_name})
+                return stored
+
+        update = node(state)
+        commit_sha = update.get('commit_sha') or state.get('commit_sha')
+        if commit_sha:
+            stored = update
+            if 'file_contents' in update:
+                file_shas = update.get('file_shas') or state.get('file_shas')
+                stored = {**update, 'file_contents': encode_file_contents(update['file_contents'], file_shas)}
+            save_checkpoint(repo, commit_sha, "node:" + node_name, stored)
+        return update
+
+    run_node.__name__ = node_name
+    return run_node
@@ -0,0 +1,149 @@
+import os
+import time
+import datetime
+import threading
+from manifest import fingerprint
+from metrics import increment
+from generate_abstractions.tools.tools import count_tokens
+
+# Shared prompt prefixes (instructions, tutorial structure, shared code) are registered once per run
+# and reused by every call that starts with them. "gemini" uploads them as cached contents, "local"
+# keeps them in-process and sends them inline, "0" always sends the full prompt.
+CONTEXT_CACHE = os.getenv("CONTEXT_CACHE", "gemini")
+# The Gemini API refuses to cache contents below a per-model minimum; shorter prefixes are sent
+# inline without trying (not used by "local"). CONTEXT_CACHE_MIN_TOKENS overrides the table.
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS") or "0") or None
+# Matched by the longest model name prefix; unknown models get the default.
+GEMINI_CACHE_MIN_TOKENS = {
+    "gemini-1.5": 32768,
+    "gemini-2.0": 4096,
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-pro": 4096,
+    "gemini-3-flash": 1024,
+    "gemini-3-pro": 4096,
+}
+DEFAULT_CACHE_MIN_TOKENS = 4096
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+
+
+# Local stand-in: registration is free and the prefix still travels with every request, so it
+# exercises the same sharing, reuse and release path as a provider cache without a network.
+def cache_min_tokens(model_name: str) -> int:
+    name = model_name.split('/')[-1]
+    matches = [prefix for prefix in GEMINI_CACHE_MIN_TOKENS if name.startswith(prefix)]
+    return GEMINI_CACHE_MIN_TOKENS[max(matches, key=len)] if matches else DEFAULT_CACHE_MIN_TOKENS
+
+
+class ContextCache:
+    def __init__(self, min_tokens: int = None, ttl: float = None):
+        self.min_tokens = (CONTEXT_CACHE_MIN_TOKENS or DEFAULT_CACHE_MIN_TOKENS) if min_tokens is None else min_tokens
+        self.ttl = ttl
+        self.entries = {}
+        self.registrations = 0
+        self.reused_calls = 0
+        self.reused_tokens = 0
+        self._lock = threading.Lock()
+
+    def register(self, prefix: str):
+        return prefix
+
+    def request_for(self, handle, prompt: str) -> tuple:
+        # The prompt to send and the provider-side cached content to send it with.
+        return handle + prompt, None
+
+    def drop(self, handle):
+        pass
+
+    def share(self, prefix: str):
+        # Called by a node that is about to send several prompts starting with prefix.
+        key = fingerprint(prefix)
+        with self._lock:
+            entry = self.entries.setdefault(key, {"shares": 0, "handle": None, "registered": None, "tokens": None,
+                                                  "unusable": False, "lock": threading.Lock()})
+            entry['shares'] += 1
+
+    def release(self, prefix: str):
+        key = fingerprint(prefix)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+            entry['shares'] -= 1
+            if entry['shares'] > 0:
+                return
+            del self.entries[key]
+        if entry['handle'] is not None:
+            self.drop(entry['handle'])
+
+    def handle_for(self, prefix: str):
+        # The registered prefix to send the rest of the prompt with, or None when it goes inline.
+        with self._lock:
+            entry = self.entries.get(fingerprint(prefix))
+        if entry is None:
+            return None
+        # One upload per prefix even when concurrent calls ask for it at the same time.
+        with entry['lock']:
+            if entry['unusable']:
+                return None
+            if entry['handle'] is not None and self.ttl and time.monotonic() - entry['registered'] > self.ttl * 0.9:
+                self.drop(entry['handle'])
+                entry['handle'] = None
+            if entry['handle'] is None:
+                entry['tokens'] = count_tokens(prefix)
+                if entry['tokens'] < self.min_tokens:
+                    entry['unusable'] = True
+                    return None
+                try:
+                    entry['handle'] = self.register(prefix)
+                except Exception as e:
+                    print(f"Context cache unavailable, sending prompts in full: {e}")
+                    entry['unusable'] = True
+                    return None
+                entry['registered'] = time.monotonic()
+                with self._lock:
+                    self.registrations += 1
+                increment("context_cache_registrations")
+            handle = entry['handle']
+        with self._lock:
+            self.reused_calls += 1
+            self.reused_tokens += entry['tokens']
+        increment("context_cache_reused_tokens", entry['tokens'])
+        return handle
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"registrations": self.registrations, "reused_calls": self.reused_calls, "reused_tokens": self.reused_tokens}
+
+
+class GeminiContextCache(ContextCache):
+    def __init__(self, model_name: str, min_tokens: int = None, ttl: float = None):
+        if min_tokens is None:
+            min_tokens = CONTEXT_CACHE_MIN_TOKENS or cache_min_tokens(model_name)
+        super().__init__(min_tokens, CONTEXT_CACHE_TTL_SECONDS if ttl is None else ttl)
+        self.model_name = model_name
+
+    def register(self, prefix: str):
+        # Imported here so the local stand-in and CONTEXT_CACHE=0 work with any SDK version.
+        from google.generativeai import caching
+        return caching.CachedContent.create(model=self.model_name, contents=[prefix],
+                                            ttl=datetime.timedelta(seconds=self.ttl))
+
+    def request_for(self, handle, prompt: str) -> tuple:
+        return prompt, handle
+
+    def drop(self, handle):
+        # Cached contents are billed for storage until they expire, so they go as soon as the run is done.
+        try:
+            handle.delete()
+        except Exception as e:
+            print(f"Could not delete cached context {handle.name}: {e}")
+
+
+def create_context_cache(model_name: str, provider_name: str = "gemini"):
+    if CONTEXT_CACHE == "0":
+        return None
+    # Only Gemini has a server-side cache; other providers get the stand-in.
+    if CONTEXT_CACHE == "local" or provider_name != "gemini":
+        # Nothing is uploaded, so there is no provider minimum to respect.
+        return ContextCache(min_tokens=0)
+    return GeminiContextCache(model_name)
@@ -0,0 +1,12 @@
+from langgraph.config import get_stream_writer
+
+
+def ignore_event(event: dict):
+    pass
+
+def get_event_writer():
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        # Called outside a running graph, e.g. a node invoked directly.
+        return ignore_event
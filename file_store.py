@@ -0,0 +1,218 @@
+import os
+import zlib
+import sqlite3
+import hashlib
+import threading
+from collections.abc import MutableMapping
+from cache import CACHE_DIR
+from manifest import fingerprint
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+FILE_STORE_DIR = os.path.expanduser(os.getenv("FILE_STORE_DIR") or os.path.join(CACHE_DIR, "file_stores"))
+# Stores of older runs are kept for resuming and inspection, oldest removed first. A store that a
+# running process still holds is never removed.
+FILE_STORE_KEEP = int(os.getenv("FILE_STORE_KEEP", "8"))
+WRITE_BATCH_SIZE = 256
+
+
+# Fetched files live compressed in a SQLite file on disk. The object itself only holds the
+# path -> content key index, so it can sit in graph State and be passed between nodes while
+# each file is read and decompressed only when it is accessed.
+class FileStore(MutableMapping):
+    def __init__(self, path: str, index: dict = None, hold: bool = True):
+        self.path = path
+        self.index = dict(index or {})
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        # Held for the lifetime of the object so prune_file_stores leaves the store alone.
+        self._hold = hold_file_store(path) if hold else None
+
+    def __del__(self):
+        if getattr(self, '_hold', None) is not None:
+            self._hold.close()
+
+    def connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS contents (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+        return self._conn
+
+    def __getitem__(self, file_path: str) -> str:
+        key = self.index[file_path]
+        with self._lock:
+            if key in self._pending:
+                value = self._pending[key]
+            else:
+                row = self.connection().execute("SELECT value FROM contents WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    raise KeyError(file_path)
+                value = row[0]
+        return zlib.decompress(value).decode('utf-8', 'surrogatepass')
+
+    def get_many(self, file_paths: list) -> dict:
+        keys = {file_path: self.index[file_path] for file_path in file_paths if file_path in self.index}
+        values = {}
+        with self._lock:
+            missing = []
+            for key in set(keys.values()):
+                if key in self._pending:
+                    values[key] = self._pending[key]
+                else:
+                    missing.append(key)
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                values.update(self.connection().execute(f"SELECT key, value FROM contents WHERE key IN ({placeholders})", batch).fetchall())
+        return {file_path: zlib.decompress(values[key]).decode('utf-8', 'surrogatepass') for file_path, key in keys.items() if key in values}
+
+    def __setitem__(self, file_path: str, content: str):
+        data = content.encode('utf-8', 'surrogatepass')
+        # Identical files share one row.
+        key = hashlib.blake2b(data, digest_size=16).hexdigest()
+        with self._lock:
+            self.index[file_path] = key
+            # Fast compression: source text still shrinks several times and writes stay cheap.
+            self._pending[key] = zlib.compress(data, 1)
+            if len(self._pending) >= WRITE_BATCH_SIZE:
+                self._flush()
+
+    def __delitem__(self, file_path: str):
+        del self.index[file_path]
+
+    def __contains__(self, file_path) -> bool:
+        return file_path in self.index
+
+    def __iter__(self):
+        return iter(list(self.index))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _flush(self):
+        if not self._pending:
+            return
+        connection = self.connection()
+        connection.execute("BEGIN")
+        connection.executemany("INSERT OR IGNORE INTO contents (key, value) VALUES (?, ?)", list(self._pending.items()))
+        connection.execute("COMMIT")
+        self._pending = {}
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def subset(self, file_paths) -> "FileStore":
+        # A read-only view over some of the files that shares this store's connection.
+        self.flush()
+        view = FileStore(self.path, {path: self.index[path] for path in file_paths if path in self.index}, hold=False)
+        view._conn, view._lock = self.connection(), self._lock
+        # Keeps this store, and with it the hold, alive as long as the view.
+        view._parent = self
+        return view
+
+    def reference(self) -> dict:
+        self.flush()
+        return {"path": self.path, "index": self.index}
+
+    def has_all_contents(self) -> bool:
+        keys = list(set(self.index.values()))
+        with self._lock:
+            found = 0
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                found += self.connection().execute(f"SELECT COUNT(*) FROM contents WHERE key IN ({placeholders})", batch).fetchone()[0]
+        return found == len(keys)
+
+
+def file_store_path(repo: str, commit_sha: str) -> str:
+    return os.path.join(FILE_STORE_DIR, fingerprint(repo, commit_sha)[:32] + ".sqlite3")
+
+def hold_file_store(path: str):
+    # A shared lock on the store's lock file, released when the returned file is closed.
+    if fcntl is None:
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    while True:
+        lock_file = open(path + ".lock", 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+        try:
+            # A pruner may have removed the lock file while this process waited for it.
+            if os.fstat(lock_file.fileno()).st_ino == os.stat(path + ".lock").st_ino:
+                return lock_file
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+def remove_file_store(path: str) -> bool:
+    # Without fcntl (Windows) a store that is still open cannot be deleted anyway.
+    lock_file = None
+    if fcntl is not None:
+        lock_file = open(path + ".lock", 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+    try:
+        for suffix in ("", "-wal", "-shm", ".lock"):
+            try:
+                os.remove(path + suffix)
+            except OSError:
+                pass
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+    return True
+
+def prune_file_stores(keep_path: str = None):
+    if not os.path.isdir(FILE_STORE_DIR):
+        return
+    stores = []
+    for entry in os.scandir(FILE_STORE_DIR):
+        if entry.name.endswith(".sqlite3"):
+            try:
+                stores.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                # Removed by a concurrent prune.
+                pass
+    for _, path in sorted(stores, reverse=True)[FILE_STORE_KEEP:]:
+        if path != keep_path:
+            remove_file_store(path)
+
+def create_file_store(repo: str, commit_sha: str) -> FileStore:
+    path = file_store_path(repo, commit_sha)
+    # Held before pruning, so concurrent runs never remove each other's stores.
+    store = FileStore(path)
+    prune_file_stores(keep_path=path)
+    return store
+
+def open_file_store(reference: dict) -> FileStore:
+    # None when the store has been pruned or is incomplete; the caller fetches again.
+    if not os.path.exists(reference['path']):
+        return None
+    store = FileStore(reference['path'], reference['index'])
+    return store if store.has_all_contents() else None
+
+def select_files(file_contents, file_paths) -> dict:
+    if isinstance(file_contents, FileStore):
+        return file_contents.subset(file_paths)
+    return {file_path: file_contents[file_path] for file_path in file_paths if file_path in file_contents}
+
+def iter_file_batches(file_contents, file_paths, batch_size: int = WRITE_BATCH_SIZE):
+    # Yields (paths, contents) a batch at a time so callers never hold every file at once.
+    file_paths = [file_path for file_path in file_paths if file_path in file_contents]
+    for start in range(0, len(file_paths), batch_size):
+        batch = file_paths[start:start + batch_size]
+        if isinstance(file_contents, FileStore):
+            contents = file_contents.get_many(batch)
+            yield batch, [contents[file_path] for file_path in batch]
+        else:
+            yield batch, [file_contents[file_path] for file_path in batch]
@@ -1,51 +1,109 @@
+import os
 import json
+import contextvars
+import concurrent.futures
 from langchain_core.prompts import PromptTemplate
 from LLM import model
-from .tools.tools import get_repository_info, sanitize_json_response, fetch_file_contents, get_unique_file_paths, map_chunks_to_files, count_tokens_per_chunk, create_context_and_file_listing
-from prompts import generate_chunks_prompt, json_fixing_prompt, abstractions_json_fixing_prompt, generate_abstractions_prompt, combine_abstractions_prompt
+from .tools.sources import get_source_provider
+from .tools.structure import expand_chunk_paths
+from .tools.local_chunker import select_source_files, group_by_top_directory, cluster_files
+from .tools.tools import get_unique_file_paths, map_chunks_to_files, count_tokens_per_chunk, create_context_and_file_listing
+from prompts import generate_chunks_prompt, json_fixing_prompt, abstractions_json_fixing_prompt, generate_abstractions_prefix_prompt, generate_abstractions_prompt, combine_abstractions_prompt
 from state import State
+from events import get_event_writer
+from metrics import increment
+from file_store import create_file_store
+from manifest import fingerprint, blob_shas_for
+from json_repair import parse_model_json
+
+ABSTRACTION_CONCURRENCY = int(os.getenv("ABSTRACTION_CONCURRENCY", "8"))
+ABSTRACTION_CALL_TIMEOUT = float(os.getenv("ABSTRACTION_CALL_TIMEOUT", "300"))
+# The instructions shared by every abstractions prompt; the per-chunk code follows them.
+ABSTRACTIONS_PROMPT_PREFIX = PromptTemplate.from_template(generate_abstractions_prefix_prompt).format()
+# "llm" asks the model to group files; "local" clusters them by directory and imports without a model call.
+CHUNKER = os.getenv("CHUNKER", "llm")
 
 
 def generate_chunks(state: State) -> dict:
-    repo_structure, project_name = get_repository_info(state['token'], state['repo'])
-    prompt_template = PromptTemplate.from_template(generate_chunks_prompt)
-    formatted_prompt = prompt_template.format(structure=repo_structure)
-    response = model.generate_content(formatted_prompt).text
-    
-    sanitized_response = sanitize_json_response(response)
+    repo_structure, project_name, commit_sha, file_shas, file_sizes = get_source_provider(state['repo'])['get_info'](state['token'], state['repo'])
+    previous_manifest = state.get('previous_manifest') or {}
+    structure_hash = fingerprint(repo_structure)
     
-    try:
-        response_json = json.loads(sanitized_response)
-    except json.JSONDecodeError:
-        json_fix_template = PromptTemplate.from_template(json_fixing_prompt)
-        max_retries = 3
-        current_try = 0
-        while current_try < max_retries:
-            current_try += 1
-            formatted_fix_prompt = json_fix_template.format(response_text=sanitized_response)
-            response = model.generate_content(formatted_fix_prompt).text
-            sanitized_response = sanitize_json_response(response)
-            try:
-                response_json = json.loads(sanitized_response)
-                break
-            except json.JSONDecodeError:
-                continue
-        else:
+    if CHUNKER == "local":
+        # Provisional grouping that decides what to fetch; get_file_contents replaces it with the real clusters.
+        response_json = group_by_top_directory(select_source_files(file_shas))
+    elif previous_manifest.get('structure_hash') == structure_hash and previous_manifest.get('chunks'):
+        response_json = previous_manifest['chunks']
+    else:
+        prompt_template = PromptTemplate.from_template(generate_chunks_prompt)
+        formatted_prompt = prompt_template.format(structure=repo_structure)
+        response = model.generate_content(formatted_prompt).text
+        response_json = parse_model_json(response, json_fixing_prompt, model, dict)
+        if response_json is None:
+            model.discard(formatted_prompt)
             raise ValueError("Failed to parse JSON after multiple attempts.")
-    return {"chunks": response_json, "project_name": project_name}
+        response_json = expand_chunk_paths(response_json, file_shas)
+    
+    manifest = {"commit_sha": commit_sha, "structure_hash": structure_hash, "chunks": response_json}
+    return {"chunks": response_json, "project_name": project_name, "commit_sha": commit_sha, "file_shas": file_shas,
+            "file_sizes": file_sizes, "manifest": manifest}
 
 def get_file_contents(state: State) -> dict:
     file_paths = get_unique_file_paths(state['chunks'])
-    file_contents = fetch_file_contents(state['token'], state['repo'], file_paths)
-    return {"file_contents": file_contents}
+    fetch_report = {}
+    # Contents go straight to an on-disk store; State only carries the handle.
+    store = create_file_store(state['repo'], state.get('commit_sha'))
+    file_contents = get_source_provider(state['repo'])['fetch_files'](state['token'], state['repo'], file_paths, ref=state.get('commit_sha'),
+                                                                      file_shas=state.get('file_shas'), file_sizes=state.get('file_sizes'),
+                                                                      report=fetch_report, store=store)
+    store.flush()
+    for file_path in file_paths:
+        if file_path not in file_contents and file_path not in fetch_report:
+            fetch_report[file_path] = "unavailable"
+    if fetch_report:
+        # Every requested file is either in file_contents or accounted for here.
+        counts = {}
+        for note in fetch_report.values():
+            counts[note] = counts.get(note, 0) + 1
+            increment("files_not_fetched_in_full", reason=note)
+        print(f"Fetched {len(file_contents)} of {len(file_paths)} files in full; " + ", ".join(f"{count} {note}" for note, count in sorted(counts.items())))
+        get_event_writer()({"event": "files_skipped", "files": fetch_report})
+    update = {"file_contents": file_contents, "fetch_report": fetch_report, "manifest": {"fetch_report": fetch_report}}
+    if CHUNKER == "local":
+        chunks = cluster_files(file_contents)
+        update.update({"chunks": chunks, "manifest": {"fetch_report": fetch_report, "chunks": chunks}})
+    return update
+
+def generate_chunk_abstractions(project_name: str, chunk_name: str, chunk_files: dict) -> list:
+    chunk_context, chunk_file_listing = create_context_and_file_listing({chunk_name: chunk_files})
+    prompt_template = PromptTemplate.from_template(generate_abstractions_prompt)
+    formatted_prompt = prompt_template.format(
+        project_name=f"{project_name} - {chunk_name}",
+        context=chunk_context,
+        file_listing=chunk_file_listing
+    )
+    response = model.generate_content(formatted_prompt, prefix=ABSTRACTIONS_PROMPT_PREFIX, deadline=ABSTRACTION_CALL_TIMEOUT).text
+    chunk_json = parse_model_json(response, abstractions_json_fixing_prompt, model, list)
+    if chunk_json is None:
+        model.discard(formatted_prompt, prefix=ABSTRACTIONS_PROMPT_PREFIX)
+    return chunk_json
 
 def generate_abstractions(state: State) -> dict: 
     file_contents = state['file_contents']
     chunks = state['chunks']
     project_name = state['project_name']
     chunks_with_contents = map_chunks_to_files(chunks, file_contents)
+    previous_manifest = state.get('previous_manifest') or {}
+    previous_chunk_abstractions = previous_manifest.get('chunk_abstractions') or {}
+    # Abstractions follow the chunk layout; edits inside existing files only invalidate the chapters that use them.
+    abstractions_inputs = fingerprint(project_name, {name: sorted(files) for name, files in chunks_with_contents.items()})
+    chunk_results = {}
     chunk_token_counts = count_tokens_per_chunk(chunks_with_contents)
-    if(chunk_token_counts["total"] < 100000):
+    if previous_manifest.get('abstractions_inputs') == abstractions_inputs and previous_manifest.get('abstractions'):
+        abstractions = [{key: value for key, value in abstraction.items() if key != 'file_shas'}
+                        for abstraction in previous_manifest['abstractions']]
+        chunk_results = previous_chunk_abstractions
+    elif(chunk_token_counts["total"] < 100000):
         context, file_listing = create_context_and_file_listing(chunks_with_contents)
         prompt_template = PromptTemplate.from_template(generate_abstractions_prompt)
         formatted_prompt = prompt_template.format(
@@ -53,72 +111,51 @@ def generate_abstractions(state: State) -> dict:
             context=context,
             file_listing=file_listing
         )
-        response = model.generate_content(formatted_prompt).text
-        sanitized_response = sanitize_json_response(response)
-        try:
-            abstractions = json.loads(sanitized_response)
-        except json.JSONDecodeError:
-            json_fix_template = PromptTemplate.from_template(abstractions_json_fixing_prompt)
-            max_retries = 3
-            current_try = 0
-            while current_try < max_retries:
-                current_try += 1
-                formatted_fix_prompt = json_fix_template.format(response_text=sanitized_response)
-                response = model.generate_content(formatted_fix_prompt).text
-                sanitized_response = sanitize_json_response(response)
-                try:
-                    abstractions = json.loads(sanitized_response)
-                    break
-               
-                except json.JSONDecodeError:
-                    continue
-            else:
-                raise ValueError("Failed to parse JSON after multiple attempts.")
+        response = model.generate_content(formatted_prompt, prefix=ABSTRACTIONS_PROMPT_PREFIX).text
+        abstractions = parse_model_json(response, abstractions_json_fixing_prompt, model, list)
+        if abstractions is None:
+            model.discard(formatted_prompt, prefix=ABSTRACTIONS_PROMPT_PREFIX)
+            raise ValueError("Failed to parse JSON after multiple attempts.")
     else:
         chunk_abstractions = []
-        prompt_template = PromptTemplate.from_template(generate_abstractions_prompt)
+        pending_chunks = []
         
         for chunk_name, chunk_files in chunks_with_contents.items():
-            chunk_context_parts = []
-            chunk_file_paths = []
-            
-            for file_path, content in chunk_files.items():
-                chunk_context_parts.append(f"=== {file_path} ===\n{content}\n")
-                chunk_file_paths.append(file_path)
-            
-            chunk_context = "\n".join(chunk_context_parts)
-            chunk_file_listing = "\n".join([f"- {file_path}" for file_path in chunk_file_paths])
-            
-            if not chunk_file_paths:
+            if not chunk_files:
                 continue
-                
-            formatted_prompt = prompt_template.format(
-                project_name=f"{project_name} - {chunk_name}",
-                context=chunk_context,
-                file_listing=chunk_file_listing
-            )
-            response = model.generate_content(formatted_prompt).text
-            sanitized_response = sanitize_json_response(response)
             
-            try:
-                chunk_json = json.loads(sanitized_response)
-                chunk_abstractions.extend(chunk_json)
-            except json.JSONDecodeError:
-                json_fix_template = PromptTemplate.from_template(abstractions_json_fixing_prompt)
-                max_retries = 3
-                current_try = 0
-                
-                while current_try < max_retries:
-                    current_try += 1
-                    formatted_fix_prompt = json_fix_template.format(response_text=sanitized_response)
-                    response = model.generate_content(formatted_fix_prompt).text
-                    sanitized_response = sanitize_json_response(response)
+            chunk_inputs = fingerprint(project_name, chunk_name, sorted(chunk_files))
+            previous_chunk = previous_chunk_abstractions.get(chunk_name)
+            if previous_chunk and previous_chunk.get('inputs') == chunk_inputs:
+                chunk_results[chunk_name] = previous_chunk
+            else:
+                pending_chunks.append((chunk_name, chunk_inputs))
+        
+        shared_prefix = len(pending_chunks) > 1
+        if shared_prefix:
+            model.share_prefix(ABSTRACTIONS_PROMPT_PREFIX)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=ABSTRACTION_CONCURRENCY) as executor:
+                # Worker threads do not inherit the run's context, which per-run metrics need.
+                futures = {chunk_name: executor.submit(contextvars.copy_context().run, generate_chunk_abstractions, project_name,
+                                                       chunk_name, chunks_with_contents[chunk_name])
+                           for chunk_name, _ in pending_chunks}
+                for chunk_name, chunk_inputs in pending_chunks:
                     try:
-                        chunk_json = json.loads(sanitized_response)
-                        chunk_abstractions.extend(chunk_json)
-                        break
-                    except json.JSONDecodeError:
+                        chunk_json = futures[chunk_name].result()
+                    except Exception as e:
+                        print(f"Skipping chunk {chunk_name}: {e}")
                         continue
+                    if chunk_json is not None:
+                        chunk_results[chunk_name] = {"inputs": chunk_inputs, "abstractions": chunk_json}
+        finally:
+            if shared_prefix:
+                model.release_prefix(ABSTRACTIONS_PROMPT_PREFIX)
+        
+        # Merge in chunk order so the combine prompt does not depend on which call finished first.
+        for chunk_name in chunks_with_contents:
+            if chunk_name in chunk_results:
+                chunk_abstractions.extend(chunk_results[chunk_name]['abstractions'])
         if not chunk_abstractions:
             raise ValueError("Failed to generate any valid abstractions from chunks.")
         chunk_abstractions_json = json.dumps(chunk_abstractions, indent=2)
@@ -129,23 +166,15 @@ def generate_abstractions(state: State) -> dict:
         )
         
         response = model.generate_content(combine_prompt).text
-        sanitized_response = sanitize_json_response(response)
-        try:
-            abstractions = json.loads(sanitized_response)
-        except json.JSONDecodeError:
-            json_fix_template = PromptTemplate.from_template(abstractions_json_fixing_prompt)
-            max_retries = 3
-            current_try = 0
-            while current_try < max_retries:
-                current_try += 1
-                formatted_fix_prompt = json_fix_template.format(response_text=sanitized_response)
-                response = model.generate_content(formatted_fix_prompt).text
-                sanitized_response = sanitize_json_response(response)
-                try:
-                    abstractions = json.loads(sanitized_response)
-                    break
-                except json.JSONDecodeError:
-                    continue
-            else:
-                raise ValueError("Failed to parse combined abstractions JSON after multiple attempts.")
-    return {"abstractions": abstractions}
+        abstractions = parse_model_json(response, abstractions_json_fixing_prompt, model, list)
+        if abstractions is None:
+            model.discard(combine_prompt)
+            raise ValueError("Failed to parse combined abstractions JSON after multiple attempts.")
+    
+    manifest = {
+        "abstractions_inputs": abstractions_inputs,
+        "chunk_abstractions": chunk_results,
+        "abstractions": [{**abstraction, "file_shas": blob_shas_for(abstraction.get('file_paths', []), state.get('file_shas'))}
+                         for abstraction in abstractions],
+    }
+    return {"abstractions": abstractions, "manifest": manifest}
@@ -0,0 +1,59 @@
+import os
+from .structure import BINARY_EXTENSIONS
+
+# Files above FETCH_MAX_FILE_BYTES are never downloaded; text above FETCH_TRUNCATE_BYTES keeps its
+# head and tail only, so no single file holds more than that in memory.
+FETCH_MAX_FILE_BYTES = int(os.getenv("FETCH_MAX_FILE_BYTES", str(10 * 1024 * 1024)))
+FETCH_TRUNCATE_BYTES = int(os.getenv("FETCH_TRUNCATE_BYTES", str(256 * 1024)))
+BINARY_SNIFF_BYTES = 8192
+READ_BLOCK_BYTES = 64 * 1024
+
+
+def skip_reason(path: str, size: int = None) -> str:
+    # Decided from the tree alone, before anything is downloaded.
+    if os.path.splitext(path)[1].lower() in BINARY_EXTENSIONS:
+        return "binary"
+    if size is not None and size > FETCH_MAX_FILE_BYTES:
+        return "too_large"
+    return None
+
+def join_head_tail(head: bytes, tail: bytes, total: int) -> tuple[str, str]:
+    if b'\0' in head[:BINARY_SNIFF_BYTES]:
+        return None, "binary"
+    if total <= len(head) + len(tail):
+        return (head + tail).decode('utf-8', errors='replace'), None
+    # Cut on line boundaries so the kept parts stay readable and the result is the same every run.
+    head = head[:head.rfind(b'\n') + 1] or head
+    newline = tail.find(b'\n')
+    tail = tail[newline + 1:] if newline >= 0 else tail
+    omitted = total - len(head) - len(tail)
+    marker = f"\n... [{omitted} bytes omitted from the middle of this {total}-byte file] ...\n"
+    return head.decode('utf-8', errors='replace') + marker + tail.decode('utf-8', errors='replace'), "truncated"
+
+def limit_bytes(data) -> tuple[str, str]:
+    # Works on bytes and on memory maps, where only the head and tail pages are touched.
+    half = FETCH_TRUNCATE_BYTES // 2
+    if len(data) <= FETCH_TRUNCATE_BYTES:
+        return join_head_tail(bytes(data[:]), b"", len(data))
+    return join_head_tail(bytes(data[:half]), bytes(data[-half:]), len(data))
+
+def read_limited(blocks) -> tuple[str, str]:
+    # Consumes a stream of byte blocks keeping at most FETCH_TRUNCATE_BYTES of it.
+    half = FETCH_TRUNCATE_BYTES // 2
+    head = bytearray()
+    tail = b""
+    total = 0
+    for block in blocks:
+        total += len(block)
+        if len(head) < half:
+            taken = half - len(head)
+            head += block[:taken]
+            block = block[taken:]
+            if len(head) >= min(half, BINARY_SNIFF_BYTES) and b'\0' in head[:BINARY_SNIFF_BYTES]:
+                return None, "binary"
+        if block:
+            tail = (tail + block)[-half:]
+    return join_head_tail(bytes(head), tail, total)
+
+def read_file_blocks(file_object):
+    return iter(lambda: file_object.read(READ_BLOCK_BYTES), b"")
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+import concurrent.futures
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from cache import SQLiteCache, CACHE_DIR
+from metrics import increment, observe
+
+GITHUB_MAX_CONCURRENCY = int(os.getenv("GITHUB_MAX_CONCURRENCY", "10"))
+GITHUB_MAX_RETRIES = int(os.getenv("GITHUB_MAX_RETRIES", "5"))
+GITHUB_RATE_LIMIT_LOW = int(os.getenv("GITHUB_RATE_LIMIT_LOW", "100"))
+GITHUB_MAX_RATE_LIMIT_WAIT = float(os.getenv("GITHUB_MAX_RATE_LIMIT_WAIT", "900"))
+GITHUB_REQUEST_TIMEOUT = float(os.getenv("GITHUB_REQUEST_TIMEOUT", "60"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+_fetch_pool = None
+_etag_cache = None
+_etag_cache_lock = threading.Lock()
+
+# In-flight requests are capped by `allowed`, which drops to 1 while the remaining quota is low.
+_gate = threading.Condition()
+_gate_state = {"in_flight": 0, "allowed": GITHUB_MAX_CONCURRENCY, "paused_until": 0.0}
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "not_modified": 0, "retries": 0, "rate_limited": 0, "errors": 0, "latency": 0.0, "max_latency": 0.0}
+
+
+def get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(GITHUB_MAX_CONCURRENCY, 10))
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+    return _session
+
+def get_fetch_pool() -> concurrent.futures.ThreadPoolExecutor:
+    # One pool for every repository processed by this process, so batch runs share the fetch capacity.
+    global _fetch_pool
+    with _session_lock:
+        if _fetch_pool is None:
+            _fetch_pool = concurrent.futures.ThreadPoolExecutor(max_workers=GITHUB_MAX_CONCURRENCY, thread_name_prefix="github-fetch")
+    return _fetch_pool
+
+def get_etag_cache():
+    global _etag_cache
+    if os.getenv("GITHUB_ETAG_CACHE", "1") == "0":
+        return None
+    with _etag_cache_lock:
+        if _etag_cache is None:
+            max_bytes = int(os.getenv("GITHUB_ETAG_CACHE_MAX_MB", "256")) * 1024 * 1024
+            _etag_cache = SQLiteCache(os.path.join(CACHE_DIR, "github_etags.sqlite3"), max_bytes)
+    return _etag_cache
+
+def etag_cache_key(url: str, params: dict, token: str) -> str:
+    # The token is part of the key so one account never sees another's private responses.
+    payload = json.dumps([url, params or {}, hashlib.sha256((token or "").encode('utf-8')).hexdigest()], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def load_cached_response(cache: SQLiteCache, key: str):
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    header, _, body = entry.partition(b"\n")
+    return json.loads(header.decode('utf-8')), body
+
+def store_cached_response(cache: SQLiteCache, key: str, response: requests.Response):
+    header = {"etag": response.headers['ETag'], "content_type": response.headers.get('Content-Type', '')}
+    cache.set(key, json.dumps(header).encode('utf-8') + b"\n" + response.content)
+
+def build_cached_response(url: str, header: dict, body: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = body
+    response.headers = CaseInsensitiveDict({"ETag": header['etag'], "Content-Type": header['content_type']})
+    response.encoding = 'utf-8'
+    return response
+
+def acquire_slot():
+    with _gate:
+        while True:
+            wait = _gate_state['paused_until'] - time.time()
+            if wait <= 0 and _gate_state['in_flight'] < _gate_state['allowed']:
+                _gate_state['in_flight'] += 1
+                return
+            _gate.wait(timeout=wait if wait > 0 else None)
+
+def release_slot():
+    with _gate:
+        _gate_state['in_flight'] -= 1
+        _gate.notify_all()
+
+def update_rate_limit(response: requests.Response):
+    remaining = response.headers.get('X-RateLimit-Remaining')
+    if remaining is None:
+        return
+    remaining = int(remaining)
+    reset_at = float(response.headers.get('X-RateLimit-Reset', '0'))
+    with _gate:
+        _gate_state['allowed'] = 1 if remaining < GITHUB_RATE_LIMIT_LOW else GITHUB_MAX_CONCURRENCY
+        if remaining == 0 and reset_at:
+            _gate_state['paused_until'] = max(_gate_state['paused_until'], min(reset_at, time.time() + GITHUB_MAX_RATE_LIMIT_WAIT))
+        _gate.notify_all()
+
+def retry_delay(response, attempt: int) -> float:
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), GITHUB_MAX_RATE_LIMIT_WAIT)
+        reset_at = response.headers.get('X-RateLimit-Reset')
+        if response.headers.get('X-RateLimit-Remaining') == '0' and reset_at:
+            return min(max(float(reset_at) - time.time(), 1.0), GITHUB_MAX_RATE_LIMIT_WAIT)
+    # Full jitter keeps parallel workers from retrying in lockstep.
+    return random.uniform(0, min(60.0, 2 ** attempt))
+
+def is_rate_limited(response: requests.Response) -> bool:
+    if response.status_code == 429:
+        return True
+    # Primary limits report no remaining quota; secondary limits only say so in the message.
+    return response.status_code == 403 and (response.headers.get('X-RateLimit-Remaining') == '0'
+                                            or 'Retry-After' in response.headers
+                                            or 'rate limit' in response.text.lower())
+
+def record(name: str, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+    increment(f"github_{name}", amount)
+
+def github_get(url: str, token: str = None, params: dict = None, stream: bool = False, accept: str = None) -> requests.Response:
+    headers = {"Authorization": f"token {token}"} if token else {}
+    if accept:
+        headers["Accept"] = accept
+    # Streamed bodies (archives, raw files) are too large to keep, so only regular responses are cached.
+    cache = None if stream or accept else get_etag_cache()
+    key = etag_cache_key(url, params, token) if cache is not None else None
+    cached = load_cached_response(cache, key) if cache is not None else None
+    if cached is not None:
+        headers["If-None-Match"] = cached[0]['etag']
+
+    response = None
+    for attempt in range(GITHUB_MAX_RETRIES + 1):
+        if attempt:
+            record("retries")
+            time.sleep(retry_delay(response, attempt))
+        acquire_slot()
+        started = time.monotonic()
+        try:
+            response = get_session().get(url, headers=headers, params=params, stream=stream, timeout=GITHUB_REQUEST_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            record("errors")
+            response = None
+            if attempt == GITHUB_MAX_RETRIES:
+                raise
+            print(f"Request to {url} failed, retrying: {e}")
+            continue
+        finally:
+            release_slot()
+            elapsed = time.monotonic() - started
+            with _stats_lock:
+                _stats['requests'] += 1
+                _stats['latency'] += elapsed
+                _stats['max_latency'] = max(_stats['max_latency'], elapsed)
+
+        observe("github_request_seconds", elapsed, status=response.status_code)
+        update_rate_limit(response)
+        if response.status_code == 304 and cached is not None:
+            record("not_modified")
+            return build_cached_response(url, *cached)
+        if is_rate_limited(response):
+            record("rate_limited")
+        elif response.status_code not in RETRY_STATUSES:
+            break
+        if attempt == GITHUB_MAX_RETRIES:
+            break
+        response.close()
+
+    if cache is not None and response.status_code == 200 and 'ETag' in response.headers:
+        store_cached_response(cache, key, response)
+    return response
+
+def get_http_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['avg_latency'] = stats['latency'] / stats['requests'] if stats['requests'] else 0.0
+    with _gate:
+        stats['allowed_concurrency'] = _gate_state['allowed']
+    return stats
@@ -0,0 +1,170 @@
+import os
+import re
+import posixpath
+from file_store import iter_file_batches
+
+# Files that stand for their directory when it is imported as a module or package.
+PACKAGE_ENTRY_STEMS = {'__init__', 'index', 'mod', 'lib'}
+STRIPPED_EXTENSIONS = {'.py', '.pyi', '.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs', '.vue', '.svelte', '.go', '.rs',
+                       '.java', '.kt', '.kts', '.scala', '.c', '.h', '.cc', '.cpp', '.hpp', '.hh', '.cxx', '.rb', '.php',
+                       '.cs', '.swift', '.dart'}
+PYTHON_FROM_IMPORT = re.compile(r'^[ \t]*from[ \t]+(\.*[\w.]*)[ \t]+import[ \t]+(\([^)]*\)|[^\n#;]+)', re.MULTILINE)
+PYTHON_IMPORT = re.compile(r'^[ \t]*import\s+([\w.]+(?:\s+as\s+\w+)?(?:\s*,\s*[\w.]+(?:\s+as\s+\w+)?)*)', re.MULTILINE)
+JS_IMPORT = re.compile(r'''^[ \t]*(?:(?:import|export)\b|\})[^'"\n;]*?['"]([^'"\n]+)['"]''', re.MULTILINE)
+JS_DYNAMIC_IMPORT = re.compile(r'''\b(?:require|import)\s*\(\s*['"]([^'"\n]+)['"]''')
+C_INCLUDE = re.compile(r'^\s*#\s*include\s+"([^"]+)"', re.MULTILINE)
+GO_IMPORT_BLOCK = re.compile(r'^\s*import\s*\(([^)]*)\)', re.MULTILINE)
+GO_IMPORT = re.compile(r'^\s*import\s+(?:\w+\s+)?"([^"]+)"', re.MULTILINE)
+JVM_IMPORT = re.compile(r'^\s*import\s+(?:static\s+)?([\w.]+)\s*;?\s*$', re.MULTILINE)
+RUST_MOD = re.compile(r'^\s*(?:pub(?:\([^)]*\))?\s+)?mod\s+(\w+)\s*;', re.MULTILINE)
+RUST_USE = re.compile(r'^\s*(?:pub(?:\([^)]*\))?\s+)?use\s+(?:crate|super|self)?(?:::)?([\w:]+)', re.MULTILINE)
+RUBY_REQUIRE = re.compile(r'''^\s*require(_relative)?\s*\(?\s*['"]([^'"]+)['"]''', re.MULTILINE)
+PHP_USE = re.compile(r'^\s*use\s+([\w\\]+)\s*;', re.MULTILINE)
+PHP_INCLUDE = re.compile(r'''\b(?:require|include)(?:_once)?\s*\(?\s*(?:__DIR__\s*\.\s*)?['"]([^'"]+)['"]''')
+
+
+def path_stem(path: str) -> str:
+    root, extension = posixpath.splitext(path)
+    return root if extension in STRIPPED_EXTENSIONS else path
+
+def python_references(path: str, source: str) -> list:
+    references = []
+    directory = posixpath.dirname(path)
+    for module, names in PYTHON_FROM_IMPORT.findall(source):
+        names = [name.split()[0] for name in names.strip('()\\ \t').replace('\n', ' ').split(',') if name.strip() and name.strip() != '*']
+        if module.startswith('.'):
+            level = len(module) - len(module.lstrip('.'))
+            base = directory
+            for _ in range(level - 1):
+                base = posixpath.dirname(base)
+            stem = posixpath.join(base, module.lstrip('.').replace('.', '/')) if module.lstrip('.') else base
+            references.append((stem, True))
+            references.extend((posixpath.join(stem, name), True) for name in names)
+        else:
+            stem = module.replace('.', '/')
+            references.append((stem, False))
+            references.extend((f"{stem}/{name}", False) for name in names)
+    for modules in PYTHON_IMPORT.findall(source):
+        references.extend((module.split()[0].replace('.', '/'), False) for module in modules.split(','))
+    return references
+
+def js_references(path: str, source: str) -> list:
+    references = []
+    specs = JS_IMPORT.findall(source)
+    if 'require' in source or 'import(' in source:
+        specs += JS_DYNAMIC_IMPORT.findall(source)
+    for spec in specs:
+        if spec.startswith('.'):
+            references.append((path_stem(posixpath.normpath(posixpath.join(posixpath.dirname(path), spec))), True))
+        elif spec.startswith(('@/', '~/')):
+            # Common bundler aliases for the source root.
+            references.append((path_stem(spec[2:]), False))
+    return references
+
+def c_references(path: str, source: str) -> list:
+    references = []
+    for header in C_INCLUDE.findall(source):
+        references.append((path_stem(posixpath.normpath(posixpath.join(posixpath.dirname(path), header))), True))
+        references.append((path_stem(header), False))
+    return references
+
+def go_references(path: str, source: str) -> list:
+    specs = GO_IMPORT.findall(source)
+    for block in GO_IMPORT_BLOCK.findall(source):
+        specs.extend(re.findall(r'"([^"]+)"', block))
+    # Go imports whole packages, which are directories.
+    return [(spec, False) for spec in specs if '/' in spec]
+
+def jvm_references(path: str, source: str) -> list:
+    return [(name.replace('.', '/'), False) for name in JVM_IMPORT.findall(source) if not name.endswith('*')]
+
+def rust_references(path: str, source: str) -> list:
+    directory = posixpath.dirname(path)
+    references = [(posixpath.join(directory, name), True) for name in RUST_MOD.findall(source)]
+    for use in RUST_USE.findall(source):
+        parts = [part for part in use.split('::') if part]
+        # The last segment is usually an item rather than a module, so try the parent too.
+        references.extend(('/'.join(parts[:length]), False) for length in (len(parts), len(parts) - 1) if length > 0)
+    return references
+
+def ruby_references(path: str, source: str) -> list:
+    references = []
+    for relative, spec in RUBY_REQUIRE.findall(source):
+        if relative:
+            references.append((path_stem(posixpath.normpath(posixpath.join(posixpath.dirname(path), spec))), True))
+        else:
+            references.append((path_stem(spec), False))
+    return references
+
+def php_references(path: str, source: str) -> list:
+    references = [(name.replace('\\', '/'), False) for name in PHP_USE.findall(source)]
+    for spec in PHP_INCLUDE.findall(source):
+        references.append((path_stem(posixpath.normpath(posixpath.join(posixpath.dirname(path), spec.lstrip('/')))), True))
+    return references
+
+REFERENCE_PARSERS = {
+    '.py': python_references, '.pyi': python_references,
+    '.js': js_references, '.jsx': js_references, '.ts': js_references, '.tsx': js_references,
+    '.mjs': js_references, '.cjs': js_references, '.vue': js_references, '.svelte': js_references,
+    '.c': c_references, '.h': c_references, '.cc': c_references, '.cpp': c_references, '.hpp': c_references,
+    '.hh': c_references, '.cxx': c_references,
+    '.go': go_references,
+    '.java': jvm_references, '.kt': jvm_references, '.kts': jvm_references, '.scala': jvm_references,
+    '.rs': rust_references,
+    '.rb': ruby_references,
+    '.php': php_references,
+}
+
+def build_module_index(file_paths) -> tuple[dict, dict]:
+    # Exact stems resolve relative imports; every trailing run of path components resolves absolute ones.
+    exact = {}
+    suffixes = {}
+    for path in sorted(file_paths):
+        stems = [path_stem(path)]
+        directory, name = posixpath.split(stems[0])
+        if name in PACKAGE_ENTRY_STEMS or path.endswith('.go'):
+            stems.append(directory)
+        for stem in stems:
+            if not stem:
+                continue
+            exact.setdefault(stem, []).append(path)
+            parts = stem.split('/')
+            for start in range(len(parts)):
+                suffixes.setdefault('/'.join(parts[start:]), []).append(path)
+    return exact, suffixes
+
+def closest_paths(importer: str, candidates: list) -> list:
+    # Ambiguous absolute imports go to the candidate sharing the longest directory prefix with the importer.
+    if len(candidates) <= 1:
+        return candidates
+    directory = posixpath.dirname(importer)
+    if all(candidate.endswith('.go') for candidate in candidates):
+        by_directory = {}
+        for candidate in candidates:
+            by_directory.setdefault(posixpath.dirname(candidate), []).append(candidate)
+        if len(by_directory) == 1:
+            return candidates
+    def shared_prefix(candidate):
+        return len(os.path.commonprefix([directory.split('/'), posixpath.dirname(candidate).split('/')]))
+    best = min(candidates, key=lambda candidate: (-shared_prefix(candidate), candidate.count('/'), candidate))
+    return [best]
+
+def resolve_references(path: str, references: list, exact: dict, suffixes: dict) -> set:
+    targets = set()
+    for stem, is_exact in references:
+        candidates = exact.get(stem) if is_exact else suffixes.get(stem)
+        if candidates:
+            targets.update(closest_paths(path, candidates))
+    targets.discard(path)
+    return targets
+
+def build_import_graph(file_contents: dict) -> dict:
+    # Maps every file to the sorted list of repository files it imports; unresolvable imports are dropped.
+    exact, suffixes = build_module_index(file_contents)
+    graph = {path: [] for path in sorted(file_contents)}
+    parsed_paths = [path for path in graph if posixpath.splitext(path)[1].lower() in REFERENCE_PARSERS]
+    for batch_paths, batch_contents in iter_file_batches(file_contents, parsed_paths):
+        for path, source in zip(batch_paths, batch_contents):
+            references = REFERENCE_PARSERS[posixpath.splitext(path)[1].lower()](path, source)
+            graph[path] = sorted(resolve_references(path, references, exact, suffixes))
+    return graph
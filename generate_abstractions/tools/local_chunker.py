@@ -0,0 +1,193 @@
+import os
+import heapq
+import posixpath
+from .structure import is_excluded_path
+from .import_graph import build_import_graph
+from .tools import count_file_tokens
+from file_store import select_files
+
+LOCAL_CHUNK_TOKENS = int(os.getenv("LOCAL_CHUNK_TOKENS", "60000"))
+# Chunks filled below this share of the budget are merged into the chunk they import from most.
+LOCAL_CHUNK_MIN_FILL = float(os.getenv("LOCAL_CHUNK_MIN_FILL", "0.5"))
+SOURCE_EXTENSIONS = {
+    '.py', '.pyi', '.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs', '.vue', '.svelte', '.go', '.rs', '.java', '.kt',
+    '.kts', '.scala', '.c', '.h', '.cc', '.cpp', '.hpp', '.hh', '.cxx', '.cs', '.swift', '.m', '.mm', '.rb', '.php',
+    '.dart', '.ex', '.exs', '.erl', '.hs', '.ml', '.clj', '.lua', '.r', '.jl', '.sh',
+}
+
+
+def select_source_files(file_paths) -> list:
+    # The same selection the chunking prompt asks the model for: source files only, no configs or docs.
+    return sorted(path for path in file_paths
+                  if posixpath.splitext(path)[1].lower() in SOURCE_EXTENSIONS
+                  and not posixpath.basename(path).startswith('.') and not is_excluded_path(path))
+
+def group_by_top_directory(file_paths: list) -> dict:
+    chunks = {}
+    for path in file_paths:
+        chunks.setdefault(path.split('/', 1)[0] if '/' in path else "root", []).append(path)
+    return chunks
+
+def directory_clusters(file_paths: list, tokens: dict, token_budget: int) -> list:
+    # Every directory whose whole subtree fits the budget becomes one cluster; larger ones are split
+    # into their own files and their subdirectories.
+    tree = {"dirs": {}, "files": [], "tokens": 0}
+    for path in file_paths:
+        node = tree
+        node['tokens'] += tokens[path]
+        for directory in path.split('/')[:-1]:
+            node = node['dirs'].setdefault(directory, {"dirs": {}, "files": [], "tokens": 0})
+            node['tokens'] += tokens[path]
+        node['files'].append(path)
+
+    clusters = []
+
+    def subtree_files(node):
+        files = list(node['files'])
+        for child in node['dirs'].values():
+            files.extend(subtree_files(child))
+        return files
+
+    def visit(node, name):
+        if node['tokens'] <= token_budget:
+            clusters.append({"names": [name], "files": sorted(subtree_files(node)), "tokens": node['tokens']})
+            return
+        current = {"names": [name], "files": [], "tokens": 0}
+        for path in node['files']:
+            if current['files'] and current['tokens'] + tokens[path] > token_budget:
+                clusters.append(current)
+                current = {"names": [name], "files": [], "tokens": 0}
+            current['files'].append(path)
+            current['tokens'] += tokens[path]
+        if current['files']:
+            clusters.append(current)
+        for directory in sorted(node['dirs']):
+            visit(node['dirs'][directory], f"{name}/{directory}" if name != "root" else directory)
+
+    if file_paths:
+        visit(tree, "root")
+    return clusters
+
+def directory_parts(name: str) -> list:
+    return [] if name == "root" else name.split('/')
+
+def smallest_other(heap: list, index: int, is_current) -> tuple:
+    # Smallest live entry of a lazily updated (tokens, cluster) heap other than the cluster itself.
+    skipped = []
+    found = None
+    while heap:
+        entry = heap[0]
+        if not is_current(entry):
+            heapq.heappop(heap)
+        elif entry[1] == index:
+            skipped.append(heapq.heappop(heap))
+        else:
+            found = entry
+            break
+    for entry in skipped:
+        heapq.heappush(heap, entry)
+    return found
+
+def merge_small_clusters(clusters: list, graph: dict, token_budget: int) -> list:
+    # Small clusters join the cluster they share the most import edges with, or failing that the
+    # nearest cluster in the directory tree, as long as the result stays within the budget.
+    # Both lookups go through heaps, so each merge costs the cluster's import neighbours and
+    # directory depth rather than a scan of every cluster.
+    minimum = token_budget * LOCAL_CHUNK_MIN_FILL
+    clusters = dict(enumerate(clusters))
+    parts = {index: directory_parts(cluster['names'][0]) for index, cluster in clusters.items()}
+    owner = {path: index for index, cluster in clusters.items() for path in cluster['files']}
+    edges = {index: {} for index in clusters}
+    for source, targets in graph.items():
+        for target in targets:
+            first, second = owner.get(source), owner.get(target)
+            if first is not None and second is not None and first != second:
+                edges[first][second] = edges[first].get(second, 0) + 1
+                edges[second][first] = edges[second].get(first, 0) + 1
+
+    # Smallest cluster first; entries are skipped once their cluster has merged or grown.
+    small = [(cluster['tokens'], cluster['names'][0], index) for index, cluster in clusters.items() if cluster['tokens'] < minimum]
+    heapq.heapify(small)
+    # Clusters under each directory prefix, smallest first.
+    by_prefix = {}
+
+    def register(index: int):
+        for depth in range(len(parts[index]) + 1):
+            heapq.heappush(by_prefix.setdefault(tuple(parts[index][:depth]), []), (clusters[index]['tokens'], index))
+
+    for index in clusters:
+        register(index)
+
+    def prefix_entry_current(prefix: tuple):
+        return lambda entry: (entry[1] in clusters and clusters[entry[1]]['tokens'] == entry[0]
+                              and tuple(parts[entry[1]][:len(prefix)]) == prefix)
+
+    # Clusters only grow, so one that fits nowhere now never will.
+    stuck = set()
+    while small:
+        tokens, name, index = heapq.heappop(small)
+        if index not in clusters or index in stuck or clusters[index]['tokens'] != tokens or clusters[index]['names'][0] != name:
+            continue
+        cluster = clusters[index]
+        room = token_budget - cluster['tokens']
+        neighbours = [other for other, weight in edges[index].items() if weight and clusters[other]['tokens'] <= room]
+        if neighbours:
+            target = max(neighbours, key=lambda other: (
+                edges[index][other],
+                len(os.path.commonprefix([parts[index], parts[other]])),
+                -clusters[other]['tokens'],
+                -other,
+            ))
+        else:
+            # The deepest shared directory with a cluster that fits; its smallest cluster is the one
+            # with the most room, and deeper prefixes were already ruled out.
+            target = None
+            for depth in range(len(parts[index]), -1, -1):
+                prefix = tuple(parts[index][:depth])
+                entry = smallest_other(by_prefix[prefix], index, prefix_entry_current(prefix))
+                if entry is not None and entry[0] <= room:
+                    target = entry[1]
+                    break
+            if target is None:
+                stuck.add(index)
+                continue
+        into = clusters[target]
+        # The bigger side keeps its name first so the chunk name reflects most of its content.
+        if cluster['tokens'] > into['tokens']:
+            names = cluster['names'] + into['names']
+            parts[target] = parts[index]
+        else:
+            names = into['names'] + cluster['names']
+        clusters[target] = {"names": names, "files": sorted(into['files'] + cluster['files']),
+                            "tokens": into['tokens'] + cluster['tokens']}
+        del clusters[index]
+        register(target)
+        if clusters[target]['tokens'] < minimum and target not in stuck:
+            heapq.heappush(small, (clusters[target]['tokens'], names[0], target))
+        for neighbour, weight in edges.pop(index).items():
+            edges[neighbour].pop(index, None)
+            if neighbour != target:
+                edges[target][neighbour] = edges[target].get(neighbour, 0) + weight
+                edges[neighbour][target] = edges[neighbour].get(target, 0) + weight
+    return list(clusters.values())
+
+def name_chunks(clusters: list) -> dict:
+    chunks = {}
+    for cluster in sorted(clusters, key=lambda cluster: cluster['files'][0]):
+        names = list(dict.fromkeys(cluster['names']))
+        name = " + ".join(names[:2]) + (f" + {len(names) - 2} more" if len(names) > 2 else "")
+        unique_name = name
+        part = 2
+        while unique_name in chunks:
+            unique_name = f"{name} (part {part})"
+            part += 1
+        chunks[unique_name] = cluster['files']
+    return chunks
+
+def cluster_files(file_contents: dict, token_budget: int = None) -> dict:
+    token_budget = token_budget or LOCAL_CHUNK_TOKENS
+    file_paths = select_source_files(file_contents)
+    tokens = count_file_tokens(file_contents, file_paths)
+    graph = build_import_graph(select_files(file_contents, file_paths))
+    clusters = merge_small_clusters(directory_clusters(file_paths, tokens, token_budget), graph, token_budget)
+    return name_chunks(clusters)
@@ -0,0 +1,250 @@
+import os
+import mmap
+import hashlib
+import fnmatch
+import subprocess
+from manifest import fingerprint
+from .tools import count_tokens
+from .structure import encode_repository_structure
+from .file_limits import skip_reason, limit_bytes
+
+LOCAL_MMAP_MIN_BYTES = int(os.getenv("LOCAL_MMAP_MIN_BYTES", str(1024 * 1024)))
+BARE_BATCH_SIZE = 500
+
+
+def resolve_local_path(repo: str) -> str:
+    if repo.startswith("file://"):
+        repo = repo[len("file://"):]
+    return os.path.abspath(os.path.expanduser(repo))
+
+def is_local_repo(repo: str) -> bool:
+    # Only explicit paths are local, so an owner/repo name never picks up a same-named directory in the cwd.
+    if not repo:
+        return False
+    return (repo.startswith("file://") or os.path.isabs(os.path.expanduser(repo)) or repo in (".", "..")
+            or repo.startswith(("./", "../", "." + os.sep, ".." + os.sep)))
+
+def is_inside(root: str, full_path: str) -> bool:
+    # Symlinks are resolved first, so a link in the repository cannot lead a read outside it.
+    return os.path.realpath(full_path).startswith(os.path.realpath(root) + os.sep)
+
+def run_git(root: str, *args: str) -> bytes:
+    try:
+        result = subprocess.run(["git", *args], cwd=root, capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise ValueError(f"git {' '.join(args)} failed in {root}: {e}")
+    return result.stdout
+
+def get_repo_kind(root: str) -> str:
+    if os.path.exists(os.path.join(root, ".git")):
+        return "worktree"
+    if os.path.isfile(os.path.join(root, "HEAD")) and os.path.isdir(os.path.join(root, "objects")):
+        return "bare"
+    return "directory"
+
+def read_local_file(file_path: str) -> tuple[str, str]:
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < LOCAL_MMAP_MIN_BYTES:
+            return limit_bytes(f.read())
+        # Large files are mapped, so only the head and tail that are kept are ever paged in.
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return limit_bytes(mapped)
+
+def git_blob_sha(file_path: str) -> str:
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        digest = hashlib.sha1(b"blob %d\0" % size)
+        if size < LOCAL_MMAP_MIN_BYTES:
+            digest.update(f.read())
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+    return digest.hexdigest()
+
+def parse_gitignore(root: str, directory: str) -> list:
+    rules = []
+    try:
+        with open(os.path.join(root, directory, ".gitignore"), 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return rules
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith('#'):
+            continue
+        negate = line.startswith('!')
+        pattern = line[1:] if negate else line
+        dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        anchored = '/' in pattern
+        rules.append((directory, pattern.lstrip('/'), negate, dir_only, anchored))
+    return rules
+
+def is_ignored(path: str, is_dir: bool, rules: list) -> bool:
+    ignored = False
+    for directory, pattern, negate, dir_only, anchored in rules:
+        if directory and not path.startswith(directory + '/'):
+            continue
+        if dir_only and not is_dir:
+            continue
+        relative_path = path[len(directory) + 1:] if directory else path
+        target = relative_path if anchored else relative_path.rsplit('/', 1)[-1]
+        if fnmatch.fnmatchcase(target, pattern) or (anchored and fnmatch.fnmatchcase(target, pattern + '/**')):
+            ignored = not negate
+    return ignored
+
+def walk_directory(root: str) -> list:
+    file_paths = []
+    rules_by_directory = {}
+    for current, directories, files in os.walk(root):
+        directory = os.path.relpath(current, root).replace(os.sep, '/')
+        directory = "" if directory == "." else directory
+        parent = directory.rsplit('/', 1)[0] if '/' in directory else ""
+        rules = (rules_by_directory.get(parent, []) if directory else []) + parse_gitignore(root, directory)
+        rules_by_directory[directory] = rules
+        prefix = directory + '/' if directory else ""
+        # Pruning in place stops os.walk from descending into ignored directories.
+        directories[:] = sorted(name for name in directories
+                                if name != ".git" and not is_ignored(prefix + name, True, rules))
+        file_paths.extend(prefix + name for name in sorted(files)
+                          if not is_ignored(prefix + name, False, rules) and is_inside(root, os.path.join(current, name)))
+    return file_paths
+
+def list_worktree_files(root: str) -> dict:
+    index_shas = {}
+    for entry in run_git(root, "ls-files", "-s", "-z").decode('utf-8').split('\0'):
+        if not entry:
+            continue
+        info, path = entry.split('\t', 1)
+        mode, sha, _ = info.split(' ')
+        if mode != "160000":
+            index_shas[path] = sha
+    changed = set(path for path in run_git(root, "ls-files", "-z", "-m", "-o", "--exclude-standard").decode('utf-8').split('\0') if path)
+    file_shas = {}
+    for path in sorted(set(index_shas) | changed):
+        full_path = os.path.join(root, path)
+        if not os.path.isfile(full_path) or not is_inside(root, full_path):
+            continue
+        # Unmodified tracked files reuse the index SHA; only edited or untracked files are hashed.
+        file_shas[path] = git_blob_sha(full_path) if path in changed or path not in index_shas else index_shas[path]
+    return file_shas
+
+def list_bare_files(root: str, file_sizes: dict = None) -> dict:
+    file_shas = {}
+    for entry in run_git(root, "ls-tree", "-r", "-l", "-z", "HEAD").decode('utf-8').split('\0'):
+        if not entry:
+            continue
+        info, path = entry.split('\t', 1)
+        _, kind, sha, size = info.split()
+        if kind == "blob":
+            file_shas[path] = sha
+            if file_sizes is not None:
+                file_sizes[path] = int(size)
+    return file_shas
+
+def build_tree_data(file_shas: dict, file_sizes: dict = None) -> dict:
+    tree = []
+    seen_directories = set()
+    for path in sorted(file_shas):
+        parts = path.split('/')
+        for depth in range(1, len(parts)):
+            directory = '/'.join(parts[:depth])
+            if directory not in seen_directories:
+                seen_directories.add(directory)
+                tree.append({"path": directory, "type": "tree"})
+        tree.append({"path": path, "type": "blob", "sha": file_shas[path], "size": (file_sizes or {}).get(path)})
+    return {"tree": tree}
+
+def get_local_repository_info(token: str, repo: str) -> tuple[str, str, str, dict, dict]:
+    root = resolve_local_path(repo)
+    kind = get_repo_kind(root)
+    file_sizes = {}
+    if kind == "worktree":
+        file_shas = list_worktree_files(root)
+    elif kind == "bare":
+        file_shas = list_bare_files(root, file_sizes)
+    else:
+        file_shas = {path: git_blob_sha(os.path.join(root, path)) for path in walk_directory(root)}
+
+    if kind == "directory":
+        commit_sha = fingerprint(file_shas)
+    else:
+        try:
+            commit_sha = run_git(root, "rev-parse", "HEAD").decode('utf-8').strip()
+        except ValueError:
+            # A repository without commits yet.
+            commit_sha = fingerprint(file_shas)
+
+    name = os.path.basename(root.rstrip(os.sep))
+    project_name = name[:-len(".git")] if kind == "bare" and name.endswith(".git") else name
+    if kind != "bare":
+        file_sizes = {path: os.path.getsize(os.path.join(root, path)) for path in file_shas if os.path.isfile(os.path.join(root, path))}
+    structure = encode_repository_structure(build_tree_data(file_shas, file_sizes), count_tokens)
+    return structure, project_name, commit_sha, file_shas, file_sizes
+
+def read_bare_blobs(root: str, path_to_sha: dict) -> dict:
+    blobs = {}
+    if not path_to_sha:
+        return blobs
+    request = "".join(f"{sha}\n" for sha in path_to_sha.values()).encode('utf-8')
+    try:
+        output = subprocess.run(["git", "cat-file", "--batch"], cwd=root, input=request, capture_output=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise ValueError(f"git cat-file failed in {root}: {e}")
+    position = 0
+    for path in path_to_sha:
+        header_end = output.index(b"\n", position)
+        header = output[position:header_end].split(b" ")
+        position = header_end + 1
+        if len(header) < 3:
+            # "<sha> missing"
+            continue
+        size = int(header[2])
+        blobs[path] = output[position:position + size]
+        position += size + 1
+    return blobs
+
+def fetch_local_file_contents(token: str, repo: str, file_paths: list, ref: str = None, file_shas: dict = None,
+                              file_sizes: dict = None, report: dict = None, store=None) -> dict:
+    root = resolve_local_path(repo)
+    report = {} if report is None else report
+    file_sizes = file_sizes or {}
+    file_contents = {} if store is None else store
+
+    def keep(file_path: str, result: tuple):
+        content, note = result
+        if content is not None:
+            file_contents[file_path] = content
+        if note is not None:
+            report[file_path] = note
+
+    if get_repo_kind(root) == "bare":
+        if not file_shas:
+            file_sizes = {}
+            file_shas = list_bare_files(root, file_sizes)
+        wanted = {}
+        for file_path in file_paths:
+            note = skip_reason(file_path, file_sizes.get(file_path))
+            if note is not None:
+                report[file_path] = note
+            elif file_path in file_shas:
+                wanted[file_path] = file_shas[file_path]
+        # Blobs are read in batches so only one batch of raw content is in memory at a time.
+        wanted_paths = list(wanted)
+        for start in range(0, len(wanted_paths), BARE_BATCH_SIZE):
+            batch = {path: wanted[path] for path in wanted_paths[start:start + BARE_BATCH_SIZE]}
+            for file_path, raw_content in read_bare_blobs(root, batch).items():
+                keep(file_path, limit_bytes(raw_content))
+    else:
+        for file_path in file_paths:
+            full_path = os.path.join(root, file_path)
+            # Paths come from the model, so never follow one outside the repository.
+            if not is_inside(root, full_path) or not os.path.isfile(full_path):
+                continue
+            note = skip_reason(file_path, os.path.getsize(full_path))
+            if note is not None:
+                report[file_path] = note
+                continue
+            keep(file_path, read_local_file(full_path))
+    return file_contents
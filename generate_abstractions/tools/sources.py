@@ -0,0 +1,14 @@
+from .tools import get_repository_info, fetch_file_contents
+from .local_source import is_local_repo, get_local_repository_info, fetch_local_file_contents
+
+SOURCE_PROVIDERS = {
+    "github": {"get_info": get_repository_info, "fetch_files": fetch_file_contents, "needs_token": True},
+    "local": {"get_info": get_local_repository_info, "fetch_files": fetch_local_file_contents, "needs_token": False},
+}
+
+
+def get_source_kind(repo: str) -> str:
+    return "local" if is_local_repo(repo) else "github"
+
+def get_source_provider(repo: str) -> dict:
+    return SOURCE_PROVIDERS[get_source_kind(repo)]
@@ -0,0 +1,142 @@
+import os
+import re
+import fnmatch
+
+STRUCTURE_TOKEN_BUDGET = int(os.getenv("STRUCTURE_TOKEN_BUDGET", "20000"))
+STRUCTURE_MAX_FILE_BYTES = int(os.getenv("STRUCTURE_MAX_FILE_BYTES", str(1024 * 1024)))
+EXCLUDED_DIRS = {
+    'node_modules', 'bower_components', 'jspm_packages', 'vendor', 'vendors', 'third_party', 'third-party',
+    '.git', '.hg', '.svn', '.idea', '.vscode', '.gradle', '.mvn', '.venv', 'venv', '.tox', '.nox', '.mypy_cache',
+    '.pytest_cache', '__pycache__', '.next', '.nuxt', '.cache', '.parcel-cache', 'dist', 'build', 'target',
+    'coverage', 'htmlcov', 'Pods', 'DerivedData', '.terraform', 'site-packages', '__generated__',
+}
+EXCLUDED_FILES = {
+    'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'npm-shrinkwrap.json', 'poetry.lock', 'Pipfile.lock',
+    'Cargo.lock', 'Gemfile.lock', 'composer.lock', 'go.sum', 'mix.lock', 'pubspec.lock', 'packages.lock.json',
+    'gradle-wrapper.jar', '.DS_Store', 'Thumbs.db',
+}
+BINARY_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.icns', '.webp', '.tiff', '.psd', '.svg', '.eps',
+    '.mp3', '.mp4', '.wav', '.ogg', '.flac', '.avi', '.mov', '.webm', '.mkv',
+    '.woff', '.woff2', '.ttf', '.otf', '.eot',
+    '.zip', '.tar', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.jar', '.war', '.ear', '.whl', '.egg',
+    '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
+    '.exe', '.dll', '.so', '.dylib', '.a', '.lib', '.o', '.obj', '.class', '.pyc', '.pyo', '.wasm', '.bin', '.dat',
+    '.db', '.sqlite', '.sqlite3', '.pkl', '.npy', '.npz', '.h5', '.onnx', '.pt', '.ckpt', '.parquet',
+}
+GENERATED_PATTERNS = [
+    re.compile(pattern) for pattern in (
+        r'\.min\.(js|css)$', r'\.(js|css)\.map$', r'_pb2(_grpc)?\.pyi?$', r'\.pb\.(go|cc|h)$', r'\.pb\.gw\.go$',
+        r'\.g\.dart$', r'\.freezed\.dart$', r'\.generated\.\w+$', r'\.designer\.cs$', r'(^|/)bundle\.js$', r'\.snap$',
+    )
+]
+# Directory listings are collapsed at these thresholds, loosest first, until the budget fits.
+COLLAPSE_THRESHOLDS = (None, 24, 12, 6, 3)
+SAMPLE_FILES = 3
+
+
+def is_excluded_path(path: str, size: int = None) -> bool:
+    parts = path.split('/')
+    if any(part in EXCLUDED_DIRS for part in parts[:-1]):
+        return True
+    name = parts[-1]
+    if name in EXCLUDED_FILES:
+        return True
+    extension = os.path.splitext(name)[1].lower()
+    if extension in BINARY_EXTENSIONS:
+        return True
+    if any(pattern.search(path) for pattern in GENERATED_PATTERNS):
+        return True
+    return size is not None and size > STRUCTURE_MAX_FILE_BYTES
+
+def filter_tree_paths(tree_data: dict) -> list:
+    return sorted(item['path'] for item in tree_data['tree']
+                  if item['type'] == 'blob' and not is_excluded_path(item['path'], item.get('size')))
+
+def build_path_tree(file_paths: list) -> dict:
+    root = {"dirs": {}, "files": [], "count": 0}
+    for path in file_paths:
+        node = root
+        node['count'] += 1
+        *directories, name = path.split('/')
+        for directory in directories:
+            node = node['dirs'].setdefault(directory, {"dirs": {}, "files": [], "count": 0})
+            node['count'] += 1
+        node['files'].append(name)
+    return root
+
+def describe_extensions(names: list) -> str:
+    counts = {}
+    for name in names:
+        extension = os.path.splitext(name)[1] or "(no extension)"
+        counts[extension] = counts.get(extension, 0) + 1
+    return ", ".join(f"{count} *{extension}" if extension.startswith('.') else f"{count} {extension}"
+                     for extension, count in sorted(counts.items(), key=lambda item: -item[1]))
+
+def collect_files(node: dict, prefix: str) -> list:
+    names = [prefix + name for name in node['files']]
+    for directory, child in node['dirs'].items():
+        names.extend(collect_files(child, f"{prefix}{directory}/"))
+    return names
+
+def render_path_tree(node: dict, threshold: int = None, max_depth: int = None, path: str = "", depth: int = 0) -> list:
+    lines = []
+    indent = "  " * depth
+    for directory in sorted(node['dirs']):
+        child = node['dirs'][directory]
+        child_path = f"{path}{directory}/"
+        if max_depth is not None and depth >= max_depth:
+            # Folded directories are described by their contents and referenced as a whole.
+            lines.append(f"{indent}{directory}/  [{child['count']} files: {describe_extensions(collect_files(child, ''))}; refer to it as {child_path}]")
+            continue
+        lines.append(f"{indent}{directory}/")
+        lines.extend(render_path_tree(child, threshold, max_depth, child_path, depth + 1))
+
+    by_extension = {}
+    for name in sorted(node['files']):
+        by_extension.setdefault(os.path.splitext(name)[1], []).append(name)
+    for extension, names in sorted(by_extension.items()):
+        if threshold is not None and len(names) > threshold:
+            lines.extend(f"{indent}{name}" for name in names[:SAMPLE_FILES])
+            pattern = f"{path}*{extension}" if extension else f"{path}*"
+            lines.append(f"{indent}... {len(names) - SAMPLE_FILES} more {extension or 'extensionless'} files [refer to them as {pattern}]")
+        else:
+            lines.extend(f"{indent}{name}" for name in names)
+    return lines
+
+def encode_repository_structure(tree_data: dict, count_tokens, token_budget: int = None) -> str:
+    token_budget = token_budget or STRUCTURE_TOKEN_BUDGET
+    tree = build_path_tree(filter_tree_paths(tree_data))
+    structure = ""
+    for threshold in COLLAPSE_THRESHOLDS:
+        structure = "\n".join(render_path_tree(tree, threshold))
+        if count_tokens(structure) <= token_budget:
+            return structure
+    # Still too large: fold whole directories, starting deep and moving towards the root.
+    deepest = max_tree_depth(tree)
+    for max_depth in range(deepest - 1, -1, -1):
+        structure = "\n".join(render_path_tree(tree, COLLAPSE_THRESHOLDS[-1], max_depth))
+        if count_tokens(structure) <= token_budget:
+            return structure
+    return structure
+
+def max_tree_depth(node: dict) -> int:
+    return 1 + max((max_tree_depth(child) for child in node['dirs'].values()), default=0)
+
+def expand_chunk_paths(chunks: dict, file_paths) -> dict:
+    # Chunk entries may name a folded directory ("src/legacy/") or a collapsed pattern ("src/api/*.py").
+    candidates = [path for path in sorted(file_paths) if not is_excluded_path(path)]
+    expanded = {}
+    for chunk_name, entries in chunks.items():
+        paths = []
+        for entry in entries:
+            if entry.endswith('/'):
+                paths.extend(path for path in candidates if path.startswith(entry))
+            elif any(char in entry for char in '*?['):
+                directory = entry.rsplit('/', 1)[0] + '/' if '/' in entry else ''
+                paths.extend(path for path in candidates
+                             if path.startswith(directory) and '/' not in path[len(directory):] and fnmatch.fnmatchcase(path, entry))
+            else:
+                paths.append(entry)
+        expanded[chunk_name] = list(dict.fromkeys(paths))
+    return expanded
@@ -1,87 +1,189 @@
+import os
 import requests
-import re
 import base64
+import tarfile
+import hashlib
+import threading
+import contextvars
 import concurrent.futures
+from cache import get_blob_cache
+from file_store import select_files, iter_file_batches
+from .github_client import github_get, get_fetch_pool
+from .structure import encode_repository_structure
+from .file_limits import skip_reason, limit_bytes, read_limited, read_file_blocks, READ_BLOCK_BYTES
 
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip('/')
+GITHUB_FETCH_MODE = os.getenv("GITHUB_FETCH_MODE", "archive")
+GITHUB_ARCHIVE_MIN_FILES = int(os.getenv("GITHUB_ARCHIVE_MIN_FILES", "20"))
+# The Contents API stops inlining file content above this size.
+CONTENTS_API_MAX_BYTES = 1024 * 1024
+BLOB_BATCH_SIZE = 500
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+TOKEN_COUNT_CACHE_SIZE = 100000
+
+_encoding = None
+_encoding_failed = False
+_token_counts = {}
+_token_counts_lock = threading.Lock()
 
-def format_repository_structure(tree_data):
-    structure_lines = []
-    for item in tree_data['tree']:
-        path = item['path']
-        depth = path.count('/')
-        indent = "  " * depth
-        name = path.split('/')[-1]
-        
-        if item['type'] == 'tree':
-            structure_lines.append(f"{indent}{name}/")
-        else:
-            structure_lines.append(f"{indent}{name}")
-    
-    return "\n".join(structure_lines)
 
+def index_repository_tree(tree_data) -> dict:
+    return {item['path']: item['sha'] for item in tree_data['tree'] if item['type'] == 'blob'}
 
-def get_repository_info(token: str, repo: str) -> dict:
-    repo_url = f"https://api.github.com/repos/{repo}"
-    headers = {"Authorization": f"token {token}"}
-    repo_response = requests.get(repo_url, headers=headers)
+def index_repository_sizes(tree_data) -> dict:
+    return {item['path']: item['size'] for item in tree_data['tree'] if item['type'] == 'blob' and item.get('size') is not None}
+
+
+def get_repository_info(token: str, repo: str) -> tuple[str, str, str, dict, dict]:
+    repo_url = f"{GITHUB_API_URL}/repos/{repo}"
+    repo_response = github_get(repo_url, token)
     repo_response.raise_for_status()
     repo_data = repo_response.json()
     default_branch = repo_data['default_branch']
     project_name = repo_data['name']
     
-    tree_url = f"https://api.github.com/repos/{repo}/git/trees/{default_branch}?recursive=1"
-    response = requests.get(tree_url, headers=headers)
+    commit_url = f"{GITHUB_API_URL}/repos/{repo}/commits/{default_branch}"
+    commit_response = github_get(commit_url, token)
+    commit_response.raise_for_status()
+    commit_sha = commit_response.json()['sha']
+    
+    tree_url = f"{GITHUB_API_URL}/repos/{repo}/git/trees/{commit_sha}?recursive=1"
+    response = github_get(tree_url, token)
     response.raise_for_status()
     tree_data = response.json()
     
-    structure = format_repository_structure(tree_data)
-    return structure, project_name
+    structure = encode_repository_structure(tree_data, count_tokens)
+    file_shas = index_repository_tree(tree_data)
+    return structure, project_name, commit_sha, file_shas, index_repository_sizes(tree_data)
+
+def fetch_repository_archive(token: str, repo: str, ref: str, file_paths: list, report: dict = None, file_contents=None) -> dict:
+    wanted_paths = set(file_paths)
+    seen_paths = set()
+    file_contents = {} if file_contents is None else file_contents
+    report = {} if report is None else report
+    archive_url = f"{GITHUB_API_URL}/repos/{repo}/tarball/{ref}"
+    
+    with github_get(archive_url, token, stream=True) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        # "r|gz" reads the archive as a forward-only stream, so only one member is held in memory at a time.
+        with tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                # Archive entries are prefixed with a single "<owner>-<repo>-<sha>/" directory.
+                file_path = member.name.split('/', 1)[-1]
+                if file_path not in wanted_paths or file_path in seen_paths:
+                    continue
+                seen_paths.add(file_path)
+                note = skip_reason(file_path, member.size)
+                content = None
+                if note is None:
+                    content, note = read_limited(read_file_blocks(archive.extractfile(member)))
+                if content is not None:
+                    file_contents[file_path] = content
+                if note is not None:
+                    report[file_path] = note
+                if len(seen_paths) == len(wanted_paths):
+                    break
+    return file_contents
+
+def load_cached_blobs(file_paths: list, file_shas: dict) -> dict:
+    blob_cache = get_blob_cache()
+    if blob_cache is None or not file_shas:
+        return {}
+    path_to_sha = {path: file_shas[path] for path in file_paths if path in file_shas}
+    blobs = blob_cache.get_many(set(path_to_sha.values()))
+    return {path: blobs[sha].decode('utf-8') for path, sha in path_to_sha.items() if sha in blobs}
+
+def store_cached_blobs(file_contents: dict, file_shas: dict):
+    blob_cache = get_blob_cache()
+    if blob_cache is None or not file_shas:
+        return
+    blob_cache.set_many({file_shas[path]: content.encode('utf-8')
+                         for path, content in file_contents.items() if path in file_shas})
 
-def fetch_file_contents(token: str, repo: str, file_paths: list) -> dict:
-    file_contents = {}
-    headers = {"Authorization": f"token {token}"}
+def fetch_raw_file(token: str, repo: str, file_path: str, ref: str = None, sha: str = None) -> tuple[str, str]:
+    # Raw bodies are streamed, so files past the Contents API limit arrive without being held in full.
+    if sha:
+        url, params = f"{GITHUB_API_URL}/repos/{repo}/git/blobs/{sha}", None
+    else:
+        url, params = f"{GITHUB_API_URL}/repos/{repo}/contents/{file_path}", ({"ref": ref} if ref else None)
+    with github_get(url, token, params=params, stream=True, accept="application/vnd.github.raw") as response:
+        if response.status_code != 200:
+            return None, "unavailable"
+        return read_limited(response.iter_content(READ_BLOCK_BYTES))
+
+def fetch_file_contents(token: str, repo: str, file_paths: list, ref: str = None, mode: str = None, file_shas: dict = None,
+                        file_sizes: dict = None, report: dict = None, store=None) -> dict:
+    # Files that are skipped or cut short are recorded in report as path -> "binary", "too_large",
+    # "unavailable" or "truncated". With a store, each file is written to it as it arrives.
+    report = {} if report is None else report
+    file_sizes = file_sizes or {}
+    for file_path in file_paths:
+        note = skip_reason(file_path, file_sizes.get(file_path))
+        if note is not None:
+            report[file_path] = note
+    file_paths = [file_path for file_path in file_paths if file_path not in report]
+    
+    file_contents = {} if store is None else store
+    cached_paths = set()
+    for start in range(0, len(file_paths), BLOB_BATCH_SIZE):
+        cached = load_cached_blobs(file_paths[start:start + BLOB_BATCH_SIZE], file_shas)
+        file_contents.update(cached)
+        cached_paths.update(cached)
+    mode = mode or GITHUB_FETCH_MODE
+    missing_paths = [file_path for file_path in file_paths if file_path not in file_contents]
+    
+    # A handful of changed files is cheaper to fetch individually than via the whole archive.
+    if ref and mode == "archive" and len(missing_paths) >= GITHUB_ARCHIVE_MIN_FILES:
+        try:
+            fetch_repository_archive(token, repo, ref, missing_paths, report, file_contents)
+        except (requests.RequestException, tarfile.TarError) as e:
+            print(f"Archive download failed for {repo}@{ref}, falling back to per-file fetch: {e}")
     
     def fetch_single_file(file_path):
         """Helper function to fetch a single file's content"""
-        file_url = f"https://api.github.com/repos/{repo}/contents/{file_path}"
-        response = requests.get(file_url, headers=headers)
+        size = file_sizes.get(file_path)
+        if size is not None and size > CONTENTS_API_MAX_BYTES:
+            return (file_path, *fetch_raw_file(token, repo, file_path, ref, (file_shas or {}).get(file_path)))
+        
+        file_url = f"{GITHUB_API_URL}/repos/{repo}/contents/{file_path}"
+        params = {"ref": ref} if ref else None
+        response = github_get(file_url, token, params=params)
         
         if response.status_code == 200:
             file_data = response.json()
-            if 'content' in file_data:
-                try:
-                    content = base64.b64decode(file_data['content']).decode('utf-8')
-                    return file_path, content
-                except Exception as e:
-                    print(f"Error decoding content for {file_path}: {e}")
+            if file_data.get('content') and file_data.get('encoding', 'base64') == 'base64':
+                return (file_path, *limit_bytes(base64.b64decode(file_data['content'])))
+            if file_data.get('type') == 'file':
+                # Too large to inline: the response carries metadata only.
+                return (file_path, *fetch_raw_file(token, repo, file_path, ref, file_data.get('sha')))
         
-        return file_path, None
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_file = {executor.submit(fetch_single_file, file_path): file_path 
-                          for file_path in file_paths if file_path not in file_contents}
-        for future in concurrent.futures.as_completed(future_to_file):
-            file_path, content = future.result()
-            if content is not None:
-                file_contents[file_path] = content
-    return file_contents
+        return file_path, None, "unavailable"
 
-def sanitize_json_response(response_text: str) -> str:
-    response_text = response_text.strip()
-    json_pattern = r'```(?:json)?\s*([\s\S]*?)```'
-    matches = re.findall(json_pattern, response_text)
-    
-    if matches:
-        response_text = matches[0].strip()
-    elif response_text.startswith('{') and response_text.endswith('}'):
-        pass
-    else:
-        json_content_pattern = r'({[\s\S]*?})'
-        content_matches = re.findall(json_content_pattern, response_text)
-        if content_matches:
-            response_text = content_matches[0].strip()
+    executor = get_fetch_pool()
+    # Requests are counted against the run that made them, so the pool threads get its context.
+    future_to_file = {executor.submit(contextvars.copy_context().run, fetch_single_file, file_path): file_path 
+                      for file_path in file_paths if file_path not in file_contents and file_path not in report}
+    for future in concurrent.futures.as_completed(future_to_file):
+        file_path, content, note = future.result()
+        if content is not None:
+            file_contents[file_path] = content
+        if note is not None:
+            report[file_path] = note
     
-    return response_text
+    # Truncated text depends on the current limits, so only complete files go into the blob cache.
+    new_paths = [path for path in file_contents if path not in cached_paths and path not in report]
+    if get_blob_cache() is not None and file_shas:
+        for batch_paths, batch_contents in iter_file_batches(file_contents, new_paths, BLOB_BATCH_SIZE):
+            store_cached_blobs(dict(zip(batch_paths, batch_contents)), file_shas)
+    return file_contents
 
 def get_unique_file_paths(chunks):
     file_paths = []
@@ -90,26 +192,67 @@ def get_unique_file_paths(chunks):
     return list(set(file_paths))
 
 def map_chunks_to_files(chunks, file_contents):
-    result = {}
-    for chunk_name, file_paths in chunks.items():
-        chunk_files = {}
-        for file_path in file_paths:
-            if file_path in file_contents:
-                chunk_files[file_path] = file_contents[file_path]
-        result[chunk_name] = chunk_files
-    return result
+    # With a file store each chunk is a view that reads its files only when a prompt is built.
+    return {chunk_name: select_files(file_contents, file_paths) for chunk_name, file_paths in chunks.items()}
 
-def count_tokens(text: str) -> int:
+def estimate_tokens(text: str) -> int:
     return len(text) // 4
 
+def get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception as e:
+            # The encoding file is downloaded on first use; without it we keep the character heuristic.
+            print(f"Tokenizer unavailable, falling back to character estimate: {e}")
+            _encoding_failed = True
+    return _encoding
+
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+def count_tokens_batch(texts: list) -> list:
+    encoding = get_encoding()
+    if encoding is None:
+        return [estimate_tokens(text) for text in texts]
+    
+    keys = [content_hash(text) for text in texts]
+    with _token_counts_lock:
+        counts = {key: _token_counts[key] for key in keys if key in _token_counts}
+    missing = {key: text for key, text in zip(keys, texts) if key not in counts}
+    if missing:
+        encoded = encoding.encode_batch(list(missing.values()), disallowed_special=())
+        new_counts = {key: len(tokens) for key, tokens in zip(missing, encoded)}
+        counts.update(new_counts)
+        with _token_counts_lock:
+            if len(_token_counts) + len(new_counts) > TOKEN_COUNT_CACHE_SIZE:
+                _token_counts.clear()
+            _token_counts.update(new_counts)
+    return [counts[key] for key in keys]
+
+def count_tokens(text: str) -> int:
+    return count_tokens_batch([text])[0]
+
+def count_file_tokens(file_contents, file_paths) -> dict:
+    tokens = {}
+    for batch_paths, batch_contents in iter_file_batches(file_contents, file_paths):
+        tokens.update(zip(batch_paths, count_tokens_batch(batch_contents)))
+    return tokens
+
 def count_tokens_per_chunk(chunks_with_contents: dict) -> dict:
     result = {
         "total": 0,
         "per_chunk": {}
     }
     
+    # Files are encoded in batches; unchanged files already counted by this process are served from memory.
+    path_tokens = {}
+    for files in chunks_with_contents.values():
+        path_tokens.update(count_file_tokens(files, [path for path in files if path not in path_tokens]))
+    
     for chunk_name, files in chunks_with_contents.items():
-        file_tokens = {path: count_tokens(content) for path, content in files.items()}
+        file_tokens = {path: path_tokens[path] for path in files}
         chunk_total = sum(file_tokens.values())
         result["per_chunk"][chunk_name] = {
             "total": chunk_total,
@@ -123,9 +266,10 @@ def create_context_and_file_listing(chunks_with_contents: dict) -> tuple[str, st
     all_files = []
     
     for files in chunks_with_contents.values():
-        for file_path, content in files.items():
-            context_parts.append(f"=== {file_path} ===\n{content}\n")
-            all_files.append(file_path)
+        for batch_paths, batch_contents in iter_file_batches(files, list(files)):
+            for file_path, content in zip(batch_paths, batch_contents):
+                context_parts.append(f"=== {file_path} ===\n{content}\n")
+                all_files.append(file_path)
     
     context = "\n".join(context_parts)
     file_listing = "\n".join([f"- {file_path}" for file_path in all_files])
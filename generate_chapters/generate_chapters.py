@@ -1,106 +1,187 @@
-import json
+import os
+import contextvars
+import concurrent.futures
 from langchain_core.prompts import PromptTemplate
 from LLM import model
-from .tools.tools import map_content_to_abstractions, save_chapter_to_file, ensure_output_directory, sanitize_chapter_json_response, check_content_completeness
-from prompts import create_chapters_prompt, chapter_json_fixing_prompt
+from .tools.tools import map_content_to_abstractions, sanitize_markdown_content, ensure_output_directory, check_content_completeness, select_shared_files, render_shared_files
+from .tools.chapter_writer import ChapterWriter, repo_output_dir
+from .tools.summary_memory import build_summary_memory
+from .tools.chapter_order import order_abstractions, find_related_files
+from generate_abstractions.tools.import_graph import build_import_graph
+from prompts import create_chapters_prefix_prompt, create_chapters_prompt, chapter_json_fixing_prompt
 from state import State
+from manifest import fingerprint, blob_shas_for
+from events import get_event_writer
+from json_repair import parse_model_json
+from checkpoint import save_checkpoint, load_checkpoints
 
+CHAPTER_CONCURRENCY = int(os.getenv("CHAPTER_CONCURRENCY", "1"))
+
+
+def describe_previous_chapters(abstractions: list, index: int) -> str:
+    return build_summary_memory([abstraction['name'] for abstraction in abstractions[:index]],
+                                [abstraction['description'] for abstraction in abstractions[:index]])
+
+def format_chapters_prefix(project_name: str, complete_tutorial_structure: str, shared_file_context: str) -> str:
+    # Identical for every chapter of the run, so it is sent first and registered with the context cache once.
+    prompt_template = PromptTemplate.from_template(create_chapters_prefix_prompt)
+    return prompt_template.format(
+        project_name=project_name,
+        complete_tutorial_structure=complete_tutorial_structure,
+        shared_file_context=shared_file_context
+    )
+
+def generate_chapter(project_name: str, abstraction: dict, chapter_num: int, prompt_prefix: str,
+                     previous_chapters_summary: str, chapter_content: str, on_text=None) -> tuple[str, str]:
+    chapter_name = abstraction['name']
+    prompt_template = PromptTemplate.from_template(create_chapters_prompt)
+    formatted_prompt = prompt_template.format(
+        project_name=project_name,
+        abstraction_name=chapter_name,
+        chapter_num=chapter_num,
+        abstraction_description=abstraction['description'],
+        previous_chapters_summary=previous_chapters_summary,
+        file_context_str=chapter_content
+    )
+
+    try:
+        if on_text is None:
+            response = model.generate_content(formatted_prompt, prefix=prompt_prefix).text
+        else:
+            response_parts = []
+            for text in model.stream_content(formatted_prompt, prefix=prompt_prefix):
+                response_parts.append(text)
+                on_text(text)
+            response = "".join(response_parts)
+        chapter_json = parse_model_json(response, chapter_json_fixing_prompt, model, dict, ("markdown_content", "summary"))
+        if chapter_json is None:
+            raise ValueError(f"Failed to parse chapter JSON for {chapter_name} after multiple attempts.")
+
+        markdown_content = chapter_json['markdown_content']
+        summary = chapter_json['summary']
+        is_complete, warning_msg = check_content_completeness(markdown_content, chapter_name)
+        if not is_complete:
+            if len(markdown_content.strip()) < 200:
+                raise ValueError(f"Generated content for {chapter_name} is too short: {len(markdown_content)} characters")
+
+        return markdown_content, summary
+
+    except Exception as chapter_error:
+        # Keep a rejected response out of the cache so a rerun asks the model again.
+        model.discard(formatted_prompt, prefix=prompt_prefix)
+        raise
 
 def generate_chapters(state: State) -> dict:
-    chapters = {}
-    summaries = []
-    chapter_files = map_content_to_abstractions(state['file_contents'], state['abstractions'])
-    output_dir = ensure_output_directory()
-    
+    # The import graph orders chapters foundations-first and lends each chapter its neighbouring files.
+    import_graph = build_import_graph(state['file_contents'])
+    abstractions = order_abstractions(state['abstractions'], import_graph)
+    related_files = {abstraction['name']: find_related_files(abstraction, import_graph) for abstraction in abstractions}
+    chapter_records = [None] * len(abstractions)
+    # Each repository gets its own directory under out/ unless the caller chose one.
+    writer = ChapterWriter(state.get('output_dir') or repo_output_dir(ensure_output_directory(), state['repo']))
+
     complete_tutorial_structure = ""
-    for i, abstraction in enumerate(state['abstractions'], 1):
+    for i, abstraction in enumerate(abstractions, 1):
         complete_tutorial_structure += f"Chapter {i}: {abstraction['name']}\n"
-    
+
     project_name = state.get('project_name', 'Unknown Project')
-    
-    for i, abstraction in enumerate(state['abstractions']):
+    previous_chapters = (state.get('previous_manifest') or {}).get('chapters') or {}
+    repo = state['repo']
+    commit_sha = state.get('commit_sha')
+    # Chapters finished before an interrupted run are picked up again when resuming.
+    checkpointed_chapters = load_checkpoints(repo, commit_sha, "chapter:") if state.get('resume') and commit_sha else {}
+    pending = []
+    emit = get_event_writer()
+
+    def saved(chapter_num: int, chapter_name: str, reused: bool):
+        # Called by the writer once the chapter file is in place.
+        return lambda path, changed: emit({"event": "chapter_saved", "chapter_num": chapter_num, "name": chapter_name,
+                                           "path": path, "reused": reused, "changed": changed})
+
+    for i, abstraction in enumerate(abstractions):
         chapter_name = abstraction['name']
-        chapter_desc = abstraction['description']
-        chapter_content = chapter_files.get(chapter_name, "")
         chapter_num = i + 1
-        
-        if i == 0:
-            previous_chapters_summary = "This is the first chapter"
+        chapter_inputs = fingerprint(
+            project_name, chapter_num, chapter_name, abstraction['description'], abstraction['file_paths'],
+            blob_shas_for(abstraction['file_paths'] + related_files[chapter_name], state.get('file_shas')), complete_tutorial_structure
+        )
+
+        candidates = (checkpointed_chapters.get(chapter_name), previous_chapters.get(chapter_name))
+        previous_chapter = next((chapter for chapter in candidates if chapter and chapter.get('inputs') == chapter_inputs), None)
+        if previous_chapter:
+            writer.write(chapter_num, chapter_name, sanitize_markdown_content(previous_chapter['markdown_content']),
+                         on_saved=saved(chapter_num, chapter_name, True))
+            chapter_records[i] = previous_chapter
         else:
-            previous_chapters_summary = " ".join(summaries)
-        
-        prompt_template = PromptTemplate.from_template(create_chapters_prompt)
-        formatted_prompt = prompt_template.format(
-            project_name=project_name,
-            abstraction_name=chapter_name,
-            chapter_num=chapter_num,
-            abstraction_description=chapter_desc,
-            complete_tutorial_structure=complete_tutorial_structure,
-            previous_chapters_summary=previous_chapters_summary,
-            file_context_str=chapter_content
+            pending.append((i, chapter_inputs))
+
+    # Files used by several chapters are sent once in the shared prefix instead of in each chapter.
+    shared_files = select_shared_files(state['file_contents'], abstractions) if pending else []
+    prompt_prefix = format_chapters_prefix(project_name, complete_tutorial_structure,
+                                           render_shared_files(state['file_contents'], shared_files)) if pending else ""
+
+    def build_chapter(i: int, chapter_inputs: str, previous_chapters_summary: str) -> dict:
+        abstraction = abstractions[i]
+        chapter_name = abstraction['name']
+        chapter_num = i + 1
+        emit({"event": "chapter_started", "chapter_num": chapter_num, "name": chapter_name})
+        # Built per chapter, so only the chapters in flight hold their source context.
+        chapter_files = map_content_to_abstractions(state['file_contents'], [abstraction], related_files=related_files,
+                                                    shared_files=shared_files)
+        markdown_content, summary = generate_chapter(
+            project_name, abstraction, chapter_num, prompt_prefix,
+            previous_chapters_summary, chapter_files.get(chapter_name, ""),
+            on_text=lambda text: emit({"event": "chapter_delta", "chapter_num": chapter_num, "text": text})
         )
-        
-        try:
-            response = model.generate_content(formatted_prompt).text
-            sanitized_response = sanitize_chapter_json_response(response)
-            
-            chapter_json = None
-            parsing_attempts = 0
-            
-            try:
-                parsing_attempts += 1
-                chapter_json = json.loads(sanitized_response)
-                
-            except json.JSONDecodeError as e:
-                json_fix_template = PromptTemplate.from_template(chapter_json_fixing_prompt)
-                max_retries = 3
-                current_try = 0
-                while current_try < max_retries:
-                    current_try += 1
-                    parsing_attempts += 1
-                    
-                    formatted_fix_prompt = json_fix_template.format(response_text=sanitized_response)
-                    
-                    try:
-                        response = model.generate_content(formatted_fix_prompt).text
-                        sanitized_response = sanitize_chapter_json_response(response)
-                        chapter_json = json.loads(sanitized_response)
-                        break
-                        
-                    except json.JSONDecodeError as fix_error:
-                        continue
-                        
-                if chapter_json is None:
-                    error_msg = f"Failed to parse chapter JSON for {chapter_name} after {parsing_attempts} attempts."
-                    raise ValueError(error_msg)
-            
-            if 'markdown_content' not in chapter_json:
-                raise ValueError(f"Missing 'markdown_content' in chapter JSON for {chapter_name}")
-                
-            if 'summary' not in chapter_json:
-                raise ValueError(f"Missing 'summary' in chapter JSON for {chapter_name}")
-            
-            markdown_content = chapter_json['markdown_content']
-            summary = chapter_json['summary']
-            is_complete, warning_msg = check_content_completeness(markdown_content, chapter_name)
-            if not is_complete:
-                if len(markdown_content.strip()) < 200:
-                    raise ValueError(f"Generated content for {chapter_name} is too short: {len(markdown_content)} characters")
-            
-            try:
-                saved_file_path = save_chapter_to_file(markdown_content, chapter_name, chapter_num, output_dir)
-                
-                with open(saved_file_path, 'r', encoding='utf-8') as f:
-                    saved_content = f.read()
-                    
-            except Exception as save_error:
-                raise save_error
-
-            chapters[chapter_name] = markdown_content
-            summaries.append(summary)
-            
-        except Exception as chapter_error:
-            raise
-    
-    return {"summary": summaries}
 
+        # Handed to the background writer, which moves the file into place and then emits chapter_saved.
+        writer.write(chapter_num, chapter_name, sanitize_markdown_content(markdown_content),
+                     on_saved=saved(chapter_num, chapter_name, False))
+
+        chapter_record = {
+            "inputs": chapter_inputs,
+            "chapter_num": chapter_num,
+            "markdown_content": markdown_content,
+            "summary": summary
+        }
+        if commit_sha:
+            save_checkpoint(repo, commit_sha, "chapter:" + chapter_name, chapter_record)
+        return chapter_record
+
+    # The prefix is only worth registering when more than one chapter will be sent with it.
+    shared_prefix = len(pending) > 1
+    if shared_prefix:
+        model.share_prefix(prompt_prefix)
+    try:
+        if CHAPTER_CONCURRENCY <= 1:
+            for i, chapter_inputs in pending:
+                previous_chapters_summary = build_summary_memory([abstraction['name'] for abstraction in abstractions[:i]],
+                                                                 [record['summary'] for record in chapter_records[:i]])
+                chapter_records[i] = build_chapter(i, chapter_inputs, previous_chapters_summary)
+        else:
+            # Summaries of earlier chapters are not available yet, so each chapter is told about its
+            # predecessors through their abstraction descriptions, which are all known up front.
+            with concurrent.futures.ThreadPoolExecutor(max_workers=CHAPTER_CONCURRENCY) as executor:
+                # Worker threads do not inherit the graph's run context, which the event writer needs.
+                futures = {i: executor.submit(contextvars.copy_context().run, build_chapter, i, chapter_inputs,
+                                              describe_previous_chapters(abstractions, i))
+                           for i, chapter_inputs in pending}
+                try:
+                    for i, future in futures.items():
+                        chapter_records[i] = future.result()
+                except Exception:
+                    for future in futures.values():
+                        future.cancel()
+                    raise
+    except BaseException:
+        writer.discard()
+        raise
+    finally:
+        if shared_prefix:
+            model.release_prefix(prompt_prefix)
+
+    output = writer.publish(project_name)
+    emit({"event": "output_published", "path": writer.output_dir, **output})
+    chapters = {abstraction['name']: record for abstraction, record in zip(abstractions, chapter_records)}
+    summaries = [record['summary'] for record in chapter_records]
+    return {"abstractions": abstractions, "summary": summaries, "manifest": {"chapters": chapters}}
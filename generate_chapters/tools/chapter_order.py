@@ -0,0 +1,62 @@
+import os
+
+CHAPTER_ORDER = os.getenv("CHAPTER_ORDER", "dependencies")
+CHAPTER_RELATED_FILES = int(os.getenv("CHAPTER_RELATED_FILES", "5"))
+
+
+def abstraction_dependencies(abstractions: list, import_graph: dict) -> list:
+    # dependencies[i][j] counts the imports from files of abstraction i into files of abstraction j.
+    owners = {}
+    for index, abstraction in enumerate(abstractions):
+        for file_path in abstraction.get('file_paths', []):
+            owners.setdefault(file_path, set()).add(index)
+    dependencies = [{} for _ in abstractions]
+    for source, targets in import_graph.items():
+        for index in owners.get(source, ()):
+            for target in targets:
+                for other in owners.get(target, ()):
+                    if other != index:
+                        dependencies[index][other] = dependencies[index].get(other, 0) + 1
+    return dependencies
+
+def order_abstractions(abstractions: list, import_graph: dict) -> list:
+    # Topological order with the modules everything else builds on first; the model's order breaks ties.
+    if CHAPTER_ORDER != "dependencies" or len(abstractions) < 2:
+        return list(abstractions)
+    dependencies = abstraction_dependencies(abstractions, import_graph)
+    dependents = [0] * len(abstractions)
+    for index_dependencies in dependencies:
+        for other in index_dependencies:
+            dependents[other] += 1
+
+    placed = []
+    remaining = set(range(len(abstractions)))
+    while remaining:
+        ready = [index for index in remaining if not any(other in remaining for other in dependencies[index])]
+        if ready:
+            index = min(ready)
+        else:
+            # An import cycle: start with the abstraction that depends least on the rest and is used most.
+            index = min(remaining, key=lambda index: (
+                sum(weight for other, weight in dependencies[index].items() if other in remaining),
+                -dependents[index],
+                index,
+            ))
+        placed.append(index)
+        remaining.discard(index)
+    return [abstractions[index] for index in placed]
+
+def find_related_files(abstraction: dict, import_graph: dict, limit: int = None) -> list:
+    # Files one import away from the abstraction, most connected first, that the model did not list.
+    limit = CHAPTER_RELATED_FILES if limit is None else limit
+    own_files = set(abstraction.get('file_paths', []))
+    scores = {}
+    for file_path in own_files:
+        for target in import_graph.get(file_path, ()):
+            scores[target] = scores.get(target, 0) + 1
+    for source, targets in import_graph.items():
+        shared = len(own_files.intersection(targets))
+        if shared and source not in own_files:
+            scores[source] = scores.get(source, 0) + shared
+    related = sorted((path for path in scores if path not in own_files), key=lambda path: (-scores[path], path))
+    return related[:limit]
@@ -0,0 +1,190 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import contextvars
+import concurrent.futures
+from contextlib import contextmanager
+from urllib.parse import quote
+from .tools import create_safe_filename
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Written next to the chapters: content hashes of every file this writer owns in the directory.
+OUTPUT_MANIFEST_NAME = ".chapters.json"
+OUTPUT_LOCK_NAME = ".chapters.lock"
+# Temporary files of runs that were killed are removed by the next publish after this long even
+# when their process id has been reused.
+TEMP_FILE_MAX_AGE_SECONDS = 24 * 3600
+INDEX_NAME = "index.md"
+TUTORIAL_NAME = "tutorial.md"
+
+
+def repo_output_dir(output_root: str, repo: str) -> str:
+    safe_name = re.sub(r'[^A-Za-z0-9._-]+', '__', repo.strip('/'))
+    return os.path.join(output_root, safe_name)
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def write_atomic(path: str, text: str):
+    # Readers and interrupted runs only ever see the old file or the complete new one.
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+def load_output_manifest(output_dir: str) -> dict:
+    path = os.path.join(output_dir, OUTPUT_MANIFEST_NAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('files', {})
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"Ignoring unreadable output manifest {path}: {e}")
+        return {}
+
+def save_output_manifest(output_dir: str, files: dict):
+    write_atomic(os.path.join(output_dir, OUTPUT_MANIFEST_NAME), json.dumps({"files": files}, indent=2))
+
+@contextmanager
+def output_lock(output_dir: str):
+    # Runs writing to the same directory publish one at a time. Without fcntl (Windows) only the
+    # atomic renames protect the files.
+    with open(os.path.join(output_dir, OUTPUT_LOCK_NAME), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+def process_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        pass
+    return True
+
+def sweep_temp_files(output_dir: str) -> int:
+    # Removes the temporary files of write_atomic left behind by killed runs. A file still in use
+    # belongs to a running process and is younger than TEMP_FILE_MAX_AGE_SECONDS.
+    removed = 0
+    for entry in os.scandir(output_dir):
+        parts = entry.name.rsplit('.', 3)
+        if len(parts) != 4 or parts[3] != 'tmp' or not parts[1].isdigit() or not entry.is_file(follow_symlinks=False):
+            continue
+        try:
+            age = time.time() - entry.stat(follow_symlinks=False).st_mtime
+        except FileNotFoundError:
+            continue
+        if process_running(int(parts[1])) and age < TEMP_FILE_MAX_AGE_SECONDS:
+            continue
+        try:
+            os.remove(entry.path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def render_index(project_name: str, chapters: list) -> str:
+    lines = [f"# Tutorial: {project_name}", ""]
+    for chapter in chapters:
+        lines.append(f"{chapter['chapter_num']}. [{chapter['name']}]({quote(chapter['filename'])})")
+    return "\n".join(lines) + "\n"
+
+def render_tutorial(project_name: str, chapters: list) -> str:
+    return f"# Tutorial: {project_name}\n\n" + "\n\n---\n\n".join(chapter['content'] for chapter in chapters) + "\n"
+
+
+# Chapters are written by a background thread as soon as they are generated, so the model calls
+# never wait on the disk. Each one is moved into place under the directory lock and recorded in the
+# manifest; chapters whose hash matches the manifest are left alone. publish() then renders index.md
+# and tutorial.md from the in-memory chapters and removes files of chapters that no longer exist.
+class ChapterWriter:
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.chapters = {}
+        self.futures = []
+        self.report = {"written": 0, "unchanged": 0, "removed": 0}
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="chapter-writer")
+        self._lock = threading.Lock()
+
+    def write(self, chapter_num: int, chapter_name: str, content: str, on_saved=None) -> str:
+        # Returns the chapter's final path. on_saved(path, changed) is called from the writer thread
+        # once the file is in place.
+        filename = create_safe_filename(chapter_name, chapter_num)
+        chapter = {"chapter_num": chapter_num, "name": chapter_name, "filename": filename, "content": content,
+                   "hash": content_hash(content)}
+        with self._lock:
+            self.chapters[chapter_num] = chapter
+            # The callback runs in the caller's context, where the event writer and metrics run live.
+            self.futures.append(self.executor.submit(contextvars.copy_context().run, self.save, chapter, on_saved))
+        return os.path.join(self.output_dir, filename)
+
+    def save(self, chapter: dict, on_saved=None):
+        path = os.path.join(self.output_dir, chapter['filename'])
+        with output_lock(self.output_dir):
+            files = load_output_manifest(self.output_dir)
+            changed = files.get(chapter['filename']) != chapter['hash'] or not os.path.exists(path)
+            if changed:
+                write_atomic(path, chapter['content'])
+                # Recorded at once, so a later publish removes it even if this run never publishes.
+                files[chapter['filename']] = chapter['hash']
+                save_output_manifest(self.output_dir, files)
+        self.report["written" if changed else "unchanged"] += 1
+        if on_saved is not None:
+            on_saved(path, changed)
+
+    def wait(self):
+        with self._lock:
+            futures = list(self.futures)
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def publish(self, project_name: str) -> dict:
+        self.wait()
+        chapters = [self.chapters[chapter_num] for chapter_num in sorted(self.chapters)]
+        outputs = [(INDEX_NAME, render_index(project_name, chapters)), (TUTORIAL_NAME, render_tutorial(project_name, chapters))]
+        report = dict(self.report)
+        with output_lock(self.output_dir):
+            # Another run may have written into the directory since; compare against what is on disk now.
+            current = load_output_manifest(self.output_dir)
+            files = {}
+            for chapter in chapters:
+                path = os.path.join(self.output_dir, chapter['filename'])
+                if current.get(chapter['filename']) != chapter['hash'] or not os.path.exists(path):
+                    write_atomic(path, chapter['content'])
+                    report["written"] += 1
+                files[chapter['filename']] = chapter['hash']
+            for filename, text in outputs:
+                files[filename] = content_hash(text)
+                if current.get(filename) != files[filename] or not os.path.exists(os.path.join(self.output_dir, filename)):
+                    write_atomic(os.path.join(self.output_dir, filename), text)
+            # Only files listed in the manifest were written here, so nothing else in the directory is touched.
+            for filename in current:
+                if filename not in files:
+                    try:
+                        os.remove(os.path.join(self.output_dir, filename))
+                        report["removed"] += 1
+                    except FileNotFoundError:
+                        pass
+            save_output_manifest(self.output_dir, files)
+            sweep_temp_files(self.output_dir)
+        return report
+
+    def discard(self):
+        # A failed run keeps the chapters it finished but leaves index.md and tutorial.md as they were.
+        try:
+            self.wait()
+        except Exception:
+            pass
@@ -0,0 +1,66 @@
+import os
+import re
+from generate_abstractions.tools.tools import count_tokens
+
+SUMMARY_MEMORY_TOKENS = int(os.getenv("SUMMARY_MEMORY_TOKENS", "1500"))
+SUMMARY_RECENT_CHAPTERS = int(os.getenv("SUMMARY_RECENT_CHAPTERS", "3"))
+SUMMARY_GROUP_SIZE = 5
+
+
+def first_sentence(text: str) -> str:
+    text = " ".join(text.split())
+    match = re.match(r'(.+?[.!?])(?:\s|$)', text)
+    return match.group(1) if match else text
+
+def list_chapter_titles(names: list, token_budget: int = None) -> str:
+    # As many titles as fit, first chapters first, so the model still knows what has been covered.
+    titles = list(names)
+    while True:
+        omitted = len(names) - len(titles)
+        if not titles:
+            return f"Chapters 1-{len(names)} covered {len(names)} earlier topics."
+        line = f"Chapters 1-{len(names)} covered: {'; '.join(titles)}" + (f" and {omitted} more." if omitted else ".")
+        if token_budget is None or count_tokens(line) <= token_budget:
+            return line
+        titles.pop()
+
+def describe_older_chapters(names: list, summaries: list, level: int, token_budget: int = None) -> list:
+    # Level 0 keeps summaries verbatim, level 1 keeps their first sentence, level 2 folds
+    # groups of chapters into a list of titles and level 3 keeps the titles that fit in token_budget.
+    if level == 0:
+        return [f"Chapter {num} ({name}): {summary}" for num, (name, summary) in enumerate(zip(names, summaries), 1)]
+    if level == 1:
+        return [f"Chapter {num} ({name}): {first_sentence(summary)}" for num, (name, summary) in enumerate(zip(names, summaries), 1)]
+    if level == 2:
+        return [f"Chapters {start + 1}-{min(start + SUMMARY_GROUP_SIZE, len(names))} covered: "
+                f"{'; '.join(names[start:start + SUMMARY_GROUP_SIZE])}."
+                for start in range(0, len(names), SUMMARY_GROUP_SIZE)]
+    return [list_chapter_titles(names, token_budget)]
+
+def build_summary_memory(names: list, summaries: list, token_budget: int = None, recent_count: int = None) -> str:
+    if not summaries:
+        return "This is the first chapter"
+    token_budget = token_budget or SUMMARY_MEMORY_TOKENS
+    recent_count = SUMMARY_RECENT_CHAPTERS if recent_count is None else recent_count
+
+    recent_start = max(0, len(summaries) - recent_count)
+    recent = [f"Chapter {num} ({name}): {summary}"
+              for num, (name, summary) in enumerate(zip(names, summaries), 1)][recent_start:]
+    for level in range(4):
+        room = token_budget - count_tokens(" ".join(recent)) - 1
+        older = describe_older_chapters(names[:recent_start], summaries[:recent_start], level, room) if recent_start else []
+        memory = " ".join(older + recent)
+        if count_tokens(memory) <= token_budget:
+            return memory
+
+    # Even the most condensed digest does not fit: shorten the recent chapters too, then move them
+    # into the list of titles oldest first, always keeping the chapter just before this one.
+    shortened = [f"Chapter {num} ({name}): {first_sentence(summary)}"
+                 for num, (name, summary) in enumerate(zip(names, summaries), 1)]
+    for start in range(recent_start, len(summaries)):
+        recent = shortened[start:]
+        room = token_budget - count_tokens(" ".join(recent)) - 1
+        older = describe_older_chapters(names[:start], summaries[:start], 3, room) if start else []
+        memory = " ".join(older + recent)
+        if count_tokens(memory) <= token_budget or start == len(summaries) - 1:
+            return memory
@@ -0,0 +1,225 @@
+import re
+import ast
+
+BRACE_LANGUAGES = {'.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs', '.java', '.kt', '.kts', '.scala', '.go', '.rs',
+                   '.c', '.h', '.cc', '.cpp', '.hpp', '.cs', '.swift', '.php', '.dart'}
+SYMBOL_PATTERNS = [
+    ('class', re.compile(r'^\s*(?:export\s+)?(?:default\s+)?(?:public\s+|private\s+|protected\s+|internal\s+)?(?:abstract\s+|final\s+|sealed\s+|data\s+|open\s+|static\s+)*(?:class|interface|trait|enum|object|struct)\s+([A-Za-z_]\w*)')),
+    ('function', re.compile(r'^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)')),
+    ('function', re.compile(r'^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?(?:\([^)]*\)|[A-Za-z_$][\w$]*)\s*=>')),
+    ('function', re.compile(r'^\s*(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?(?:unsafe\s+)?fn\s+([A-Za-z_]\w*)')),
+    ('function', re.compile(r'^\s*func\s+(?:\([^)]*\)\s*)?([A-Za-z_]\w*)')),
+    ('function', re.compile(r'^\s*(?:override\s+|suspend\s+|private\s+|public\s+|protected\s+|internal\s+)*fun\s+(?:<[^>]*>\s*)?(?:[\w.]+\.)?([A-Za-z_]\w*)')),
+    ('function', re.compile(r'^\s*def\s+(?:self\.)?([A-Za-z_]\w*[?!]?)')),
+    ('function', re.compile(r'^\s*(?:(?:public|private|protected|static|final|abstract|synchronized|async|virtual|override|internal)\s+)+[\w<>\[\],.?]+\s+([A-Za-z_]\w*)\s*\([^;]*$')),
+]
+STOPWORDS = {'the', 'and', 'for', 'with', 'that', 'this', 'from', 'into', 'like', 'what', 'which', 'when', 'are',
+             'its', 'it\'s', 'how', 'does', 'use', 'uses', 'used', 'using', 'each', 'all', 'any', 'can', 'you', 'your'}
+
+
+def split_identifier(name: str) -> set:
+    words = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', name).replace('_', ' ').replace('.', ' ').lower().split()
+    return {word for word in words if len(word) >= 3}
+
+def extract_keywords(text: str) -> set:
+    keywords = set()
+    for word in re.findall(r'[A-Za-z_][A-Za-z0-9_]*', text):
+        keywords |= split_identifier(word)
+    return keywords - STOPWORDS
+
+def index_python(source: str) -> list:
+    tree = ast.parse(source)
+    lines = source.splitlines()
+    symbols = []
+
+    def visit(nodes, prefix):
+        for node in nodes:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+                symbols.append({
+                    "name": prefix + node.name,
+                    "kind": "class" if isinstance(node, ast.ClassDef) else "function",
+                    "start": start,
+                    "end": node.end_lineno,
+                    "signature": lines[node.lineno - 1].strip(),
+                    "parent": prefix.rstrip('.') or None,
+                })
+                if isinstance(node, ast.ClassDef):
+                    visit(node.body, f"{prefix}{node.name}.")
+
+    visit(tree.body, "")
+    return symbols
+
+def _brace_block_end(lines: list, start: int) -> int:
+    depth = 0
+    opened = False
+    for number in range(start, len(lines)):
+        line = re.sub(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|//.*$', '', lines[number])
+        depth += line.count('{') - line.count('}')
+        opened = opened or '{' in line
+        if opened and depth <= 0:
+            return number + 1
+        if not opened and number > start and line.strip().endswith(';'):
+            return number + 1
+    return len(lines)
+
+def _indent_block_end(lines: list, start: int) -> int:
+    indent = len(lines[start]) - len(lines[start].lstrip())
+    end = start + 1
+    for number in range(start + 1, len(lines)):
+        stripped = lines[number].strip()
+        if not stripped:
+            continue
+        if len(lines[number]) - len(lines[number].lstrip()) <= indent and stripped not in ('end', '}'):
+            break
+        end = number + 1
+    return end
+
+def index_with_patterns(source: str, extension: str) -> list:
+    lines = source.splitlines()
+    symbols = []
+    for number, line in enumerate(lines):
+        for kind, pattern in SYMBOL_PATTERNS:
+            match = pattern.match(line)
+            if match:
+                end = _brace_block_end(lines, number) if extension in BRACE_LANGUAGES else _indent_block_end(lines, number)
+                symbols.append({
+                    "name": match.group(1),
+                    "kind": kind,
+                    "start": number + 1,
+                    "end": end,
+                    "signature": line.strip(),
+                    "parent": None,
+                })
+                break
+    # Attach symbols to the innermost earlier symbol whose span contains them (methods in classes).
+    for position, symbol in enumerate(symbols):
+        enclosing = [other for other in symbols[:position] if other['start'] < symbol['start'] <= other['end']]
+        if enclosing:
+            symbol['parent'] = enclosing[-1]['name']
+            symbol['name'] = f"{symbol['parent']}.{symbol['name']}"
+    return symbols
+
+def index_file(path: str, source: str) -> list:
+    extension = ('.' + path.rsplit('.', 1)[-1].lower()) if '.' in path else ''
+    if extension == '.py':
+        try:
+            return index_python(source)
+        except (SyntaxError, ValueError):
+            pass
+    return index_with_patterns(source, extension)
+
+def build_symbol_index(file_contents: dict) -> dict:
+    return {path: index_file(path, content) for path, content in file_contents.items()}
+
+def score_symbol(symbol: dict, keywords: set) -> int:
+    return len((split_identifier(symbol['name']) | extract_keywords(symbol['signature'])) & keywords)
+
+def render_file_excerpt(source: str, symbols: list, keywords: set, token_budget: int, count_tokens) -> str:
+    lines = source.splitlines()
+    top_level = [symbol for symbol in symbols if symbol['parent'] is None]
+    children = {}
+    for symbol in symbols:
+        if symbol['parent'] is not None:
+            children.setdefault(symbol['parent'], []).append(symbol)
+    if not top_level:
+        # Nothing recognisable to index: keep as much of the head of the file as the budget allows.
+        low, high = 0, len(lines)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens("\n".join(lines[:middle])) <= token_budget:
+                low = middle
+            else:
+                high = middle - 1
+        return "\n".join(lines[:low] + ([f"... lines {low + 1}-{len(lines)} omitted ..."] if low < len(lines) else []))
+
+    def cost(text: str) -> int:
+        # One more for the newline that joins it to the rest of the excerpt.
+        return count_tokens(text) + 1
+
+    def body(symbol: dict) -> str:
+        return "\n".join(lines[symbol['start'] - 1:symbol['end']])
+
+    def indent(symbol: dict) -> str:
+        line = lines[symbol['start'] - 1]
+        return line[:len(line) - len(line.lstrip())]
+
+    def stub(symbol: dict) -> str:
+        return f"{indent(symbol)}{symbol['signature']} ..."
+
+    def placeholder(symbol: dict) -> str:
+        return f"{symbol['signature']} ...  (lines {symbol['start']}-{symbol['end']} omitted)"
+
+    def opening(symbol: dict) -> str:
+        return f"{indent(symbol)}{symbol['signature']}  (excerpt of lines {symbol['start']}-{symbol['end']})"
+
+    def members(symbol: dict) -> list:
+        return children.get(symbol['name'], []) if list_members else []
+
+    def collapsed_cost(symbol: dict) -> int:
+        if symbol['parent'] is not None:
+            return cost(stub(symbol))
+        return cost(placeholder(symbol)) + sum(cost(stub(member)) for member in members(symbol))
+
+    # Module-level lines before the first symbol usually hold the imports, which are cheap and orienting.
+    first_start = min(symbol['start'] for symbol in top_level)
+    header = "\n".join(lines[:first_start - 1]).strip()
+    header_cost = cost(header) if header else 0
+    if header_cost > token_budget // 4:
+        header, header_cost = "", 0
+
+    # Every symbol is listed at least by its signature, members of top-level symbols included while
+    # that outline fits; selecting a symbol replaces its lines in the outline with its body.
+    list_members = True
+    used = header_cost + sum(collapsed_cost(symbol) for symbol in top_level)
+    if used > token_budget:
+        list_members = False
+        used = header_cost + sum(collapsed_cost(symbol) for symbol in top_level)
+    modes = {}
+
+    def select(candidates: list):
+        nonlocal used
+        ranked = sorted(candidates, key=lambda symbol: (-score_symbol(symbol, keywords), symbol['end'] - symbol['start'], symbol['start']))
+        # Whole symbols first; a symbol too large to fit is opened up and its members ranked in turn.
+        for symbol in ranked:
+            extra = cost(body(symbol)) - collapsed_cost(symbol)
+            if used + extra <= token_budget:
+                modes[symbol['start']] = "full"
+                used += extra
+        for symbol in ranked:
+            if symbol['start'] in modes or not children.get(symbol['name']) or not list_members:
+                continue
+            extra = cost(opening(symbol)) + sum(cost(stub(member)) for member in children[symbol['name']]) - collapsed_cost(symbol)
+            if used + extra <= token_budget:
+                modes[symbol['start']] = "expanded"
+                used += extra
+                select(children[symbol['name']])
+
+    select(top_level)
+
+    def render(symbol: dict) -> list:
+        mode = modes.get(symbol['start'])
+        if mode == "full":
+            return [body(symbol)]
+        if mode == "expanded":
+            return [opening(symbol)] + [part for member in children[symbol['name']] for part in render(member)]
+        if symbol['parent'] is not None:
+            return [stub(symbol)]
+        return [placeholder(symbol)] + [stub(member) for member in members(symbol)]
+
+    parts = [header] if header else []
+    for symbol in sorted(top_level, key=lambda symbol: symbol['start']):
+        parts.extend(render(symbol))
+    # Files with more symbols than even their signatures fit in are cut off at the budget.
+    kept, total = [], 0
+    for part in parts:
+        if total + cost(part) > token_budget:
+            break
+        kept.append(part)
+        total += cost(part)
+    if len(kept) < len(parts):
+        note = f"... {len(parts) - len(kept)} more entries omitted ..."
+        while kept and total + cost(note) > token_budget:
+            total -= cost(kept.pop())
+        kept.append(f"... {len(parts) - len(kept)} more entries omitted ...")
+    return "\n".join(kept)
@@ -1,21 +1,94 @@
 import os
 import re
+from generate_abstractions.tools.tools import count_tokens, count_tokens_batch, count_file_tokens
+from file_store import iter_file_batches
+from .symbol_index import index_file, extract_keywords, render_file_excerpt
 
-def map_content_to_abstractions(file_contents: dict, abstractions: list) -> dict:
+CHAPTER_CONTEXT_TOKENS = int(os.getenv("CHAPTER_CONTEXT_TOKENS", "30000"))
+CHAPTER_RELATED_TOKENS = int(os.getenv("CHAPTER_RELATED_TOKENS", "4000"))
+CHAPTER_SHARED_CONTEXT_TOKENS = int(os.getenv("CHAPTER_SHARED_CONTEXT_TOKENS", "12000"))
+
+def select_shared_files(file_contents, abstractions: list, token_budget: int = None) -> list:
+    # Files that several chapters use go once into the shared prompt prefix, smallest first.
+    token_budget = CHAPTER_SHARED_CONTEXT_TOKENS if token_budget is None else token_budget
+    users = {}
+    for abstraction in abstractions:
+        for file_path in set(abstraction.get('file_paths', [])):
+            users[file_path] = users.get(file_path, 0) + 1
+    candidates = sorted(file_path for file_path, count in users.items() if count > 1 and file_path in file_contents)
+    file_tokens = count_file_tokens(file_contents, candidates)
+    shared = []
+    for file_path in sorted(candidates, key=lambda file_path: (file_tokens[file_path], file_path)):
+        if file_tokens[file_path] > token_budget:
+            break
+        shared.append(file_path)
+        token_budget -= file_tokens[file_path]
+    return sorted(shared)
+
+def render_shared_files(file_contents, file_paths: list) -> str:
+    parts = []
+    for batch_paths, batch_contents in iter_file_batches(file_contents, file_paths):
+        parts.extend(f"--- Shared file: {file_path} ---\n{content}\n" for file_path, content in zip(batch_paths, batch_contents))
+    return "\n".join(parts) if parts else "(none)"
+
+def map_content_to_abstractions(file_contents: dict, abstractions: list, token_budget: int = None,
+                                related_files: dict = None, related_budget: int = None, shared_files=None) -> dict:
+    token_budget = token_budget or CHAPTER_CONTEXT_TOKENS
+    related_budget = CHAPTER_RELATED_TOKENS if related_budget is None else related_budget
+    related_files = related_files or {}
+    # Files already in the shared prompt prefix are only referred to by path.
+    shared_files = set(shared_files or ())
     abstraction_content_map = {}
+    symbol_index = {}
     
     for abstraction in abstractions:
         abstraction_name = abstraction['name']
-        file_paths = abstraction['file_paths']
-        combined_content_parts = []
-        file_counter = 1
+        file_paths = [file_path for file_path in abstraction['file_paths'] if file_path in file_contents and file_path not in shared_files]
+        referenced_paths = [file_path for file_path in abstraction['file_paths'] if file_path in file_contents and file_path in shared_files]
+        file_tokens = dict(zip(file_paths, count_tokens_batch([file_contents[file_path] for file_path in file_paths])))
+        keywords = extract_keywords(f"{abstraction_name} {abstraction.get('description', '')}")
+        
+        # Smallest files go in whole first; whatever budget is left is shared by the large ones,
+        # which are reduced to their most relevant symbols plus signatures for the rest.
+        excerpts = {}
+        remaining_budget = token_budget
+        by_size = sorted(file_paths, key=lambda file_path: file_tokens[file_path])
+        for position, file_path in enumerate(by_size):
+            share = remaining_budget // (len(by_size) - position)
+            file_content = file_contents[file_path]
+            if file_tokens[file_path] <= share:
+                excerpts[file_path] = file_content
+                remaining_budget -= file_tokens[file_path]
+                continue
+            if file_path not in symbol_index:
+                symbol_index[file_path] = index_file(file_path, file_content)
+            excerpts[file_path] = render_file_excerpt(file_content, symbol_index[file_path], keywords, share, count_tokens)
+            remaining_budget -= count_tokens(excerpts[file_path])
         
-        for file_path in file_paths:
-            if file_path in file_contents:
-                file_content = file_contents[file_path]
-                formatted_file = f"--- File: {file_counter} # {file_path} ---\n{file_content}\n"
-                combined_content_parts.append(formatted_file)
-                file_counter += 1
+        # Neighbouring files from the import graph get their own smaller budget, most connected first,
+        # and are shown as the symbols relevant to this abstraction plus signatures.
+        related_excerpts = {}
+        remaining_budget = related_budget
+        related_paths = [file_path for file_path in related_files.get(abstraction_name, [])
+                         if file_path in file_contents and file_path not in excerpts and file_path not in shared_files]
+        for position, file_path in enumerate(related_paths):
+            share = remaining_budget // (len(related_paths) - position)
+            if share <= 0:
+                break
+            if file_path not in symbol_index:
+                symbol_index[file_path] = index_file(file_path, file_contents[file_path])
+            related_excerpts[file_path] = render_file_excerpt(file_contents[file_path], symbol_index[file_path], keywords, share, count_tokens)
+            remaining_budget -= count_tokens(related_excerpts[file_path])
+        
+        combined_content_parts = []
+        for file_counter, file_path in enumerate(file_paths, 1):
+            formatted_file = f"--- File: {file_counter} # {file_path} ---\n{excerpts[file_path]}\n"
+            combined_content_parts.append(formatted_file)
+        for file_counter, file_path in enumerate(referenced_paths, len(file_paths) + 1):
+            combined_content_parts.append(f"--- File: {file_counter} # {file_path} (shared, see Shared Code) ---\n")
+        for file_counter, file_path in enumerate(related_excerpts, len(file_paths) + len(referenced_paths) + 1):
+            formatted_file = f"--- Related file: {file_counter} # {file_path} ---\n{related_excerpts[file_path]}\n"
+            combined_content_parts.append(formatted_file)
         
         abstraction_content_map[abstraction_name] = "\n".join(combined_content_parts)
     
@@ -91,70 +164,3 @@ def ensure_output_directory(base_path: str = None) -> str:
         os.makedirs(output_dir)
     
     return output_dir
-
-def save_chapter_to_file(chapter_content: str, chapter_name: str, chapter_num: int, output_dir: str = None) -> str:
-    if output_dir is None:
-        output_dir = ensure_output_directory()
-    
-    sanitized_content = sanitize_markdown_content(chapter_content)
-    
-    filename = create_safe_filename(chapter_name, chapter_num)
-    file_path = os.path.join(output_dir, filename)
-    
-    try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(sanitized_content)
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            saved_content = f.read()
-            
-        return file_path
-        
-    except Exception as e:
-        raise
-
-def sanitize_chapter_json_response(response_text: str) -> str:
-    if not response_text:
-        return ""
-    
-    response_text = response_text.strip()
-    
-    start_idx = response_text.find('{')
-    if start_idx == -1:
-        return response_text
-    
-    brace_count = 0
-    end_idx = -1
-    
-    for i in range(start_idx, len(response_text)):
-        if response_text[i] == '{':
-            brace_count += 1
-        elif response_text[i] == '}':
-            brace_count -= 1
-            if brace_count == 0:
-                end_idx = i
-                break
-    
-    if end_idx == -1:
-        return response_text
-    
-    json_content = response_text[start_idx:end_idx + 1]
-    
-    if '"markdown_content"' in json_content and '"summary"' in json_content:
-        return json_content
-    
-    json_block_pattern = r'```json\s*([\s\S]*?)```'
-    json_matches = re.findall(json_block_pattern, response_text)
-    
-    if json_matches:
-        return json_matches[0].strip()
-    
-    general_block_pattern = r'```(?:json)?\s*(\{[\s\S]*?\})\s*```'
-    general_matches = re.findall(general_block_pattern, response_text)
-    
-    if general_matches:
-        for match in general_matches:
-            if '"markdown_content"' in match and '"summary"' in match:
-                return match.strip()
-    
-    return json_content
\ No newline at end of file
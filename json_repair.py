@@ -0,0 +1,238 @@
+import re
+import json
+from langchain_core.prompts import PromptTemplate
+from metrics import increment
+
+MAX_CANDIDATES = 8
+LITERALS = {"true": "true", "false": "false", "null": "null", "True": "true", "False": "false", "None": "null"}
+FENCE_PATTERN = re.compile(r'^```[a-zA-Z]*[ \t]*\n?|\n?```\s*$')
+LITERAL_PATTERN = re.compile(r'[A-Za-z0-9_.+\-]+')
+NUMBER_PATTERN = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+\-]?[0-9]+)?$')
+
+
+def strip_code_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith('```'):
+        text = FENCE_PATTERN.sub('', text).strip()
+    return text
+
+def find_json_span(text: str, start: int) -> str:
+    # String-aware bracket matching; an unterminated value runs to the end of the text.
+    depth = 0
+    in_string = False
+    escape = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            depth += 1
+        elif ch in '}]':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:]
+
+def iter_json_candidates(text: str):
+    text = strip_code_fence(text)
+    position = 0
+    for _ in range(MAX_CANDIDATES):
+        starts = [index for index in (text.find('{', position), text.find('[', position)) if index != -1]
+        if not starts:
+            return
+        start = min(starts)
+        span = find_json_span(text, start)
+        yield span
+        # Values nested inside a rejected candidate are never candidates themselves.
+        position = start + len(span)
+
+def extract_json(text: str) -> str:
+    if not text:
+        return ""
+    return next(iter_json_candidates(text), text.strip())
+
+def _closes_string(text: str, index: int, stack: list) -> bool:
+    # Decide whether a quote inside a string ends it or is an unescaped quote in the content.
+    length = len(text)
+    while index < length and text[index] in ' \t\r\n':
+        index += 1
+    if index >= length or text[index] in '}]:':
+        return True
+    if text[index] != ',':
+        return False
+    index += 1
+    while index < length and text[index] in ' \t\r\n':
+        index += 1
+    if index >= length:
+        return True
+    if stack and stack[-1]['close'] == '}':
+        return text[index] in '"}'
+    return text[index] in '"{[]-0123456789tfnTFN'
+
+def _trim_trailing(out: list, chars: str):
+    while out and out[-1] in chars:
+        out.pop()
+
+def _value_done(stack: list):
+    if stack:
+        stack[-1]['state'] = 'after'
+
+def _finish_container(out: list, entry: dict):
+    _trim_trailing(out, ' \t\r\n,')
+    if entry['close'] == '}' and entry['state'] == 'colon':
+        # A key with nothing after it: drop it rather than invent a value.
+        del out[entry['key_start']:]
+        _trim_trailing(out, ' \t\r\n,')
+    elif entry['close'] == '}' and entry['state'] == 'value':
+        out.append('null')
+    out.append(entry['close'])
+
+def repair_json(text: str) -> str:
+    out = []
+    stack = []
+    in_string = False
+    string_is_key = False
+    index = 0
+    length = len(text)
+
+    while index < length:
+        ch = text[index]
+        if in_string:
+            if ch == '\\':
+                following = text[index + 1] if index + 1 < length else ''
+                if following and following in '"\\/bfnrtu':
+                    out.append(ch + following)
+                    index += 2
+                    continue
+                if following:
+                    out.append('\\\\')
+            elif ch == '"':
+                if _closes_string(text, index + 1, stack):
+                    out.append(ch)
+                    in_string = False
+                    if string_is_key:
+                        stack[-1]['state'] = 'colon'
+                    else:
+                        _value_done(stack)
+                else:
+                    out.append('\\"')
+            elif ch == '\n':
+                out.append('\\n')
+            elif ch == '\r':
+                out.append('\\r')
+            elif ch == '\t':
+                out.append('\\t')
+            elif ord(ch) < 0x20:
+                out.append('\\u%04x' % ord(ch))
+            else:
+                out.append(ch)
+            index += 1
+            continue
+
+        if ch == '"':
+            in_string = True
+            string_is_key = bool(stack) and stack[-1]['close'] == '}' and stack[-1]['state'] == 'key'
+            if string_is_key:
+                stack[-1]['key_start'] = len(out)
+            out.append(ch)
+        elif ch in '{[':
+            stack.append({'close': '}' if ch == '{' else ']', 'state': 'key' if ch == '{' else 'value'})
+            out.append(ch)
+        elif ch in '}]':
+            if any(entry['close'] == ch for entry in stack):
+                while stack:
+                    entry = stack.pop()
+                    _finish_container(out, entry)
+                    _value_done(stack)
+                    if entry['close'] == ch:
+                        break
+                if not stack:
+                    break
+        elif ch == ',':
+            _trim_trailing(out, ' \t\r\n,')
+            out.append(ch)
+            if stack:
+                stack[-1]['state'] = 'key' if stack[-1]['close'] == '}' else 'value'
+        elif ch == ':':
+            out.append(ch)
+            if stack:
+                stack[-1]['state'] = 'value'
+        elif ch in ' \t\r\n':
+            out.append(ch)
+        elif ch == '/' and text.startswith('//', index):
+            newline = text.find('\n', index)
+            index = length if newline == -1 else newline
+            continue
+        else:
+            match = LITERAL_PATTERN.match(text, index)
+            if match:
+                word = match.group(0)
+                if stack and stack[-1]['close'] == '}' and stack[-1]['state'] == 'key':
+                    # Unquoted object key.
+                    stack[-1]['key_start'] = len(out)
+                    out.append(json.dumps(word))
+                    stack[-1]['state'] = 'colon'
+                else:
+                    out.append(LITERALS.get(word) or (word if NUMBER_PATTERN.match(word) else json.dumps(word)))
+                    _value_done(stack)
+                index = match.end()
+                continue
+        index += 1
+
+    if in_string:
+        if string_is_key:
+            del out[stack[-1]['key_start']:]
+            stack[-1]['state'] = 'key'
+        else:
+            out.append('"')
+            _value_done(stack)
+    while stack:
+        _finish_container(out, stack.pop())
+        _value_done(stack)
+    return "".join(out).strip()
+
+def _loads_or_none(text: str):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+def loads_tolerant(text: str, expected_type=None, required_keys: tuple = ()):
+    for candidate in iter_json_candidates(text or ""):
+        value = _loads_or_none(candidate)
+        if value is None:
+            value = _loads_or_none(repair_json(candidate))
+            increment("json_local_repairs", outcome="ok" if value is not None else "failed")
+        if value is None or (expected_type is not None and not isinstance(value, expected_type)):
+            continue
+        if required_keys and not (isinstance(value, dict) and all(key in value for key in required_keys)):
+            continue
+        return value
+    raise json.JSONDecodeError("No usable JSON value found", text or "", 0)
+
+def parse_model_json(response_text: str, fixing_prompt: str, model, expected_type=None, required_keys: tuple = (), max_retries: int = 3):
+    try:
+        return loads_tolerant(response_text, expected_type, required_keys)
+    except json.JSONDecodeError:
+        pass
+
+    # Only responses the local repair cannot salvage are sent back to the model.
+    json_fix_template = PromptTemplate.from_template(fixing_prompt)
+    for _ in range(max_retries):
+        increment("json_fix_calls")
+        formatted_fix_prompt = json_fix_template.format(response_text=extract_json(response_text))
+        # Fix-ups are mechanical, so they go to the fast model.
+        response_text = model.generate_content(formatted_fix_prompt, fast=True).text
+        try:
+            return loads_tolerant(response_text, expected_type, required_keys)
+        except json.JSONDecodeError:
+            continue
+    increment("json_fix_exhausted")
+    return None
@@ -0,0 +1,264 @@
+import os
+import time
+import queue
+import random
+import asyncio
+import threading
+from metrics import increment, observe, current_run, set_run
+
+# Limits shared by every model call in the process (0 = unlimited).
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "0"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+# Deadline for a whole call including retries and rate-limit waits, and the limit for one attempt.
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "600"))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "180"))
+# A duplicate request is sent when the first has not answered after this many seconds (0 = never).
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "0"))
+STREAM_DONE = object()
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    # One loop on a daemon thread serves every model call; graph nodes stay synchronous.
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-client", daemon=True).start()
+    return _loop
+
+
+async def in_run(run, coroutine):
+    # Tasks on the loop thread start from the loop's own context; the caller's metrics run is carried
+    # over here and inherited by the attempts and hedges the call starts.
+    set_run(run)
+    return await coroutine
+
+
+class RateLimiter:
+    # Concurrency cap plus request and token buckets that refill continuously over a minute.
+    # Only used from the client's event loop, so it needs no locking.
+    def __init__(self, max_concurrency: int = 0, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.in_flight = 0
+        self.requests = float(requests_per_minute)
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._changed = None
+
+    def refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        if self.requests_per_minute:
+            self.requests = min(self.requests_per_minute, self.requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self.tokens = min(self.tokens_per_minute, self.tokens + elapsed * self.tokens_per_minute / 60)
+
+    def wait_time(self, tokens: int) -> float:
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            return None
+        wait = 0.0
+        if self.requests_per_minute and self.requests < 1:
+            wait = (1 - self.requests) * 60 / self.requests_per_minute
+        # A prompt larger than the whole minute's budget waits for a full bucket instead of forever.
+        needed = min(tokens, self.tokens_per_minute)
+        if self.tokens_per_minute and self.tokens < needed:
+            wait = max(wait, (needed - self.tokens) * 60 / self.tokens_per_minute)
+        return wait
+
+    async def acquire(self, tokens: int):
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        started = time.monotonic()
+        while True:
+            self.refill()
+            wait = self.wait_time(tokens)
+            if wait == 0:
+                break
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+        self.in_flight += 1
+        self.requests -= 1
+        self.tokens -= tokens
+        self.waited += time.monotonic() - started
+
+    def release(self):
+        self.in_flight -= 1
+        if self._changed is not None:
+            self._changed.set()
+
+    def charge(self, tokens: int):
+        # Output tokens are only known afterwards; they are taken out of the following calls' share.
+        if self.tokens_per_minute:
+            self.refill()
+            self.tokens -= tokens
+
+
+class AsyncLLMClient:
+    def __init__(self, provider, limiter: RateLimiter = None, max_retries: int = None, call_timeout: float = None,
+                 attempt_timeout: float = None, hedge_after: float = None):
+        self.provider = provider
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.call_timeout = call_timeout or LLM_CALL_TIMEOUT
+        self.attempt_timeout = attempt_timeout or LLM_ATTEMPT_TIMEOUT
+        self.hedge_after = LLM_HEDGE_AFTER_SECONDS if hedge_after is None else hedge_after
+        self.stats = {"requests": 0, "retries": 0, "hedged": 0, "hedge_wins": 0, "timeouts": 0, "errors": 0}
+
+    def record(self, name: str, model_name: str):
+        self.stats[name] += 1
+        increment(f"llm_{name}", model=model_name)
+
+    async def attempt(self, model_name: str, prompt: str, tokens: int, generation_config=None, cached_content=None,
+                      timeout: float = None) -> str:
+        await self.limiter.acquire(tokens)
+        started = time.monotonic()
+        try:
+            self.record("requests", model_name)
+            return await asyncio.wait_for(
+                self.provider.generate(model_name, prompt, generation_config, cached_content, timeout), timeout)
+        finally:
+            self.limiter.release()
+            observe("llm_attempt_seconds", time.monotonic() - started, model=model_name)
+
+    async def hedged(self, model_name: str, start_attempt, discard=None):
+        # The first answer wins and the other request is cancelled; both count against the limits.
+        tasks = [asyncio.ensure_future(start_attempt())]
+        winner = None
+        try:
+            if self.hedge_after:
+                done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+                if not done:
+                    self.record("hedged", model_name)
+                    tasks.append(asyncio.ensure_future(start_attempt()))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if task is not tasks[0]:
+                            self.record("hedge_wins", model_name)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if task.done() and not task.cancelled() and task.exception() is None and discard is not None:
+                    # Both finished in the same instant; the loser still holds resources.
+                    discard(task.result())
+                task.cancel()
+
+    async def with_retries(self, model_name: str, deadline: float, run_attempt):
+        deadline = deadline or self.call_timeout
+        deadline_at = time.monotonic() + deadline
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline_at - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                # The deadline also covers time spent waiting for the rate limiter.
+                return await asyncio.wait_for(run_attempt(min(remaining, self.attempt_timeout)), remaining)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.record("timeouts", model_name)
+                    if deadline_at - time.monotonic() <= 0:
+                        self.record("errors", model_name)
+                        raise TimeoutError(f"Model call to {model_name} ran past its {deadline:.0f}s deadline") from None
+                if not self.provider.is_transient(e) or attempt == self.max_retries:
+                    self.record("errors", model_name)
+                    raise
+                # Full jitter keeps parallel calls from retrying in lockstep; a server hint takes precedence.
+                delay = self.provider.retry_after(e) or random.uniform(0, min(60.0, 2 ** attempt))
+                if delay >= deadline_at - time.monotonic():
+                    self.record("errors", model_name)
+                    raise
+                self.record("retries", model_name)
+                print(f"Model call to {model_name} failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def generate(self, model_name: str, prompt: str, tokens: int, generation_config=None, cached_content=None,
+                       deadline: float = None) -> str:
+        async def run_attempt(timeout):
+            return await self.hedged(model_name, lambda: self.attempt(model_name, prompt, tokens, generation_config,
+                                                                      cached_content, timeout))
+        return await self.with_retries(model_name, deadline, run_attempt)
+
+    async def open_stream(self, model_name: str, prompt: str, tokens: int, generation_config=None, cached_content=None,
+                          timeout: float = None):
+        # Holds a limiter slot from here until close_stream; returns the stream and its first chunk.
+        await self.limiter.acquire(tokens)
+        self.record("requests", model_name)
+        chunks = self.provider.stream(model_name, prompt, generation_config, cached_content, timeout).__aiter__()
+        try:
+            first = await asyncio.wait_for(chunks.__anext__(), timeout)
+        except StopAsyncIteration:
+            first = ""
+        except BaseException:
+            await self.close_stream(chunks)
+            raise
+        return chunks, first
+
+    async def close_stream(self, chunks):
+        self.limiter.release()
+        await chunks.aclose()
+
+    async def stream(self, model_name: str, prompt: str, tokens: int, on_text, generation_config=None, cached_content=None,
+                     deadline: float = None):
+        # Time to first chunk is retried and hedged like a whole call; once text has been handed on it
+        # cannot be taken back, so a stream that breaks later fails the call.
+        async def run_attempt(timeout):
+            started = time.monotonic()
+            chunks, first = await self.hedged(
+                model_name, lambda: self.open_stream(model_name, prompt, tokens, generation_config, cached_content, timeout),
+                discard=lambda opened: asyncio.ensure_future(self.close_stream(opened[0])))
+            try:
+                if first:
+                    on_text(first)
+                async for text in chunks:
+                    on_text(text)
+            except Exception as e:
+                raise RuntimeError(f"Stream from {model_name} broke off after it started: {e}") from e
+            finally:
+                await self.close_stream(chunks)
+                observe("llm_attempt_seconds", time.monotonic() - started, model=model_name)
+        await self.with_retries(model_name, deadline, run_attempt)
+
+    def charge(self, tokens: int):
+        get_event_loop().call_soon_threadsafe(self.limiter.charge, tokens)
+
+    def generate_sync(self, model_name: str, prompt: str, tokens: int, **kwargs) -> str:
+        return asyncio.run_coroutine_threadsafe(in_run(current_run(), self.generate(model_name, prompt, tokens, **kwargs)),
+                                                get_event_loop()).result()
+
+    def stream_sync(self, model_name: str, prompt: str, tokens: int, **kwargs):
+        # Chunks cross from the event loop to the calling thread through a queue, so callbacks run in the caller.
+        chunks = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(in_run(current_run(), self.stream(model_name, prompt, tokens, chunks.put, **kwargs)),
+                                                  get_event_loop())
+        future.add_done_callback(lambda _: chunks.put(STREAM_DONE))
+        while True:
+            text = chunks.get()
+            if text is STREAM_DONE:
+                break
+            yield text
+        future.result()
+
+
+def create_client(provider) -> AsyncLLMClient:
+    limiter = RateLimiter(LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+    return AsyncLLMClient(provider, limiter)
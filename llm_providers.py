@@ -0,0 +1,139 @@
+import os
+import random
+import asyncio
+import hashlib
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+# A provider turns one prompt into text for a named model. It knows nothing about retries,
+# rate limits or caching; the client in llm_client.py adds those around any provider.
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+
+
+class TransientLLMError(Exception):
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GeminiProvider:
+    TRANSIENT_ERRORS = (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted,
+                        google_exceptions.ServiceUnavailable, google_exceptions.InternalServerError,
+                        google_exceptions.DeadlineExceeded, google_exceptions.GatewayTimeout,
+                        google_exceptions.Aborted, ConnectionError, TimeoutError, TransientLLMError)
+
+    def __init__(self, api_key: str = None):
+        genai.configure(api_key=api_key or os.getenv('GEMINI_API_KEY'))
+        self.models = {}
+
+    def model(self, model_name: str, cached_content=None):
+        # A cached prefix is bound to its own model object; plain models are reused per name.
+        if cached_content is not None:
+            return genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+        if model_name not in self.models:
+            self.models[model_name] = genai.GenerativeModel(model_name=model_name)
+        return self.models[model_name]
+
+    def request_options(self, timeout: float = None) -> dict:
+        return {"request_options": {"timeout": timeout}} if timeout else {}
+
+    async def generate(self, model_name: str, prompt: str, generation_config=None, cached_content=None, timeout: float = None) -> str:
+        response = await self.model(model_name, cached_content).generate_content_async(
+            prompt, generation_config=generation_config, **self.request_options(timeout))
+        return response.text
+
+    async def stream(self, model_name: str, prompt: str, generation_config=None, cached_content=None, timeout: float = None):
+        response = await self.model(model_name, cached_content).generate_content_async(
+            prompt, generation_config=generation_config, stream=True, **self.request_options(timeout))
+        async for chunk in response:
+            yield chunk.text
+
+    def is_transient(self, error: Exception) -> bool:
+        return isinstance(error, self.TRANSIENT_ERRORS)
+
+    def retry_after(self, error: Exception) -> float:
+        # 429s from the Gemini API carry a RetryInfo detail with the suggested wait.
+        if getattr(error, 'retry_after', None):
+            return error.retry_after
+        for detail in getattr(error, 'details', None) or []:
+            delay = getattr(detail, 'retry_delay', None)
+            if delay is not None and (delay.seconds or delay.nanos):
+                return delay.seconds + delay.nanos / 1e9
+        return None
+
+
+class EchoModel:
+    def generate_content(self, prompt: str, generation_config=None, stream: bool = False, **kwargs):
+        response = FakeText(f"Fake response to a {len(prompt)}-character prompt.")
+        return [response] if stream else response
+
+
+class FakeText:
+    def __init__(self, text: str):
+        self.text = text
+
+
+# Local stand-in for tests and benchmarks. It answers with any object that has the shape of a
+# genai model (generate_content returning .text, or a list of chunks when streaming) and can add
+# latency, a slow tail and transient failures, all decided from the prompt so runs repeat exactly.
+class FakeProvider:
+    def __init__(self, model=None, latency: float = 0.0, failure_rate: float = 0.0, slow_rate: float = 0.0,
+                 slow_latency: float = 0.0, seed: int = 7):
+        self.model = model or EchoModel()
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.seed = seed
+        self.attempts = {}
+        self.calls = 0
+        self.failures = 0
+
+    def roll(self, prompt: str, salt: str) -> float:
+        attempt = self.attempts.get((salt, prompt), 0)
+        self.attempts[(salt, prompt)] = attempt + 1
+        digest = hashlib.sha256(f"{self.seed}:{salt}:{attempt}:{prompt}".encode('utf-8')).digest()
+        return random.Random(digest).random()
+
+    async def respond(self, model_name: str, prompt: str, generation_config=None, stream: bool = False):
+        self.calls += 1
+        if self.roll(prompt, "fail") < self.failure_rate:
+            self.failures += 1
+            raise TransientLLMError(f"fake transient failure from {model_name}")
+        delay = self.latency + (self.slow_latency if self.roll(prompt, "slow") < self.slow_rate else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        # The wrapped model may block, so it never runs on the event loop itself.
+        return await asyncio.to_thread(self.model.generate_content, prompt, generation_config=generation_config, stream=stream)
+
+    async def generate(self, model_name: str, prompt: str, generation_config=None, cached_content=None, timeout: float = None) -> str:
+        if cached_content is not None:
+            raise ValueError("The fake provider has no server-side cache; use CONTEXT_CACHE=local with it.")
+        return (await self.respond(model_name, prompt, generation_config)).text
+
+    async def stream(self, model_name: str, prompt: str, generation_config=None, cached_content=None, timeout: float = None):
+        if cached_content is not None:
+            raise ValueError("The fake provider has no server-side cache; use CONTEXT_CACHE=local with it.")
+        response = await self.respond(model_name, prompt, generation_config, stream=True)
+        # Models that do not stream answer in one piece.
+        for chunk in ([response] if hasattr(response, 'text') else response):
+            yield chunk.text
+
+    def is_transient(self, error: Exception) -> bool:
+        return isinstance(error, (TransientLLMError, TimeoutError, ConnectionError))
+
+    def retry_after(self, error: Exception) -> float:
+        return getattr(error, 'retry_after', None)
+
+
+LLM_PROVIDERS = {
+    "gemini": GeminiProvider,
+    "fake": FakeProvider,
+}
+
+
+def create_provider(name: str = None):
+    name = name or LLM_PROVIDER
+    if name not in LLM_PROVIDERS:
+        raise ValueError(f"Unknown LLM_PROVIDER {name!r}; expected one of {', '.join(LLM_PROVIDERS)}")
+    return LLM_PROVIDERS[name]()
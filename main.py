@@ -1,17 +1,25 @@
 import os
+import sys
+import time
 from dotenv import load_dotenv
 from langgraph.graph import StateGraph, START, END
 from state import State
 from generate_abstractions.abstractions_generator import generate_chunks, get_file_contents, generate_abstractions
 from generate_chapters.generate_chapters import generate_chapters
+from manifest import load_manifest, save_manifest
+from generate_abstractions.tools.sources import get_source_provider
+from generate_abstractions.tools.local_source import is_local_repo, resolve_local_path
+from generate_abstractions.tools.github_client import get_http_stats
+from checkpoint import checkpointed, latest_checkpoint_commit, clear_checkpoints
+from metrics import instrumented, write_run_report, start_run, end_run
 
 load_dotenv()
 
 graph = StateGraph(State)
-graph.add_node("generate_chunks", generate_chunks)
-graph.add_node("get_file_contents", get_file_contents)
-graph.add_node("generate_abstractions", generate_abstractions)
-graph.add_node("generate_chapters", generate_chapters)
+graph.add_node("generate_chunks", instrumented("generate_chunks", checkpointed("generate_chunks", generate_chunks)))
+graph.add_node("get_file_contents", instrumented("get_file_contents", checkpointed("get_file_contents", get_file_contents)))
+graph.add_node("generate_abstractions", instrumented("generate_abstractions", checkpointed("generate_abstractions", generate_abstractions)))
+graph.add_node("generate_chapters", instrumented("generate_chapters", checkpointed("generate_chapters", generate_chapters)))
 
 graph.add_edge(START, "generate_chunks")
 graph.add_edge("generate_chunks", "get_file_contents")
@@ -21,24 +29,72 @@ graph.add_edge("generate_chapters", END)
 
 workflow = graph.compile()
 
-def run_workflow(token: str = None, repo: str = None):
-    if token is None:
-        token = os.getenv("GITHUB_TOKEN")
-        if not token:
-            raise ValueError("GitHub token not provided. Please set GITHUB_TOKEN environment variable or pass it as a parameter.")
-    
+def build_initial_state(token: str = None, repo: str = None, incremental: bool = True, output_dir: str = None, resume: bool = False) -> dict:
     if repo is None:
         repo = os.getenv("GITHUB_REPO")
         if not repo:
             raise ValueError("GitHub repo not provided. Please set GITHUB_REPO environment variable or pass it as a parameter.")
     
+    if is_local_repo(repo):
+        repo = resolve_local_path(repo)
+    
+    if token is None:
+        token = os.getenv("GITHUB_TOKEN")
+        if not token and get_source_provider(repo)['needs_token']:
+            raise ValueError("GitHub token not provided. Please set GITHUB_TOKEN environment variable or pass it as a parameter.")
+    
     initial_state = {
         "token": token,
         "repo": repo,
+        "previous_manifest": load_manifest(repo) if incremental else None,
+        "output_dir": output_dir,
     }
-    
-    result = workflow.invoke(initial_state)
+    if resume:
+        # Resuming continues the interrupted run at the commit it was working on.
+        commit_sha = latest_checkpoint_commit(repo)
+        if commit_sha is None:
+            raise ValueError(f"No interrupted run to resume for {repo}.")
+        initial_state.update({"commit_sha": commit_sha, "resume": True})
+    return initial_state
+
+def stream_workflow(token: str = None, repo: str = None, incremental: bool = True, output_dir: str = None, resume: bool = False):
+    initial_state = build_initial_state(token, repo, incremental, output_dir, resume)
+    started = time.monotonic()
+    result = None
+    # Metrics of this run are kept apart from other runs in the process, including concurrent batch runs.
+    metrics_run = start_run(repo=initial_state['repo'])
+    try:
+        for mode, payload in workflow.stream(initial_state, stream_mode=["updates", "custom", "values"]):
+            if mode == "custom":
+                yield {**payload, "elapsed": time.monotonic() - started}
+            elif mode == "updates":
+                for node in payload:
+                    yield {"event": "node_completed", "node": node, "elapsed": time.monotonic() - started}
+            else:
+                result = payload
+
+        save_manifest(initial_state['repo'], result['manifest'])
+        clear_checkpoints(initial_state['repo'], result['commit_sha'])
+        metrics_paths = write_run_report(initial_state['repo'])
+    finally:
+        end_run(metrics_run)
+    yield {"event": "workflow_completed", "elapsed": time.monotonic() - started, "http": get_http_stats(),
+           "metrics": metrics_paths, "state": result}
+
+def run_workflow(token: str = None, repo: str = None, incremental: bool = True, on_event=None, output_dir: str = None, resume: bool = False):
+    result = None
+    for event in stream_workflow(token, repo, incremental, output_dir, resume):
+        if event["event"] == "workflow_completed":
+            result = event["state"]
+        elif on_event is not None:
+            on_event(event)
     return result
 
+def resume_workflow(token: str = None, repo: str = None, on_event=None, output_dir: str = None):
+    return run_workflow(token, repo, on_event=on_event, output_dir=output_dir, resume=True)
+
 if __name__ == "__main__":
-    out = run_workflow(repo="TharunCodes07/devlabs-backend")
\ No newline at end of file
+    if "--resume" in sys.argv:
+        out = resume_workflow(repo="TharunCodes07/devlabs-backend")
+    else:
+        out = run_workflow(repo="TharunCodes07/devlabs-backend")
\ No newline at end of file
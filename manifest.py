@@ -0,0 +1,38 @@
+import os
+import json
+import hashlib
+from cache import CACHE_DIR
+
+MANIFEST_DIR = os.path.join(CACHE_DIR, "manifests")
+
+
+def manifest_path(repo: str) -> str:
+    return os.path.join(MANIFEST_DIR, repo.replace('/', '__') + ".json")
+
+def load_manifest(repo: str) -> dict:
+    path = manifest_path(repo)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Ignoring unreadable run manifest {path}: {e}")
+        return None
+
+def save_manifest(repo: str, manifest: dict) -> str:
+    path = manifest_path(repo)
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+    return path
+
+def fingerprint(*parts) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def blob_shas_for(file_paths: list, file_shas: dict) -> dict:
+    file_shas = file_shas or {}
+    return {path: file_shas.get(path) for path in file_paths}
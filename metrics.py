@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+from cache import CACHE_DIR
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+METRICS_ENABLED = os.getenv("METRICS", "0") == "1"
+METRICS_DIR = os.path.expanduser(os.getenv("METRICS_DIR", os.path.join(CACHE_DIR, "metrics")))
+METRICS_MAX_SPANS = int(os.getenv("METRICS_MAX_SPANS", "10000"))
+
+_lock = threading.Lock()
+_disabled_span = nullcontext()
+
+
+# Counters, timings and spans of one workflow run, or of the whole process.
+class MetricsRun:
+    def __init__(self, labels: dict = None):
+        self.labels = dict(labels or {})
+        self.counters = {}
+        self.timings = {}
+        self.spans = []
+        self.started = time.time()
+
+
+# Everything recorded in the process, labelled with the run it came from (batch reports use this).
+_process_run = MetricsRun()
+# The run being recorded in this context; set by start_run and carried into worker threads by copying the context.
+_current_run = contextvars.ContextVar("metrics_run", default=None)
+
+
+def metric_key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items())))
+
+def start_run(**labels):
+    # Until end_run(token), everything recorded in this context also goes into a fresh run with these labels.
+    return _current_run.set(MetricsRun(labels))
+
+def end_run(token):
+    _current_run.reset(token)
+
+def current_run() -> MetricsRun:
+    return _current_run.get()
+
+def set_run(run: MetricsRun):
+    _current_run.set(run)
+
+def recording_targets(labels: dict) -> list:
+    # (registry, labels) pairs a sample is recorded into; the process-wide copy carries the run's labels.
+    run = _current_run.get()
+    if run is None:
+        return [(_process_run, labels)]
+    return [(_process_run, {**run.labels, **labels}), (run, labels)]
+
+def increment(name: str, amount=1, **labels):
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        for run, run_labels in recording_targets(labels):
+            key = metric_key(name, run_labels)
+            run.counters[key] = run.counters.get(key, 0) + amount
+
+def observe(name: str, value: float, **labels):
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        for run, run_labels in recording_targets(labels):
+            timing = run.timings.setdefault(metric_key(name, run_labels), {"count": 0, "sum": 0.0, "max": 0.0})
+            timing['count'] += 1
+            timing['sum'] += value
+            timing['max'] = max(timing['max'], value)
+
+def peak_rss_bytes() -> int:
+    if resource is None:
+        return 0
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+@contextmanager
+def _record_span(name: str, attributes: dict):
+    labels = dict(attributes)
+    started = time.time()
+    start_clock = time.perf_counter()
+    try:
+        yield attributes
+    except Exception as e:
+        attributes['error'] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start_clock
+        observe(f"{name}_seconds", duration, **labels)
+        record = {"name": name, "start": started, "duration": duration,
+                  "thread": threading.current_thread().name, "attributes": attributes}
+        with _lock:
+            for run, run_labels in recording_targets({}):
+                if len(run.spans) < METRICS_MAX_SPANS:
+                    run.spans.append({**record, "labels": run_labels} if run_labels else record)
+
+def span(name: str, **attributes):
+    # Attributes added to the yielded dict inside the block (token counts, sizes) end up in the span.
+    if not METRICS_ENABLED:
+        return _disabled_span
+    return _record_span(name, attributes)
+
+def instrumented(node_name: str, node):
+    def run_node(state: dict) -> dict:
+        with span("node", node=node_name) as current:
+            update = node(state)
+            if current is not None:
+                current['peak_rss_bytes'] = peak_rss_bytes()
+        increment("node_runs", node=node_name)
+        return update
+
+    run_node.__name__ = node_name
+    return run_node
+
+def snapshot(run: MetricsRun = None) -> dict:
+    # The current run when called inside one, otherwise everything the process has recorded.
+    run = run or _current_run.get() or _process_run
+    with _lock:
+        counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in run.counters.items()]
+        timings = [{"name": name, "labels": dict(labels), **timing} for (name, labels), timing in run.timings.items()]
+        spans = list(run.spans)
+    return {
+        "labels": run.labels,
+        "started": run.started,
+        "elapsed": time.time() - run.started,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "counters": counters,
+        "timings": timings,
+        "spans": spans,
+    }
+
+def reset():
+    global _process_run
+    with _lock:
+        _process_run = MetricsRun()
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{escape_label(value)}"' for key, value in sorted(labels.items()))
+    return "{" + pairs + "}"
+
+def format_prometheus(report: dict) -> str:
+    lines = [
+        "# TYPE codedecoded_peak_rss_bytes gauge",
+        f"codedecoded_peak_rss_bytes {report['peak_rss_bytes']}",
+        "# TYPE codedecoded_run_seconds gauge",
+        f"codedecoded_run_seconds {report['elapsed']:.6f}",
+    ]
+    # Samples of one metric family have to be contiguous in the exposition format.
+    counters = sorted(report['counters'], key=lambda counter: (counter['name'], sorted(counter['labels'].items())))
+    timings = sorted(report['timings'], key=lambda timing: (timing['name'], sorted(timing['labels'].items(), key=str)))
+    typed = set()
+    for counter in counters:
+        metric = "codedecoded_" + counter['name'] + "_total"
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{format_labels(counter['labels'])} {counter['value']}")
+    for timing in timings:
+        metric = "codedecoded_" + timing['name']
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} summary")
+        labels = format_labels(timing['labels'])
+        lines.append(f"{metric}_count{labels} {timing['count']}")
+        lines.append(f"{metric}_sum{labels} {timing['sum']:.6f}")
+    for timing in timings:
+        metric = "codedecoded_" + timing['name'].replace('_seconds', '') + "_max_seconds"
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric}{format_labels(timing['labels'])} {timing['max']:.6f}")
+    return "\n".join(lines) + "\n"
+
+def write_atomic(path: str, content: str):
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+def write_run_report(run_name: str, output_dir: str = None) -> dict:
+    if not METRICS_ENABLED:
+        return None
+    output_dir = output_dir or METRICS_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    safe_name = re.sub(r'[^A-Za-z0-9._-]+', '__', run_name.strip('/'))
+    report = snapshot()
+    json_path = os.path.join(output_dir, f"{safe_name}.json")
+    prometheus_path = os.path.join(output_dir, f"{safe_name}.prom")
+    write_atomic(json_path, json.dumps(report, indent=2, default=str))
+    # The .prom file is meant for node_exporter's textfile collector.
+    write_atomic(prometheus_path, format_prometheus(report))
+    return {"json": json_path, "prometheus": prometheus_path}
@@ -12,6 +12,8 @@ Only consider real, relevant source folders like:
 
 Do not hallucinate any files. Only use what is actually listed below.
 
+Large folders may be shortened: a line such as "... 40 more .py files [refer to them as src/api/*.py]" or a folder shown as "legacy/  [120 files: ...; refer to it as src/legacy/]" stands for files that are not listed one by one. To include them, use the pattern or folder path given in the brackets exactly as written.
+
 Return only a JSON response with no more than 5 top-level chunks, in this exact format:
 
 {{
@@ -106,12 +108,10 @@ Input:
 """
 
 
-generate_abstractions_prompt = """For the project `{project_name}`:
-
-Codebase Context:
-{context}
-
-Analyze the codebase context.
+# Prompts sent many times in a run are split into a prefix that is identical across the calls,
+# stable content first in a fixed order, and a suffix with what changes per call. The prefix is
+# registered once with the context cache (see context_cache.py) and reused.
+generate_abstractions_prefix_prompt = """You will be given the codebase context of a project.
 Identify the top 3-7 core most important abstractions to help those new to the codebase.
 
 For each abstraction, provide:
@@ -119,9 +119,6 @@ For each abstraction, provide:
 2. A beginner-friendly `description` explaining what it is with a simple analogy, in around 100 words.
 3. A list of relevant `file_paths` using the actual file paths.
 
-List of files present in the context:
-{file_listing}
-
 Format the output as a JSON array of objects:
 
 ```json
@@ -145,6 +142,18 @@ Format the output as a JSON array of objects:
 ```
 """
 
+generate_abstractions_prompt = """
+For the project `{project_name}`:
+
+List of files present in the context:
+{file_listing}
+
+Codebase Context:
+{context}
+
+Analyze the codebase context above and return the JSON array of its core abstractions.
+"""
+
 combine_abstractions_prompt = """You are tasked with combining multiple per-chunk abstractions from a codebase into a single, cohesive final abstraction.
 
 Project: {project_name}
@@ -185,26 +194,17 @@ Return a JSON array with the final combined abstractions in this exact format:
 - **Prioritize core system components, architectural patterns, and key business logic**
 """
 
-create_chapters_prompt = """
-Write a very beginner-friendly tutorial chapter (in Markdown format) for the project {project_name} about the concept: "{abstraction_name}". This is Chapter {chapter_num}.
-
-Concept Details:
+create_chapters_prefix_prompt = """You will write very beginner-friendly tutorial chapters (in Markdown format) for the project {project_name}, one chapter per request. Each request names its concept and chapter number.
 
-Name: {abstraction_name}
-Description:
-{abstraction_description}
 Complete Tutorial Structure:
 {complete_tutorial_structure}
 
-Context from previous chapters:
-{previous_chapters_summary}
-
-Relevant Code Snippets (Code itself remains unchanged):
-{file_context_str}
+Shared Code (files used by several chapters; code itself remains unchanged):
+{shared_file_context}
 
-Instructions for the chapter:
+Instructions for every chapter:
 
-Start with a clear heading (e.g., # Chapter {chapter_num} : {abstraction_name}). Use the provided concept name.
+Start with a clear heading (e.g., # Chapter <number> : <concept name>). Use the provided concept name.
 
 If this is not the first chapter, begin with a brief transition from the previous chapter, referencing it with a proper Markdown link using its name.
 
@@ -243,5 +243,23 @@ Return the response as a JSON object in this exact format:
   "summary": "A concise 2-3 sentence summary of what this chapter covers, including the main concepts and key takeaways for beginners."
 }}
 ```
+"""
+
+create_chapters_prompt = """
+Write Chapter {chapter_num} of the tutorial for the project {project_name}, about the concept: "{abstraction_name}".
+
+Concept Details:
+
+Name: {abstraction_name}
+Description:
+{abstraction_description}
+
+Context from previous chapters:
+{previous_chapters_summary}
+
+Relevant Code Snippets (Code itself remains unchanged; files marked as shared are shown in full in Shared Code above):
+{file_context_str}
+
+Start with the heading # Chapter {chapter_num} : {abstraction_name}.
 Now, directly provide a super beginner-friendly response in the JSON format above:
-"""
\ No newline at end of file
+"""
@@ -1,12 +1,25 @@
 from typing_extensions import Annotated, TypedDict, Optional
+from collections.abc import Mapping
 from operator import add
 
 
+def merge_dicts(left: Optional[dict], right: Optional[dict]) -> dict:
+    return {**(left or {}), **(right or {})}
+
+
 class State(TypedDict):
     project_name: Optional[str]
-    token: str
+    token: Optional[str]
     repo: str
-    file_contents: Optional[dict]
+    commit_sha: Optional[str]
+    file_shas: Optional[dict]
+    file_sizes: Optional[dict]
+    fetch_report: Optional[dict]
+    file_contents: Optional[Mapping]
     chunks: Optional[dict]
     abstractions: Optional[dict]
     summary: Optional[dict]
+    previous_manifest: Optional[dict]
+    output_dir: Optional[str]
+    resume: Optional[bool]
+    manifest: Annotated[dict, merge_dicts]
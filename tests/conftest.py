@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+# The GitHub and model stand-ins live with the benchmarks.
+sys.path.insert(0, os.path.join(ROOT_DIR, "benchmarks"))
+
+# Modules read their configuration at import time, so the tests never touch the user's caches or a real API.
+os.environ["CODEDECODED_CACHE_DIR"] = tempfile.mkdtemp(prefix="codedecoded-tests-")
+os.environ.setdefault("GEMINI_API_KEY", "offline")
+for name in ("LLM_CACHE", "BLOB_CACHE", "GITHUB_ETAG_CACHE", "CHECKPOINTS", "METRICS"):
+    os.environ[name] = "0"
+os.environ["CONTEXT_CACHE"] = "local"
+os.environ["LLM_PROVIDER"] = "fake"
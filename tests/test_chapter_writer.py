@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import multiprocessing
+import pytest
+from generate_chapters.tools.chapter_writer import (ChapterWriter, OUTPUT_MANIFEST_NAME, TEMP_FILE_MAX_AGE_SECONDS,
+                                                    INDEX_NAME, TUTORIAL_NAME, load_output_manifest)
+
+NAMES = ["Getting Started", "Core Engine", "Plugins"]
+
+
+def publish_run(output_dir: str, run_id: str, names: list = NAMES) -> dict:
+    writer = ChapterWriter(output_dir)
+    for chapter_num, name in enumerate(names, start=1):
+        writer.write(chapter_num, name, f"# Chapter {chapter_num}: {name}\n\nWritten by run {run_id}.\n")
+    return writer.publish("Sample")
+
+def temp_files(output_dir: str) -> list:
+    return [name for name in os.listdir(output_dir) if name.endswith(".tmp")]
+
+def chapter_files(output_dir: str) -> list:
+    return sorted(name for name in os.listdir(output_dir) if name.startswith("chapter_"))
+
+
+def test_unchanged_chapters_keep_their_mtime(tmp_path):
+    output_dir = str(tmp_path)
+    publish_run(output_dir, "a")
+    paths = [os.path.join(output_dir, name) for name in chapter_files(output_dir)]
+    for path in paths:
+        os.utime(path, (1, 1))
+    report = publish_run(output_dir, "a")
+    assert report == {"written": 0, "unchanged": 3, "removed": 0}
+    assert [os.stat(path).st_mtime for path in paths] == [1, 1, 1]
+    assert temp_files(output_dir) == []
+
+
+def test_dropped_chapters_are_removed(tmp_path):
+    output_dir = str(tmp_path)
+    publish_run(output_dir, "a")
+    (tmp_path / "notes.md").write_text("kept\n")
+    report = publish_run(output_dir, "b", NAMES[:2])
+    assert report == {"written": 2, "unchanged": 0, "removed": 1}
+    assert chapter_files(output_dir) == ["chapter_01_Getting_Started.md", "chapter_02_Core_Engine.md"]
+    # Files the writer did not create are never touched.
+    assert (tmp_path / "notes.md").read_text() == "kept\n"
+    with open(os.path.join(output_dir, OUTPUT_MANIFEST_NAME)) as f:
+        assert sorted(json.load(f)["files"]) == sorted(chapter_files(output_dir) + [INDEX_NAME, TUTORIAL_NAME])
+
+
+def test_chapters_are_in_place_when_reported_saved(tmp_path):
+    output_dir = str(tmp_path)
+    saved = []
+    writer = ChapterWriter(output_dir)
+    for chapter_num, name in enumerate(NAMES, start=1):
+        path = writer.write(chapter_num, name, f"# Chapter {chapter_num}: {name}\n",
+                            on_saved=lambda path, changed: saved.append((path, changed, os.path.exists(path))))
+        assert path == os.path.join(output_dir, f"chapter_{chapter_num:02d}_{name.replace(' ', '_')}.md")
+    writer.wait()
+    assert [(exists, changed) for _, changed, exists in saved] == [(True, True)] * 3
+    # Each chapter is in the manifest before the run publishes, and publishing does not write it again.
+    assert sorted(load_output_manifest(output_dir)) == chapter_files(output_dir)
+    assert writer.publish("Sample") == {"written": 3, "unchanged": 0, "removed": 0}
+
+
+def test_discard_keeps_finished_chapters_and_the_published_index(tmp_path):
+    output_dir = str(tmp_path)
+    publish_run(output_dir, "a")
+    index = (tmp_path / INDEX_NAME).read_text()
+    writer = ChapterWriter(output_dir)
+    writer.write(1, NAMES[0], "# Chapter 1: Getting Started\n\nWritten by run b.\n")
+    writer.write(4, "Extra", "# Chapter 4: Extra\n")
+    writer.discard()
+    assert (tmp_path / "chapter_01_Getting_Started.md").read_text().endswith("run b.\n")
+    assert (tmp_path / "chapter_04_Extra.md").exists()
+    assert (tmp_path / INDEX_NAME).read_text() == index
+    # The next run that publishes drops the chapter the failed run added.
+    publish_run(output_dir, "c")
+    assert chapter_files(output_dir) == ["chapter_01_Getting_Started.md", "chapter_02_Core_Engine.md", "chapter_03_Plugins.md"]
+
+
+def test_stale_temp_files_are_swept_on_publish(tmp_path):
+    output_dir = str(tmp_path)
+    dead = multiprocessing.get_context("spawn").Process(target=time.sleep, args=(0,))
+    dead.start()
+    dead.join()
+    # Left behind by a killed run, by a live run that is too old to still be writing, and by a live run.
+    abandoned = tmp_path / f"chapter_01_Getting_Started.md.{dead.pid}.1.tmp"
+    expired = tmp_path / f"chapter_02_Core_Engine.md.{os.getpid()}.1.tmp"
+    active = tmp_path / f"chapter_03_Plugins.md.{os.getpid()}.2.tmp"
+    for path in (abandoned, expired, active):
+        path.write_text("partial\n")
+    old = time.time() - TEMP_FILE_MAX_AGE_SECONDS - 60
+    os.utime(expired, (old, old))
+    (tmp_path / "notes.tmp").write_text("kept\n")
+    publish_run(output_dir, "a")
+    assert sorted(temp_files(output_dir)) == sorted([active.name, "notes.tmp"])
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_concurrent_publishers_leave_one_consistent_run(tmp_path):
+    output_dir = str(tmp_path)
+    context = multiprocessing.get_context("fork")
+    # Runs with different chapter counts, so a mix of runs would show up as stale or missing chapters.
+    processes = [context.Process(target=publish_run, args=(output_dir, f"run-{index}", NAMES[:1 + index % 3]))
+                 for index in range(6)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [process.exitcode for process in processes] == [0] * 6
+
+    with open(os.path.join(output_dir, OUTPUT_MANIFEST_NAME)) as f:
+        manifest = json.load(f)["files"]
+    files = chapter_files(output_dir)
+    assert sorted(manifest) == sorted(files + [INDEX_NAME, TUTORIAL_NAME])
+    runs = {(tmp_path / name).read_text().rsplit("Written by run ", 1)[1].strip() for name in files + [TUTORIAL_NAME]}
+    assert len(runs) == 1
+    run_index = int(runs.pop().rstrip(".").split("-")[1])
+    assert len(files) == 1 + run_index % 3
+    assert (tmp_path / INDEX_NAME).read_text().count("](chapter_") == len(files)
+    assert temp_files(output_dir) == []
+    assert [name for name in os.listdir(output_dir) if name.endswith(".tmp")] == []
@@ -0,0 +1,54 @@
+from context_cache import ContextCache, GeminiContextCache, cache_min_tokens
+from synthetic_repo import generate_repository
+from generate_abstractions.tools.tools import count_tokens
+from generate_chapters.generate_chapters import format_chapters_prefix
+from generate_chapters.tools.tools import select_shared_files, render_shared_files
+from LLM import MODEL_NAME
+
+
+def test_prefixes_below_the_minimum_are_sent_inline_without_an_upload(monkeypatch):
+    cache = GeminiContextCache("gemini-model")
+    monkeypatch.setattr(cache, "register", lambda prefix: (_ for _ in ()).throw(AssertionError("uploaded")))
+    cache.share("short instructions")
+    assert cache.handle_for("short instructions") is None
+    assert cache.stats()["registrations"] == 0
+
+
+def test_shared_prefix_is_registered_once_and_released():
+    cache = ContextCache(min_tokens=0)
+    cache.share("prefix ")
+    assert cache.request_for(cache.handle_for("prefix "), "prompt") == ("prefix prompt", None)
+    cache.handle_for("prefix ")
+    assert cache.stats()["registrations"] == 1
+    assert cache.stats()["reused_calls"] == 2
+    cache.release("prefix ")
+    assert cache.handle_for("prefix ") is None
+
+
+def test_minimum_is_looked_up_per_model():
+    assert cache_min_tokens("gemini-2.5-flash-preview-04-17") == 1024
+    assert cache_min_tokens("models/gemini-2.5-flash-lite") == 1024
+    assert cache_min_tokens("gemini-2.5-pro") == 4096
+    assert cache_min_tokens("gemini-1.5-flash-002") == 32768
+    assert cache_min_tokens("some-other-model") == 4096
+
+
+def test_default_sized_chapter_prefix_is_registered_for_the_default_model(monkeypatch):
+    # A small repository: four chapters that share three files.
+    files = {path: content for path, content in generate_repository(40).items() if path.endswith(".py")}
+    paths = sorted(files)
+    abstractions = [{"name": f"Part {index}", "file_paths": paths[:3] + paths[3 + index * 4:7 + index * 4]} for index in range(4)]
+    shared = select_shared_files(files, abstractions)
+    prefix = format_chapters_prefix("Demo", "".join(f"Chapter {index}: Part {index}\n" for index in range(1, 5)),
+                                    render_shared_files(files, shared))
+    assert len(shared) == 3
+    assert count_tokens(prefix) < 4096
+
+    uploads = []
+    cache = GeminiContextCache(MODEL_NAME)
+    monkeypatch.setattr(cache, "register", lambda prefix: uploads.append(prefix) or "cached-content")
+    cache.share(prefix)
+    assert cache.handle_for(prefix) == "cached-content"
+    assert cache.handle_for(prefix) == "cached-content"
+    assert uploads == [prefix]
+    assert cache.stats()["reused_calls"] == 2
@@ -0,0 +1,100 @@
+import pytest
+from fake_github import FakeGitHub, blob_sha
+from generate_abstractions.tools import tools
+from generate_abstractions.tools.file_limits import FETCH_TRUNCATE_BYTES
+
+REPO = "octo/sample"
+
+
+def sample_files(count: int = 25) -> dict:
+    files = {f"src/module_{index:02d}.py": f"def function_{index}():\n    return {index}\n" for index in range(count)}
+    files["docs/logo.png"] = b"\x89PNG\r\n\x1a\n" + bytes(64)
+    return files
+
+
+@pytest.fixture
+def github(monkeypatch):
+    server = FakeGitHub().start()
+    server.add_repository(REPO, sample_files())
+    monkeypatch.setattr(tools, "GITHUB_API_URL", server.url)
+    yield server
+    server.stop()
+
+
+def source_paths(github) -> list:
+    return sorted(path for path in github.repos[REPO]["files"] if path.endswith(".py"))
+
+
+def test_archive_strips_the_top_level_directory(github):
+    paths = source_paths(github)
+    ref = github.repos[REPO]["commit_sha"]
+    report = {}
+    contents = tools.fetch_file_contents(None, REPO, paths, ref=ref, mode="archive", report=report)
+    assert contents == {path: github.repos[REPO]["files"][path].decode('utf-8') for path in paths}
+    assert report == {}
+    assert github.counts.get("tarball") == 1
+    assert "contents" not in github.counts
+
+
+def test_small_fetches_skip_the_archive(github):
+    paths = source_paths(github)[:3]
+    contents = tools.fetch_file_contents(None, REPO, paths, ref=github.repos[REPO]["commit_sha"], mode="archive")
+    assert sorted(contents) == paths
+    assert "tarball" not in github.counts
+    assert github.counts.get("contents") == 3
+
+
+def test_broken_archive_falls_back_to_contents_api(github, monkeypatch):
+    monkeypatch.setattr(github, "archive", lambda repo: b"not a tarball")
+    paths = source_paths(github)
+    contents = tools.fetch_file_contents(None, REPO, paths, ref=github.repos[REPO]["commit_sha"], mode="archive")
+    assert sorted(contents) == paths
+    assert github.counts.get("tarball") == 1
+    assert github.counts.get("contents") == len(paths)
+
+
+def test_files_missing_from_the_archive_are_fetched_individually(github):
+    paths = source_paths(github)
+    ref = github.repos[REPO]["commit_sha"]
+    github.archive(REPO)
+    # The archive was built before this file was added, so only the Contents API has it.
+    github.repos[REPO]["files"]["src/late.py"] = b"LATE = True\n"
+    contents = tools.fetch_file_contents(None, REPO, paths + ["src/late.py"], ref=ref, mode="archive")
+    assert contents["src/late.py"] == "LATE = True\n"
+    assert github.counts.get("contents") == 1
+
+
+def test_binary_and_oversized_files_are_skipped_before_download(github):
+    report = {}
+    sizes = {"src/module_00.py": tools.CONTENTS_API_MAX_BYTES * 100}
+    contents = tools.fetch_file_contents(None, REPO, ["docs/logo.png", "src/module_00.py", "src/module_01.py"],
+                                         mode="contents", file_sizes=sizes, report=report)
+    assert report == {"docs/logo.png": "binary", "src/module_00.py": "too_large"}
+    assert list(contents) == ["src/module_01.py"]
+    assert github.counts.get("contents") == 1
+
+
+def test_large_files_are_truncated_through_the_blobs_api(github):
+    large = ("x = 1\n" * (tools.CONTENTS_API_MAX_BYTES // 6 + 100)).encode('utf-8')
+    github.add_repository(REPO, {**sample_files(), "src/large.py": large})
+    report = {}
+    contents = tools.fetch_file_contents(None, REPO, ["src/large.py"], mode="contents",
+                                         file_shas={"src/large.py": blob_sha(large)},
+                                         file_sizes={"src/large.py": len(large)}, report=report)
+    assert report == {"src/large.py": "truncated"}
+    assert "bytes omitted from the middle" in contents["src/large.py"]
+    assert len(contents["src/large.py"]) < FETCH_TRUNCATE_BYTES + 200
+    assert github.counts.get("git") == 1
+    assert "contents" not in github.counts
+
+
+def test_metadata_only_contents_response_is_read_from_the_blob(github):
+    large = ("y = 2\n" * (tools.CONTENTS_API_MAX_BYTES // 6 + 100)).encode('utf-8')
+    github.add_repository(REPO, {**sample_files(), "src/large.py": large})
+    report = {}
+    # Without a known size the Contents API is asked first and answers with metadata only.
+    contents = tools.fetch_file_contents(None, REPO, ["src/large.py"], mode="contents", report=report)
+    assert report == {"src/large.py": "truncated"}
+    assert contents["src/large.py"].startswith("y = 2\n")
+    assert github.counts.get("contents") == 1
+    assert github.counts.get("git") == 1
@@ -0,0 +1,83 @@
+import os
+import gc
+import multiprocessing
+import pytest
+import file_store
+from file_store import create_file_store, open_file_store, prune_file_stores
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_store, "FILE_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(file_store, "FILE_STORE_KEEP", 2)
+    return tmp_path
+
+def make_store(repo: str):
+    store = create_file_store(repo, "c" * 40)
+    store["src/app.py"] = f"print({repo!r})\n"
+    store.flush()
+    return store
+
+def set_ages(paths: list):
+    # Oldest last. Closing a store's connection touches the file, so ages are set just before pruning.
+    gc.collect()
+    for age, path in enumerate(paths):
+        os.utime(path, (1000 - age, 1000 - age))
+
+def store_files(store_dir) -> list:
+    return sorted(name for name in os.listdir(store_dir) if name.endswith(".sqlite3"))
+
+def hold_until_told(path: str, ready, release):
+    store = open_file_store({"path": path, "index": {}})
+    ready.set()
+    release.wait(10)
+    del store
+
+
+def test_contents_round_trip_through_a_reference(store_dir):
+    store = make_store("octo/a")
+    reopened = open_file_store(store.reference())
+    assert dict(reopened) == {"src/app.py": "print('octo/a')\n"}
+    assert open_file_store({"path": str(store_dir / "missing.sqlite3"), "index": {}}) is None
+
+
+def test_stores_in_use_are_never_pruned(store_dir):
+    stores = [make_store(f"octo/repo-{index}") for index in range(5)]
+    paths = [store.path for store in stores]
+    set_ages(paths)
+    prune_file_stores()
+    assert len(store_files(store_dir)) == 5
+    # A view keeps its store held after the store object itself is dropped.
+    view = stores[4].subset(["src/app.py"])
+    stores = stores[:1]
+    set_ages(paths)
+    prune_file_stores()
+    assert [os.path.exists(path) for path in paths] == [True, True, False, False, True]
+    assert view["src/app.py"] == "print('octo/repo-4')\n"
+    del view, stores
+    set_ages(paths[:2] + paths[4:])
+    prune_file_stores()
+    assert [os.path.exists(path) for path in paths] == [True, True, False, False, False]
+    assert sorted(name for name in os.listdir(store_dir) if name.endswith(".lock")) == [name + ".lock" for name in store_files(store_dir)]
+
+
+@pytest.mark.skipif(file_store.fcntl is None or "fork" not in multiprocessing.get_all_start_methods(), reason="needs fcntl and fork")
+def test_stores_held_by_another_process_are_kept(store_dir):
+    path = make_store("octo/batch").path
+    context = multiprocessing.get_context("fork")
+    ready, release = context.Event(), context.Event()
+    holder = context.Process(target=hold_until_told, args=(path, ready, release))
+    holder.start()
+    try:
+        assert ready.wait(10)
+        stores = [make_store(f"octo/new-{index}") for index in range(3)]
+        newer = [store.path for store in stores]
+        set_ages(newer + [path])
+        prune_file_stores()
+        assert os.path.exists(path)
+    finally:
+        release.set()
+        holder.join()
+    set_ages(newer + [path])
+    prune_file_stores()
+    assert not os.path.exists(path)
@@ -0,0 +1,81 @@
+import json
+from types import SimpleNamespace
+import pytest
+from json_repair import extract_json, loads_tolerant, parse_model_json
+from json_repair_benchmark import CORPUS_PATH, EXPECTATIONS
+
+FIXING_PROMPT = "Fix this JSON:\n{response_text}"
+
+with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+    CORPUS = {case["name"]: case for case in json.load(f)}
+
+
+class FixingModel:
+    # Answers every fix-up call with the next canned response.
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def generate_content(self, prompt: str, fast: bool = False):
+        self.calls.append((prompt, fast))
+        return SimpleNamespace(text=self.responses.pop(0))
+
+
+def parse_case(name: str):
+    case = CORPUS[name]
+    return loads_tolerant(case["response"], *EXPECTATIONS[case["kind"]])
+
+
+@pytest.mark.parametrize("name", sorted(CORPUS))
+def test_every_corpus_response_is_parsed_locally(name):
+    assert parse_case(name) is not None
+
+
+def test_fenced_and_prose_wrapped_responses():
+    assert parse_case("chunks_fenced_clean") == {"authentication": ["src/auth/login.ts", "src/auth/session.ts"],
+                                                 "api routes": ["src/routes/users.ts"]}
+    assert parse_case("chunks_prose_around") == {"services": ["svc/billing.go", "svc/invoice.go"],
+                                                 "handlers": ["api/handlers.go"]}
+    assert extract_json('Here:\n```json\n{"a": [1]}\n```\nDone.') == '{"a": [1]}'
+
+
+def test_trailing_commas_are_dropped():
+    assert parse_case("chunks_trailing_commas") == {"core config": ["app/config.py", "app/settings.py"],
+                                                    "models": ["app/models/user.py"]}
+    assert parse_case("abstractions_trailing_commas_and_prose") == [
+        {"name": "Parser", "description": "Turns text into trees.", "file_paths": ["parse/lexer.c", "parse/parser.c"]}]
+
+
+def test_truncated_output_keeps_what_was_complete():
+    assert parse_case("chunks_truncated_tail")["controllers"] == ["src/main/java/com/app/UserController.java",
+                                                                  "src/main/java/com/app/AuthController.java"]
+    abstractions = parse_case("abstractions_truncated_mid_object")
+    assert [abstraction["name"] for abstraction in abstractions] == ["Scheduler", "Worker Pool"]
+    chapter = parse_case("chapter_truncated_output")
+    assert chapter["markdown_content"].startswith("# Chapter 4: Plugins")
+
+
+def test_wrong_shape_is_rejected():
+    with pytest.raises(json.JSONDecodeError):
+        loads_tolerant('{"summary": "no content"}', dict, ("markdown_content", "summary"))
+    with pytest.raises(json.JSONDecodeError):
+        loads_tolerant("no json here", dict)
+
+
+def test_local_repair_avoids_the_fix_call():
+    model = FixingModel()
+    assert parse_model_json(CORPUS["chunks_trailing_commas"]["response"], FIXING_PROMPT, model, dict) is not None
+    assert model.calls == []
+
+
+def test_unusable_response_is_sent_to_the_fast_model():
+    model = FixingModel('```json\n{"markdown_content": "# Chapter", "summary": "Short."}\n```')
+    value = parse_model_json('Sorry, here is {"summary": "Short."}', FIXING_PROMPT, model, dict, ("markdown_content", "summary"))
+    assert value == {"markdown_content": "# Chapter", "summary": "Short."}
+    assert model.calls == [('Fix this JSON:\n{"summary": "Short."}', True)]
+
+
+def test_none_after_the_fix_calls_are_exhausted():
+    model = FixingModel("still broken", "[1, 2]", "nothing")
+    assert parse_model_json("not json", FIXING_PROMPT, model, dict, max_retries=3) is None
+    assert len(model.calls) == 3
@@ -0,0 +1,169 @@
+import time
+import asyncio
+import threading
+import pytest
+from llm_client import AsyncLLMClient, RateLimiter, get_event_loop
+from llm_providers import FakeProvider, TransientLLMError
+
+
+def slow_then_fast_prompt(seed: int = 7, slow_rate: float = 0.5) -> str:
+    # A prompt whose first attempt draws the slow tail and whose second does not.
+    for index in range(1000):
+        prompt = f"prompt {index}"
+        probe = FakeProvider(seed=seed)
+        if probe.roll(prompt, "slow") < slow_rate <= probe.roll(prompt, "slow"):
+            return prompt
+    raise AssertionError("no suitable prompt")
+
+def in_flight(client: AsyncLLMClient) -> int:
+    # Read on the loop thread after everything scheduled so far (cancelled losers included) has run.
+    async def read():
+        await asyncio.sleep(0.05)
+        return client.limiter.in_flight
+    return asyncio.run_coroutine_threadsafe(read(), get_event_loop()).result()
+
+
+def test_hedge_answers_when_the_first_attempt_is_slow():
+    provider = FakeProvider(slow_rate=0.5, slow_latency=2.0)
+    client = AsyncLLMClient(provider, hedge_after=0.05, max_retries=0)
+    started = time.monotonic()
+    assert client.generate_sync("fake-model", slow_then_fast_prompt(), 1).startswith("Fake response")
+    assert time.monotonic() - started < 1.0
+    assert client.stats["hedged"] == 1
+    assert client.stats["hedge_wins"] == 1
+    assert client.stats["requests"] == 2
+    # The slow loser was cancelled and gave its slot back.
+    assert in_flight(client) == 0
+
+
+def test_fast_answers_are_not_hedged():
+    client = AsyncLLMClient(FakeProvider(), hedge_after=0.5)
+    client.generate_sync("fake-model", "hello", 1)
+    assert client.stats["hedged"] == 0
+    assert client.stats["requests"] == 1
+
+
+def test_stream_is_hedged_until_its_first_chunk():
+    client = AsyncLLMClient(FakeProvider(slow_rate=0.5, slow_latency=2.0), hedge_after=0.05, max_retries=0)
+    started = time.monotonic()
+    assert "".join(client.stream_sync("fake-model", slow_then_fast_prompt(), 1)).startswith("Fake response")
+    assert time.monotonic() - started < 1.0
+    assert client.stats["hedge_wins"] == 1
+    assert in_flight(client) == 0
+
+
+def test_transient_errors_are_retried_until_the_limit(monkeypatch):
+    provider = FakeProvider(failure_rate=1.0)
+    monkeypatch.setattr(provider, "retry_after", lambda error: 0.01)
+    client = AsyncLLMClient(provider, max_retries=2)
+    with pytest.raises(TransientLLMError):
+        client.generate_sync("fake-model", "hello", 1)
+    assert provider.calls == 3
+    assert client.stats["retries"] == 2
+    assert client.stats["errors"] == 1
+    assert in_flight(client) == 0
+
+
+def test_retry_after_hint_sets_the_delay(monkeypatch):
+    provider = FakeProvider(failure_rate=1.0)
+    monkeypatch.setattr(provider, "retry_after", lambda error: 0.2)
+    client = AsyncLLMClient(provider, max_retries=2)
+    started = time.monotonic()
+    with pytest.raises(TransientLLMError):
+        client.generate_sync("fake-model", "hello", 1)
+    assert time.monotonic() - started >= 0.4
+
+
+def test_hint_beyond_the_deadline_fails_without_waiting(monkeypatch):
+    provider = FakeProvider(failure_rate=1.0)
+    monkeypatch.setattr(provider, "retry_after", lambda error: 30.0)
+    client = AsyncLLMClient(provider, max_retries=5)
+    started = time.monotonic()
+    with pytest.raises(TransientLLMError):
+        client.generate_sync("fake-model", "hello", 1, deadline=1.0)
+    assert time.monotonic() - started < 0.5
+    assert provider.calls == 1
+
+
+def test_attempts_time_out_and_the_deadline_ends_the_call(monkeypatch):
+    provider = FakeProvider(latency=1.0)
+    monkeypatch.setattr(provider, "retry_after", lambda error: 0.01)
+    client = AsyncLLMClient(provider, max_retries=10, attempt_timeout=0.1)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError, match="deadline"):
+        client.generate_sync("fake-model", "hello", 1, deadline=0.35)
+    elapsed = time.monotonic() - started
+    assert 0.3 <= elapsed < 0.8
+    # Each attempt was cut off at the per-attempt timeout and retried until the deadline.
+    assert client.stats["timeouts"] >= 3
+    assert client.stats["retries"] >= 2
+    assert in_flight(client) == 0
+
+
+def test_concurrency_cap_limits_requests_in_flight(monkeypatch):
+    provider = FakeProvider(latency=0.1)
+    client = AsyncLLMClient(provider, RateLimiter(max_concurrency=2))
+    active, peak = [0], [0]
+    respond = provider.respond
+
+    async def counted(*args, **kwargs):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        try:
+            return await respond(*args, **kwargs)
+        finally:
+            active[0] -= 1
+
+    monkeypatch.setattr(provider, "respond", counted)
+    threads = [threading.Thread(target=client.generate_sync, args=("fake-model", f"prompt {index}", 1)) for index in range(6)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+    assert time.monotonic() - started >= 0.3
+    assert in_flight(client) == 0
+
+
+def test_rate_limiter_paces_requests_and_tokens():
+    async def scenario():
+        limiter = RateLimiter(requests_per_minute=600)
+        started = time.monotonic()
+        for _ in range(600):
+            await limiter.acquire(1)
+            limiter.release()
+        burst = time.monotonic() - started
+        await limiter.acquire(1)
+        limiter.release()
+        requests_wait = time.monotonic() - started - burst
+
+        limiter = RateLimiter(tokens_per_minute=60000)
+        await limiter.acquire(60000)
+        limiter.release()
+        started = time.monotonic()
+        await limiter.acquire(1000)
+        limiter.release()
+        return burst, requests_wait, time.monotonic() - started
+
+    burst, requests_wait, tokens_wait = asyncio.run(scenario())
+    # The full bucket is available at once; after that it refills at the per-minute rate.
+    assert burst < 0.5
+    assert 0.05 <= requests_wait < 0.5
+    assert 0.8 <= tokens_wait < 1.5
+
+
+def test_rate_limiter_slot_is_handed_on_at_release():
+    async def scenario():
+        limiter = RateLimiter(max_concurrency=1)
+        await limiter.acquire(1)
+        waiter = asyncio.ensure_future(limiter.acquire(1))
+        await asyncio.sleep(0.05)
+        blocked = not waiter.done()
+        limiter.release()
+        await asyncio.wait_for(waiter, 1.0)
+        in_flight = limiter.in_flight
+        limiter.release()
+        return blocked, in_flight, limiter.in_flight
+
+    assert asyncio.run(scenario()) == (True, 1, 0)
@@ -0,0 +1,34 @@
+import time
+from generate_abstractions.tools.local_chunker import directory_clusters, merge_small_clusters
+
+
+def test_small_clusters_join_the_cluster_they_import_from():
+    paths = ["api/routes.py", "core/engine.py", "core/models.py", "util/strings.py"]
+    tokens = {"api/routes.py": 100, "core/engine.py": 400, "core/models.py": 400, "util/strings.py": 100}
+    graph = {"util/strings.py": ["api/routes.py"]}
+    clusters = merge_small_clusters(directory_clusters(paths, tokens, 1000), graph, 1000)
+    assert sorted(cluster['files'] for cluster in clusters) == [
+        ["api/routes.py", "core/engine.py", "core/models.py", "util/strings.py"]]
+    clusters = merge_small_clusters(directory_clusters(paths, tokens, 900), graph, 900)
+    assert sorted(cluster['files'] for cluster in clusters) == [
+        ["api/routes.py", "util/strings.py"], ["core/engine.py", "core/models.py"]]
+
+
+def test_without_imports_the_nearest_directory_is_chosen():
+    paths = ["app/a/one.py", "app/b/two.py", "lib/three.py"]
+    tokens = {path: 100 for path in paths}
+    clusters = merge_small_clusters(directory_clusters(paths, tokens, 250), {}, 250)
+    assert sorted(cluster['files'] for cluster in clusters) == [["app/a/one.py", "app/b/two.py"], ["lib/three.py"]]
+
+
+def test_thousands_of_small_clusters_merge_quickly_within_budget():
+    paths = [f"pkg{index % 20}/sub{index % 400}/leaf{index}/module.py" for index in range(8000)]
+    tokens = {path: 50 + index % 400 for index, path in enumerate(paths)}
+    graph = {path: [paths[(index * 7919) % len(paths)]] for index, path in enumerate(paths) if index % 3 == 0}
+    clusters = directory_clusters(paths, tokens, 3000)
+    started = time.perf_counter()
+    merged = merge_small_clusters(clusters, graph, 3000)
+    assert time.perf_counter() - started < 1.0
+    assert len(merged) < len(clusters) // 4
+    assert all(cluster['tokens'] <= 3000 for cluster in merged)
+    assert sorted(path for cluster in merged for path in cluster['files']) == sorted(paths)
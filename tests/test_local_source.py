@@ -0,0 +1,34 @@
+import os
+from generate_abstractions.tools.local_source import is_local_repo, get_local_repository_info, fetch_local_file_contents
+
+
+def make_repository(tmp_path):
+    secret = tmp_path / "secret.txt"
+    secret.write_text("PRIVATE KEY\n")
+    root = tmp_path / "project"
+    (root / "src").mkdir(parents=True)
+    (root / "src" / "app.py").write_text("print('hello')\n")
+    os.symlink(secret, root / "src" / "leak.py")
+    os.symlink(root / "src" / "app.py", root / "src" / "alias.py")
+    return str(root)
+
+
+def test_symlinks_out_of_the_repository_are_not_listed_or_read(tmp_path):
+    root = make_repository(tmp_path)
+    _, _, _, file_shas, _ = get_local_repository_info(None, root)
+    assert sorted(file_shas) == ["src/alias.py", "src/app.py"]
+    report = {}
+    contents = fetch_local_file_contents(None, root, ["src/app.py", "src/leak.py", "src/alias.py", "../secret.txt"], report=report)
+    assert contents == {"src/app.py": "print('hello')\n", "src/alias.py": "print('hello')\n"}
+    assert "PRIVATE KEY\n" not in contents.values()
+
+
+def test_only_explicit_paths_are_local(tmp_path, monkeypatch):
+    (tmp_path / "owner" / "repo").mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    assert not is_local_repo("owner/repo")
+    assert is_local_repo("./owner/repo")
+    assert is_local_repo(str(tmp_path / "owner" / "repo"))
+    assert is_local_repo("file://" + str(tmp_path))
+    assert is_local_repo("~/projects/repo")
+    assert not is_local_repo("")
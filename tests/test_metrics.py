@@ -0,0 +1,68 @@
+import threading
+import contextvars
+import concurrent.futures
+import pytest
+import metrics
+from llm_client import AsyncLLMClient
+from llm_providers import FakeProvider
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    metrics.reset()
+
+
+def counters(report: dict) -> dict:
+    return {(counter['name'], tuple(sorted(counter['labels'].items()))): counter['value'] for counter in report['counters']}
+
+
+def test_concurrent_runs_keep_separate_metrics():
+    barrier = threading.Barrier(2)
+    reports = {}
+
+    def run(repo: str, amount: int):
+        token = metrics.start_run(repo=repo)
+        try:
+            barrier.wait()
+            metrics.increment("github_requests", amount, kind="contents")
+            # Work handed to a pool is counted against the run when the context travels with it.
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+                executor.submit(contextvars.copy_context().run, metrics.increment, "github_requests", amount, kind="blob").result()
+            barrier.wait()
+            reports[repo] = metrics.snapshot()
+        finally:
+            metrics.end_run(token)
+
+    threads = [threading.Thread(target=run, args=("octo/a", 1)), threading.Thread(target=run, args=("octo/b", 5))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counters(reports["octo/a"]) == {("github_requests", (("kind", "contents"),)): 1, ("github_requests", (("kind", "blob"),)): 1}
+    assert counters(reports["octo/b"]) == {("github_requests", (("kind", "contents"),)): 5, ("github_requests", (("kind", "blob"),)): 5}
+    # Outside a run the snapshot covers the whole process, labelled by run.
+    process = counters(metrics.snapshot())
+    assert process[("github_requests", (("kind", "contents"), ("repo", "octo/a")))] == 1
+    assert process[("github_requests", (("kind", "contents"), ("repo", "octo/b")))] == 5
+
+
+def test_a_second_run_starts_from_zero():
+    for _ in range(2):
+        token = metrics.start_run(repo="octo/a")
+        metrics.increment("node_runs", node="generate_chunks")
+        report = metrics.snapshot()
+        metrics.end_run(token)
+        assert counters(report) == {("node_runs", (("node", "generate_chunks"),)): 1}
+
+
+def test_model_calls_on_the_client_loop_count_against_the_caller_run():
+    client = AsyncLLMClient(FakeProvider())
+    token = metrics.start_run(repo="octo/a")
+    try:
+        client.generate_sync("fake-model", "hello", 1)
+        report = metrics.snapshot()
+    finally:
+        metrics.end_run(token)
+    assert counters(report)[("llm_requests", (("model", "fake-model"),))] == 1
@@ -0,0 +1,26 @@
+from generate_chapters.tools import summary_memory
+from generate_chapters.tools.summary_memory import build_summary_memory
+
+NAMES = [f"Topic Number {index}" for index in range(1, 41)]
+SUMMARIES = [f"This chapter explains topic {index} in depth. " + "More detail here. " * 30 for index in range(1, 41)]
+
+
+def count_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def test_tight_budget_keeps_titles_of_older_chapters(monkeypatch):
+    monkeypatch.setattr(summary_memory, "count_tokens", count_tokens)
+    memory = build_summary_memory(NAMES, SUMMARIES, token_budget=300, recent_count=3)
+    assert memory.startswith("Chapters 1-37 covered: Topic Number 1; Topic Number 2;")
+    assert "Chapter 40 (Topic Number 40): This chapter explains topic 40 in depth." in memory
+    assert count_tokens(memory) <= 300
+
+
+def test_titles_are_truncated_to_fit(monkeypatch):
+    monkeypatch.setattr(summary_memory, "count_tokens", count_tokens)
+    memory = build_summary_memory(NAMES, SUMMARIES, token_budget=60, recent_count=3)
+    assert "Topic Number 1;" in memory
+    assert " more. " in memory
+    assert memory.endswith("Chapter 40 (Topic Number 40): This chapter explains topic 40 in depth.")
+    assert count_tokens(memory) <= 60
@@ -0,0 +1,42 @@
+from generate_chapters.tools.symbol_index import index_file, render_file_excerpt, extract_keywords
+
+
+def count_tokens(text: str) -> int:
+    return len(text) // 4
+
+def large_class(methods: int = 30) -> str:
+    bodies = "".join(f"    def method_{index}(self, value):\n" + "        value = value + 1\n" * 40 + "        return value\n\n"
+                     for index in range(methods))
+    return "import os\n\n\nclass Engine:\n" + bodies + "    def render_payment(self, payment):\n        return payment.total\n"
+
+
+def test_single_large_class_keeps_its_most_relevant_method_bodies():
+    source = large_class()
+    excerpt = render_file_excerpt(source, index_file("engine.py", source), extract_keywords("Payment rendering"), 1500, count_tokens)
+    assert "class Engine:  (excerpt of lines" in excerpt
+    assert "    def render_payment(self, payment):\n        return payment.total" in excerpt
+    assert "    def method_0(self, value):\n        value = value + 1" in excerpt
+    assert "    def method_29(self, value): ..." in excerpt
+
+
+def test_excerpt_stays_within_budget():
+    source = large_class()
+    symbols = index_file("engine.py", source)
+    for budget in (20, 100, 300, 1000, 5000):
+        assert count_tokens(render_file_excerpt(source, symbols, set(), budget, count_tokens)) <= budget
+
+
+def test_outline_that_does_not_fit_is_cut_off():
+    source = "\n".join(f"def function_{index}(value):\n    return value\n" for index in range(400))
+    excerpt = render_file_excerpt(source, index_file("many.py", source), set(), 200, count_tokens)
+    assert count_tokens(excerpt) <= 200
+    assert excerpt.endswith("more entries omitted ...")
+
+
+def test_methods_of_brace_languages_are_selected():
+    source = ("public class Service {\n" + "".join(f"    public int handle{index}(int x) {{\n" + "        x += 1;\n" * 30 + "        return x;\n    }\n\n"
+                                                  for index in range(20))
+              + "    public int chargeCard(int x) {\n        return x;\n    }\n}\n")
+    excerpt = render_file_excerpt(source, index_file("Service.java", source), extract_keywords("card charging"), 300, count_tokens)
+    assert "    public int chargeCard(int x) {\n        return x;\n    }" in excerpt
+    assert count_tokens(excerpt) <= 300